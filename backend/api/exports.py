@@ -0,0 +1,363 @@
+"""Экспорт и импорт коллекции пользователя zip-архивом.
+
+Состав архива:
+
+    manifest.json          версия формата, автор, время выгрузки
+    recipes.ndjson         рецепты пользователя с тегами и ингредиентами
+    favorites.ndjson       избранное
+    shopping_cart.ndjson   список покупок с порциями
+    images/<id><ext>       картинки рецептов
+
+Архив собирается генератором: zipfile пишет в буфер, буфер отдаётся
+кусками после каждой записи, рецепты читаются из базы пачками, картинки —
+блоками, так что память не растёт вместе с коллекцией. Импорт читает
+NDJSON построчно и сохраняет пачками через bulk_create.
+
+Чужие рецепты в избранном и списке покупок ссылаются на автора и
+название: id на другом сервере другие.
+"""
+import json
+import os
+import zipfile
+from itertools import islice
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from foodgram import versions
+from recipes.changes import record
+from recipes.media import discard, retain
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeChange,
+                            RecipeIngredient, ShopingList, Tag)
+from recipes.totals import update_recipe_totals
+
+FORMAT_VERSION = 1
+BATCH_SIZE = 500
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+RECIPES_FILE = 'recipes.ndjson'
+LINK_FILES = {
+    Favorite: 'favorites.ndjson',
+    ShopingList: 'shopping_cart.ndjson',
+}
+
+
+class StreamBuffer:
+    """Файлоподобный объект без seek: zipfile пишет, генератор забирает."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def dumps(record):
+    return json.dumps(
+        record, ensure_ascii=False, cls=DjangoJSONEncoder
+    ).encode() + b'\n'
+
+
+def image_path(recipe_id, name):
+    return f'images/{recipe_id}{os.path.splitext(name)[1]}'
+
+
+def recipe_record(recipe):
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'servings': recipe.servings,
+        'pub_date': recipe.pub_date,
+        'image': image_path(recipe.id, recipe.image.name)
+        if recipe.image else None,
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.recipe_ingredients.all()
+        ],
+    }
+
+
+def link_records(model, user):
+    fields = ['recipe_id', 'recipe__author__username', 'recipe__name']
+    if model is ShopingList:
+        fields.append('servings')
+    for row in model.objects.filter(user=user).values_list(
+        *fields
+    ).order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        record = {'recipe': row[0], 'author': row[1], 'name': row[2]}
+        if model is ShopingList:
+            record['servings'] = row[3]
+        yield record
+
+
+def export_archive(user):
+    """Генератор байтов zip-архива с коллекцией пользователя."""
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('manifest.json', json.dumps({
+            'version': FORMAT_VERSION,
+            'username': user.username,
+            'exported_at': timezone.now().isoformat(),
+        }))
+        yield buffer.pop()
+
+        recipes = Recipe.objects.filter(author=user).order_by(
+            'pk'
+        ).prefetch_related('tags', Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        ))
+        with archive.open(RECIPES_FILE, 'w', force_zip64=True) as file:
+            for recipe in recipes.iterator(chunk_size=BATCH_SIZE):
+                file.write(dumps(recipe_record(recipe)))
+                yield buffer.pop()
+
+        for model, name in LINK_FILES.items():
+            with archive.open(name, 'w', force_zip64=True) as file:
+                for record in link_records(model, user):
+                    file.write(dumps(record))
+                    yield buffer.pop()
+
+        images = Recipe.objects.filter(author=user).exclude(
+            image=''
+        ).exclude(image=None).order_by('pk')
+        for recipe in images.only('pk', 'image').iterator(
+            chunk_size=BATCH_SIZE
+        ):
+            try:
+                image = recipe.image.open('rb')
+            except FileNotFoundError:
+                continue
+            info = zipfile.ZipInfo(
+                image_path(recipe.pk, recipe.image.name),
+                timezone.now().timetuple()[:6]
+            )
+            with image, archive.open(info, 'w', force_zip64=True) as file:
+                for chunk in image.chunks(IMAGE_CHUNK_SIZE):
+                    file.write(chunk)
+                    yield buffer.pop()
+    yield buffer.pop()
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def read_records(archive, name):
+    """Строки NDJSON из архива: (номер строки, запись)."""
+    if name not in archive.namelist():
+        return
+    with archive.open(name) as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                raise ValidationError(
+                    {'file': f'{name}, строка {number}: неверный JSON.'}
+                )
+
+
+def get_ingredients(records):
+    """Id ингредиентов пачки по (название, единица); создаёт недостающие."""
+    keys = {
+        (item['name'], item['measurement_unit'])
+        for record in records for item in record['ingredients']
+    }
+
+    def find():
+        return {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.filter(
+                name__in={name for name, _ in keys}
+            ).values_list('pk', 'name', 'measurement_unit')
+            if (name, unit) in keys
+        }
+
+    found = find()
+    if len(found) < len(keys):
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=name, measurement_unit=unit)
+             for name, unit in keys - set(found)],
+            ignore_conflicts=True
+        )
+        versions.changed(Ingredient)
+        found = find()
+    return found
+
+
+def build_recipe(user, record, ingredients, tags, names, archive, written):
+    """Рецепт без сохранения и его связи: [(ингредиент, количество)], теги.
+
+    Имена записанных картинок добавляются в `written`.
+    """
+    recipe = Recipe(
+        author=user,
+        name=record['name'],
+        text=record['text'],
+        cooking_time=int(record['cooking_time']),
+        servings=int(record.get('servings') or 1),
+    )
+    recipe.clean_fields(exclude=('author', 'image'))
+    amounts = [
+        (ingredients[item['name'], item['measurement_unit']],
+         int(item['amount']))
+        for item in record['ingredients']
+    ]
+    if (
+        any(amount < 1 for _, amount in amounts)
+        or len(dict(amounts)) < len(amounts)
+    ):
+        raise ValueError('amount')
+    image = record.get('image')
+    if image in names:
+        recipe.image.save(
+            os.path.basename(image),
+            ContentFile(archive.read(image)),
+            save=False
+        )
+        written.append(recipe.image.name)
+    tag_ids = {tags[slug] for slug in record['tags'] if slug in tags}
+    return recipe, amounts, tag_ids
+
+
+def import_recipes(user, archive, written):
+    """Создаёт рецепты пачками; возвращает {старый id: новый id}."""
+    recipe_ids = {}
+    names = set(archive.namelist())
+    for batch in batched(read_records(archive, RECIPES_FILE), BATCH_SIZE):
+        number = batch[0][0]
+        try:
+            records = [item for _, item in batch]
+            ingredients = get_ingredients(records)
+            tags = dict(Tag.objects.filter(
+                slug__in={slug for item in records for slug in item['tags']}
+            ).values_list('slug', 'pk'))
+            built = []
+            for number, item in batch:
+                built.append(build_recipe(
+                    user, item, ingredients, tags, names, archive, written
+                ))
+        except (KeyError, TypeError, ValueError, DjangoValidationError):
+            raise ValidationError(
+                {'file': f'{RECIPES_FILE}, строка {number}: неверная запись.'}
+            )
+        recipes = Recipe.objects.bulk_create(
+            [recipe for recipe, _, _ in built]
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient, amount=amount
+            )
+            for recipe, amounts, _ in built
+            for ingredient, amount in amounts
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag)
+            for recipe, _, tag_ids in built
+            for tag in tag_ids
+        )
+        update_recipe_totals([recipe.pk for recipe in recipes])
+        record([recipe.pk for recipe in recipes], RecipeChange.CREATED)
+        retain(recipe.image.name for recipe in recipes)
+        for (_, item), recipe in zip(batch, recipes):
+            recipe_ids[item.get('id')] = recipe.pk
+    return recipe_ids
+
+
+def import_links(model, user, archive, owner, recipe_ids):
+    """Добавляет избранное или список покупок; возвращает число записей.
+
+    Рецепты автора архива (`owner`) берутся из только что загруженных,
+    остальные ищутся по автору и названию. Уже существующие записи
+    пропускаются и в число не входят.
+    """
+    existing_links = model.objects.filter(user=user)
+    before = existing_links.count()
+    for batch in batched(
+        (record for _, record in read_records(archive, LINK_FILES[model])),
+        BATCH_SIZE
+    ):
+        others = {
+            (record.get('author'), record.get('name')) for record in batch
+            if record.get('author') != owner
+        }
+        existing = {}
+        if others:
+            for pk, author, name in Recipe.objects.filter(
+                author__username__in={author for author, _ in others},
+                name__in={name for _, name in others},
+            ).values_list('pk', 'author__username', 'name').order_by('-pk'):
+                existing[author, name] = pk
+        links = []
+        for record in batch:
+            if record.get('author') == owner:
+                recipe_id = recipe_ids.get(record.get('recipe'))
+            else:
+                recipe_id = existing.get(
+                    (record.get('author'), record.get('name'))
+                )
+            if recipe_id is None:
+                continue
+            link = model(user=user, recipe_id=recipe_id)
+            if model is ShopingList:
+                link.servings = record.get('servings')
+            links.append(link)
+        model.objects.bulk_create(links, ignore_conflicts=True)
+    versions.changed(model, user.pk)
+    return existing_links.count() - before
+
+
+def import_archive(user, file):
+    """Загружает архив из `export_archive` в коллекцию пользователя."""
+    try:
+        archive = zipfile.ZipFile(file)
+    except zipfile.BadZipFile:
+        raise ValidationError({'file': 'Ожидается zip-архив.'})
+    written = []
+    try:
+        with archive, transaction.atomic():
+            try:
+                owner = json.loads(archive.read('manifest.json'))['username']
+            except (KeyError, TypeError, ValueError):
+                raise ValidationError(
+                    {'file': 'В архиве нет manifest.json.'}
+                )
+            recipe_ids = import_recipes(user, archive, written)
+            return {
+                'recipes': len(recipe_ids),
+                'favorites': import_links(
+                    Favorite, user, archive, owner, recipe_ids
+                ),
+                'shopping_cart': import_links(
+                    ShopingList, user, archive, owner, recipe_ids
+                ),
+            }
+    except Exception:
+        # Транзакция откатилась, картинки остались на диске.
+        discard(written)
+        raise
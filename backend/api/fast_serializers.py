@@ -0,0 +1,191 @@
+"""Быстрые read-only сериализаторы для нагруженных эндпоинтов.
+
+Выдают те же данные, что и сериализаторы из `serializers.py`, но без
+интроспекции ModelSerializer: словари собираются напрямую из
+предзагруженных объектов или кортежей `.values_list()`.
+"""
+from itertools import islice
+from operator import attrgetter
+
+from rest_framework.fields import DateTimeField
+
+from .membership import get_membership
+from .renderers import dumps
+
+
+class FastSerializer:
+    """Базовый класс быстрого сериализатора только для чтения.
+
+    `fields` — кортеж имён полей. Для поля берётся метод `get_<имя>`,
+    если он объявлен, иначе одноимённый атрибут объекта. Аксессоры
+    атрибутов собираются один раз при объявлении класса. Аргумент
+    `fields` конструктора ограничивает вывод частью полей.
+    """
+    fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._getters = tuple(
+            (name, None if hasattr(cls, f'get_{name}') else attrgetter(name))
+            for name in cls.fields
+        )
+
+    def __init__(self, instance=None, many=False, context=None, fields=None,
+                 **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+        self.accessors = tuple(
+            (name, getter or getattr(self, f'get_{name}'))
+            for name, getter in self._getters
+            if fields is None or name in fields
+        )
+
+    def to_representation(self, obj):
+        return {name: accessor(obj) for name, accessor in self.accessors}
+
+    @property
+    def data(self):
+        if self.many:
+            return [self.to_representation(obj) for obj in self.instance]
+        return self.to_representation(self.instance)
+
+    @classmethod
+    def from_values(cls, queryset):
+        """Список словарей прямо из кортежей `.values_list()`."""
+        return [
+            dict(zip(cls.fields, row))
+            for row in queryset.values_list(*cls.fields)
+        ]
+
+    @classmethod
+    def stream_values(cls, queryset, chunk_size):
+        """JSON-массив из `.values_list()` по частям.
+
+        Строки читаются через `.iterator(chunk_size=...)`, и в памяти
+        одновременно не больше `chunk_size` объектов.
+        """
+        rows = queryset.values_list(*cls.fields).iterator(
+            chunk_size=chunk_size
+        )
+        yield b'['
+        separator = b''
+        while True:
+            chunk = [
+                dict(zip(cls.fields, row))
+                for row in islice(rows, chunk_size)
+            ]
+            if not chunk:
+                break
+            yield separator + dumps(chunk)[1:-1]
+            separator = b','
+        yield b']'
+
+
+class ImageURLMixin:
+    """Абсолютная ссылка на картинку, как у Base64ImageField."""
+
+    def get_image(self, obj):
+        if not obj.image:
+            return None
+        request = self.context.get('request')
+        url = obj.image.url
+        return request.build_absolute_uri(url) if request else url
+
+
+class FastTagSerializer(FastSerializer):
+    fields = ('id', 'name', 'color', 'slug')
+
+
+class FastIngredientSerializer(FastSerializer):
+    fields = ('id', 'name', 'measurement_unit')
+
+
+class FastRecipeIngredientSerializer(FastSerializer):
+    """Строка ингредиента рецепта из RecipeIngredient с select_related."""
+    fields = ('id', 'name', 'measurement_unit', 'amount')
+
+    get_id = staticmethod(attrgetter('ingredient.id'))
+    get_name = staticmethod(attrgetter('ingredient.name'))
+    get_measurement_unit = staticmethod(
+        attrgetter('ingredient.measurement_unit')
+    )
+
+
+class FastUserSerializer(FastSerializer):
+    """Пользователь в формате MyUserSerializer.
+
+    Флаг подписки здесь всегда False: FastRecipeSerializer заменяет его
+    значением из `Membership` текущего пользователя.
+    """
+    fields = (
+        'email', 'id', 'username', 'first_name', 'last_name', 'is_subscribed'
+    )
+
+    def get_is_subscribed(self, obj):
+        return False
+
+
+class FastShortRecipeSerializer(ImageURLMixin, FastSerializer):
+    fields = ('id', 'name', 'image', 'cooking_time')
+
+
+class FastRecipeSerializer(ImageURLMixin, FastSerializer):
+    """Рецепт в формате RecipeSerializer.
+
+    Ожидает queryset из `RecipeViewSet.get_queryset()`: автор через
+    select_related, теги и ингредиенты через prefetch_related. Флаги
+    пользователя берутся из `Membership` (api/membership.py).
+    """
+    fields = (
+        'id', 'ingredients', 'tags', 'image', 'author', 'is_favorited',
+        'is_in_shopping_cart', 'name', 'text', 'cooking_time', 'servings',
+        'pub_date',
+    )
+    pub_date_field = DateTimeField()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tag_serializer = FastTagSerializer()
+        self.ingredient_serializer = FastRecipeIngredientSerializer()
+        self.author_serializer = FastUserSerializer()
+        self.membership = None
+        request = self.context.get('request')
+        if request is not None and any(
+            name in ('author', 'is_favorited', 'is_in_shopping_cart')
+            for name, _ in self.accessors
+        ):
+            self.membership = get_membership(request.user)
+
+    def get_ingredients(self, obj):
+        to_representation = self.ingredient_serializer.to_representation
+        return [
+            to_representation(row) for row in obj.recipe_ingredients.all()
+        ]
+
+    def get_tags(self, obj):
+        to_representation = self.tag_serializer.to_representation
+        return [to_representation(tag) for tag in obj.tags.all()]
+
+    def get_author(self, obj):
+        author = self.author_serializer.to_representation(obj.author)
+        author['is_subscribed'] = (
+            self.membership is not None
+            and self.membership.is_following(obj.author_id)
+        )
+        return author
+
+    def get_is_favorited(self, obj):
+        return (
+            self.membership is not None
+            and self.membership.is_favorited(obj.pk)
+        )
+
+    def get_is_in_shopping_cart(self, obj):
+        return (
+            self.membership is not None
+            and self.membership.is_in_cart(obj.pk)
+        )
+
+    def get_pub_date(self, obj):
+        return self.pub_date_field.to_representation(obj.pub_date)
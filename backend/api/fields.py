@@ -0,0 +1,23 @@
+"""Поля сериализаторов с отложенным импортом тяжёлых зависимостей."""
+from django.utils.functional import cached_property
+from rest_framework import serializers
+
+
+class Base64ImageField(serializers.ImageField):
+    """Картинка в base64, как `drf_extra_fields.fields.Base64ImageField`.
+
+    Сам `drf_extra_fields` (а с ним psycopg2.extras, contrib.postgres и
+    PIL) импортируется только при разборе первой картинки, а не при
+    загрузке модуля сериализаторов. Вывод совпадает с обычным ImageField.
+    """
+
+    @cached_property
+    def base64_field(self):
+        from drf_extra_fields.fields import Base64ImageField
+
+        field = Base64ImageField(*self._args, **self._kwargs)
+        field.bind(self.field_name, self.parent)
+        return field
+
+    def to_internal_value(self, data):
+        return self.base64_field.to_internal_value(data)
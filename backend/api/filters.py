@@ -1,12 +1,49 @@
 import django_filters
 from django_filters.rest_framework import FilterSet, filters
 from recipes.models import Ingredient
-from distutils.util import strtobool
 from django_filters import rest_framework
 from recipes.models import Favorite, Recipe, ShopingList, Tag, Ingredient
 from django.db.models import Q
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import BaseFilterBackend
 from django.db.models import Count
+from django.conf import settings
+
+from .membership import get_membership
+
+
+TRUE_VALUES = ('y', 'yes', 't', 'true', 'on', '1')
+FALSE_VALUES = ('n', 'no', 'f', 'false', 'off', '0')
+
+
+def parse_bool(name, value):
+    """Замена distutils.util.strtobool (модуль удалён в Python 3.12)."""
+    value = value.lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValidationError({name: 'Ожидается 0 или 1.'})
+
+
+def parse_ids(name, value, limit):
+    """'3,1,2' -> [3, 1, 2] без повторов, в порядке запроса."""
+    try:
+        ids = list(dict.fromkeys(
+            int(item) for item in value.split(',') if item.strip()
+        ))
+    except ValueError:
+        raise ValidationError({name: 'Ожидаются id через запятую.'})
+    if not ids or len(ids) > limit:
+        raise ValidationError({name: f'Нужно от 1 до {limit} id.'})
+    return ids
+
+
+def parse_number(name, value):
+    try:
+        return float(value)
+    except ValueError:
+        raise ValidationError({name: 'Ожидается число.'})
 
 
 class IngredientFilter(django_filters.FilterSet):
@@ -17,32 +54,66 @@ class IngredientFilter(django_filters.FilterSet):
         fields = ('name',)
 
 
+def membership_ids(user, kind, model):
+    """id рецептов из Membership; для больших множеств — подзапрос."""
+    ids = getattr(get_membership(user), kind)
+    if len(ids) > settings.MEMBERSHIP_IN_LIMIT:
+        return model.objects.filter(user=user).values('recipe_id')
+    return list(ids)
+
+
 class RecipeFilterBackend(BaseFilterBackend):
     def filter_queryset(self, request, queryset, view):
         is_favorited = request.query_params.get('is_favorited')
         is_in_shopping_cart = request.query_params.get('is_in_shopping_cart')
         author = request.query_params.get('author')
         tags = request.query_params.getlist('tags')
+        max_calories = request.query_params.get('max_calories')
+        max_cost = request.query_params.get('max_cost')
 
         if is_favorited is not None:
             if request.user.is_anonymous:
                 return Recipe.objects.none()
 
-            favorites = Favorite.objects.filter(user=request.user)
-            recipes = [item.recipe.id for item in favorites]
-            queryset = queryset.filter(id__in=recipes) if strtobool(is_favorited) else queryset.exclude(id__in=recipes)
+            recipes = membership_ids(request.user, 'favorites', Favorite)
+            queryset = queryset.filter(id__in=recipes) if parse_bool('is_favorited', is_favorited) else queryset.exclude(id__in=recipes)
 
         if is_in_shopping_cart is not None:
             if request.user.is_anonymous:
                 return Recipe.objects.none()
 
-            shopping_cart = ShopingList.objects.filter(user=request.user)
-            recipes = [item.recipe.id for item in shopping_cart]
-            queryset = queryset.filter(id__in=recipes) if strtobool(is_in_shopping_cart) else queryset.exclude(id__in=recipes)
+            recipes = membership_ids(request.user, 'cart', ShopingList)
+            queryset = queryset.filter(id__in=recipes) if parse_bool('is_in_shopping_cart', is_in_shopping_cart) else queryset.exclude(id__in=recipes)
 
         if author is not None:
             queryset = queryset.filter(author=author)
 
         if tags:
-            queryset = queryset.filter(tags__slug__in=tags)
-        return queryset
\ No newline at end of file
+            # Подзапрос вместо JOIN: рецепт с несколькими тегами из списка
+            # не повторяется в выдаче и не завышает count.
+            tagged = Recipe.tags.through.objects.filter(tag__slug__in=tags)
+            queryset = queryset.filter(id__in=tagged.values('recipe_id'))
+
+        if max_calories is not None:
+            queryset = queryset.filter(
+                total_calories__lte=parse_number('max_calories', max_calories)
+            )
+
+        if max_cost is not None:
+            queryset = queryset.filter(
+                total_cost__lte=parse_number('max_cost', max_cost)
+            )
+        return queryset
+
+class RecipeOrderingFilter(BaseFilterBackend):
+    """Сортировка рецептов по рейтингам: ?ordering=trending|popular"""
+    orderings = {
+        'trending': ('-trending_score', '-pub_date'),
+        'popular': ('-popularity_score', '-pub_date'),
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.orderings.get(request.query_params.get('ordering'))
+        if ordering is None:
+            return queryset
+        return queryset.order_by(*ordering)
@@ -0,0 +1,168 @@
+"""Замер: асинхронный ORM против синхронного при медленной базе.
+
+Оба варианта — одно и то же чтение страницы рецептов (число, страница,
+ингредиенты, теги) через JsonResponse: синхронное представление на
+`--sync-workers` потоках и асинхронное на `--concurrency` корутинах.
+Представления живут здесь же и подключаются своим URLconf только на
+время замера; в API асинхронных копий нет (см. README, раздел ASGI).
+"""
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import JsonResponse
+from django.test import AsyncClient, Client, override_settings
+from django.urls import include, path
+
+from recipes.models import Recipe, RecipeIngredient
+
+PAGE_SIZE = 6
+INGREDIENT_FIELDS = (
+    'recipe_id', 'ingredient_id', 'ingredient__name',
+    'ingredient__measurement_unit', 'amount',
+)
+TAG_FIELDS = ('recipe_id', 'tag_id', 'tag__name', 'tag__color', 'tag__slug')
+RECIPE_FIELDS = ('id', 'name', 'text', 'cooking_time', 'author_id', 'image')
+
+
+def querysets(ids=None):
+    recipes = Recipe.objects.order_by('-pub_date').values(*RECIPE_FIELDS)
+    if ids is None:
+        return recipes
+    return (
+        RecipeIngredient.objects.filter(
+            recipe_id__in=ids
+        ).values_list(*INGREDIENT_FIELDS),
+        Recipe.tags.through.objects.filter(
+            recipe_id__in=ids
+        ).values_list(*TAG_FIELDS),
+    )
+
+
+def page(count, recipes, ingredients, tags):
+    for recipe in recipes:
+        recipe['ingredients'] = [
+            row[1:] for row in ingredients if row[0] == recipe['id']
+        ]
+        recipe['tags'] = [row[1:] for row in tags if row[0] == recipe['id']]
+    return JsonResponse({'count': count, 'results': recipes})
+
+
+def sync_recipes(request):
+    recipes = querysets()
+    count = recipes.count()
+    rows = list(recipes[:PAGE_SIZE])
+    ingredients, tags = querysets([row['id'] for row in rows])
+    return page(count, rows, list(ingredients), list(tags))
+
+
+async def async_recipes(request):
+    recipes = querysets()
+    count = await recipes.acount()
+    rows = [row async for row in recipes[:PAGE_SIZE]]
+    ingredients, tags = querysets([row['id'] for row in rows])
+    return page(
+        count, rows,
+        [row async for row in ingredients],
+        [row async for row in tags],
+    )
+
+
+urlpatterns = [
+    path('bench/sync/recipes/', sync_recipes),
+    path('bench/async/recipes/', async_recipes),
+    path('', include('foodgram.urls')),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность синхронного и асинхронного '
+        'чтения страницы рецептов при медленной базе данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument(
+            '--sync-workers', type=int, default=4,
+            help='Число синхронных воркеров (потоков) для WSGI-варианта.'
+        )
+        parser.add_argument(
+            '--db-delay', type=float, default=0.005,
+            help='Искусственная задержка каждого SQL-запроса в секундах.'
+        )
+
+    def handle(self, *args, **options):
+        delay = options['db_delay']
+
+        def slow_execute(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        def install_delay(sender, connection, **kwargs):
+            connection.execute_wrappers.append(slow_execute)
+
+        connection_created.connect(install_delay)
+        for connection in connections.all():
+            connection.execute_wrappers.append(slow_execute)
+
+        total = options['requests']
+        with override_settings(ROOT_URLCONF=__name__, THROTTLE_BUCKETS={}):
+            rows = [
+                ('sync', self.run_sync(
+                    '/bench/sync/recipes/', total, options['sync_workers']
+                )),
+                ('async', self.run_async(
+                    '/bench/async/recipes/', total, options['concurrency']
+                )),
+            ]
+        self.stdout.write(
+            f'{total} запросов, задержка базы {delay * 1000:g} мс, '
+            f'{options["sync_workers"]} потоков / '
+            f'{options["concurrency"]} корутин'
+        )
+        for name, (elapsed, latencies) in rows:
+            latencies.sort()
+            self.stdout.write(
+                f'{name:<6} {total / elapsed:8.1f} rps  '
+                f'p50={statistics.median(latencies) * 1000:7.1f} ms  '
+                f'p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:7.1f}'
+                ' ms'
+            )
+
+    def run_sync(self, url, total, workers):
+        def fetch(_):
+            started = time.perf_counter()
+            response = Client().get(url)
+            assert response.status_code == 200, response.status_code
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            latencies = list(executor.map(fetch, range(total)))
+        return time.perf_counter() - started, latencies
+
+    def run_async(self, url, total, concurrency):
+        async def main():
+            client = AsyncClient()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def fetch():
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.get(url)
+                    assert response.status_code == 200, response.status_code
+                    return time.perf_counter() - started
+
+            started = time.perf_counter()
+            latencies = await asyncio.gather(
+                *(fetch() for _ in range(total))
+            )
+            return time.perf_counter() - started, list(latencies)
+
+        return asyncio.run(main())
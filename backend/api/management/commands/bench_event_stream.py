@@ -0,0 +1,128 @@
+import asyncio
+import gc
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from api.streams import application
+from foodgram.events import broker
+
+
+class Clients:
+    """Соединения SSE без сети: ASGI receive/send в памяти.
+
+    На соединение — один Future отключения, счётчики общие, чтобы замер
+    памяти показывал сам поток, а не обвязку.
+    """
+
+    def __init__(self, count):
+        loop = asyncio.get_running_loop()
+        self.count = count
+        self.started = 0
+        self.received = 0
+        self.all_started = loop.create_future()
+        self.all_received = loop.create_future()
+        self.disconnects = [loop.create_future() for _ in range(count)]
+
+    def receive(self, number):
+        async def receive():
+            await self.disconnects[number]
+            return {'type': 'http.disconnect'}
+        return receive
+
+    async def send(self, message):
+        if message['type'] != 'http.response.body' or not message['body']:
+            return
+        if message['body'].startswith(b'retry:'):
+            self.started += 1
+            if self.started == self.count:
+                self.all_started.set_result(None)
+        else:
+            self.received += 1
+            if self.received == self.count:
+                self.all_received.set_result(None)
+
+    def disconnect(self):
+        for future in self.disconnects:
+            future.set_result(None)
+
+
+class Command(BaseCommand):
+    help = (
+        'Открывает N соединений /api/async/events/ в одном цикле событий '
+        '(без сети, EVENTS_BACKEND=local), показывает память на '
+        'соединение и время раздачи одного события всем.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=5000)
+        parser.add_argument(
+            '--recipes', type=int, default=20,
+            help='Сколько рецептов отслеживает каждое соединение.'
+        )
+
+    def handle(self, *args, **options):
+        with override_settings(
+            EVENTS_BACKEND='local',
+            EVENTS_MAX_CONNECTIONS=options['connections'] + 1,
+        ):
+            asyncio.run(self.run(options['connections'], options['recipes']))
+
+    async def run(self, count, recipes):
+        query = ','.join(str(pk) for pk in range(1, recipes + 1)).encode()
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/api/async/events/',
+            'query_string': b'recipes=' + query,
+            'headers': [],
+        }
+        # Первое соединение прогревает импорты и кеши.
+        warmup, warmup_tasks = await self.open(scope, 1)
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        started = time.perf_counter()
+        clients, tasks = await self.open(scope, count)
+        opened = time.perf_counter() - started
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        used = sum(
+            stat.size_diff for stat in after.compare_to(before, 'filename')
+        )
+        self.stdout.write(f'Соединений: {count}, открыты за {opened:.2f} с')
+        self.stdout.write(
+            f'Память Python: {used / 1024 / 1024:.1f} МБ, '
+            f'{used / count / 1024:.2f} КБ на соединение '
+            '(без буферов сервера и сокета)'
+        )
+
+        started = time.perf_counter()
+        broker.publish([('recipe:1', 'counters', {'id': 1, 'favorites': 1})])
+        await clients.all_received
+        self.stdout.write(
+            f'Событие доставлено {count} клиентам за '
+            f'{(time.perf_counter() - started) * 1000:.1f} мс'
+        )
+
+        for group, group_tasks in ((clients, tasks), (warmup, warmup_tasks)):
+            group.disconnect()
+            await asyncio.gather(*group_tasks)
+        self.stdout.write(self.style.SUCCESS(
+            f'После отключения подписок: {broker.count}, '
+            f'каналов: {len(broker.channels)}'
+        ))
+
+    async def open(self, scope, count):
+        clients = Clients(count)
+        tasks = [
+            asyncio.ensure_future(
+                application(scope, clients.receive(number), clients.send)
+            )
+            for number in range(count)
+        ]
+        await clients.all_started
+        return clients, tasks
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+
+from foodgram import metrics
+from foodgram.middleware import database_metrics_middleware
+
+BUDGET_US = 50
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет накладные расходы сбора метрик на один запрос: '
+        'middleware с метриками и без них на пустом представлении.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100000)
+        parser.add_argument('--path', default='/api/recipes/')
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get(options['path'])
+        request.resolver_match = resolve(options['path'])
+        response = HttpResponse(b'x' * 2048)
+        total = options['requests']
+
+        timings = {}
+        for enabled in (False, True, False, True):
+            with override_settings(
+                METRICS_ENABLED=enabled, METRICS_FLUSH_SECONDS=5
+            ):
+                middleware = database_metrics_middleware(lambda r: response)
+                started = time.perf_counter()
+                for _ in range(total):
+                    middleware(request)
+                elapsed = time.perf_counter() - started
+            timings[enabled] = min(timings.get(enabled, elapsed), elapsed)
+
+        overhead = (timings[True] - timings[False]) / total * 1e6
+        self.stdout.write(
+            f'без метрик: {timings[False] / total * 1e6:.2f} мкс/запрос, '
+            f'с метриками: {timings[True] / total * 1e6:.2f} мкс/запрос'
+        )
+        self.stdout.write(
+            f'метка: {metrics.get_view_label(request)}, '
+            f'накладные расходы: {overhead:.2f} мкс'
+        )
+        if overhead < BUDGET_US:
+            self.stdout.write(self.style.SUCCESS(
+                f'Укладывается в бюджет {BUDGET_US} мкс на запрос'
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'Превышен бюджет {BUDGET_US} мкс на запрос'
+            ))
@@ -0,0 +1,93 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import MyUser
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пакетные эндпоинты рецептов с поштучными: создание '
+        'через POST /api/recipes/bulk/ и чтение через ?ids= против '
+        'отдельных запросов. Все изменения откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=50)
+        parser.add_argument('--ingredients', type=int, default=8)
+
+    def handle(self, *args, **options):
+        user = MyUser.objects.first()
+        tags = list(Tag.objects.values_list('pk', flat=True)[:3])
+        ingredients = list(Ingredient.objects.values_list(
+            'pk', flat=True
+        )[:options['ingredients']])
+        if user is None or not tags or not ingredients:
+            raise CommandError('Нужны пользователь, теги и ингредиенты.')
+        client = APIClient()
+        client.force_authenticate(user)
+        count = min(options['recipes'], 100)
+
+        def payload(prefix):
+            return [{
+                'name': f'{prefix}-{number}',
+                'text': 'Замер пакетного API.',
+                'cooking_time': 10,
+                'image': IMAGE,
+                'tags': tags,
+                'ingredients': [
+                    {'id': pk, 'amount': 10} for pk in ingredients
+                ],
+            } for number in range(count)]
+
+        with override_settings(THROTTLE_BUCKETS={}), transaction.atomic():
+            single = self.measure(lambda: [
+                client.post('/api/recipes/', item, format='json')
+                for item in payload('bench-single')
+            ])
+            bulk = self.measure(lambda: client.post(
+                '/api/recipes/bulk/', payload('bench-bulk'), format='json'
+            ))
+            self.report('Создание', count, single, bulk)
+
+            ids = list(Recipe.objects.filter(
+                name__startswith='bench-'
+            ).values_list('pk', flat=True)[:count])
+            single = self.measure(lambda: [
+                client.get(f'/api/recipes/{pk}/') for pk in ids
+            ])
+            bulk = self.measure(lambda: client.get(
+                '/api/recipes/', {
+                    'ids': ','.join(map(str, ids)),
+                    'expand': 'ingredients,text',
+                }
+            ))
+            self.report('Чтение', len(ids), single, bulk)
+            # Картинка замера после отката останется без ссылок, её
+            # удалит collect_media --rescan.
+            transaction.set_rollback(True)
+
+    def measure(self, run):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+        return elapsed, len(queries)
+
+    def report(self, title, count, single, bulk):
+        self.stdout.write(
+            f'{title} {count} рецептов: по одному {single[0]:.3f} с '
+            f'({single[1]} SQL), пакетом {bulk[0]:.3f} с ({bulk[1]} SQL)'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{title}: пакетом быстрее в {single[0] / bulk[0]:.1f} раза'
+        ))
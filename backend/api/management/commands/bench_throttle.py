@@ -0,0 +1,74 @@
+import tempfile
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api import throttling
+from api.views import IngredientViewSet
+
+BUDGET_US = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет накладные расходы ограничения частоты запросов на один '
+        'запрос: проверка корзины без синхронизации и с синхронизацией '
+        'через общий каталог.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100000)
+        parser.add_argument(
+            '--clients', type=int, default=1000,
+            help='Сколько разных IP отправляют запросы.'
+        )
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        requests = []
+        for index in range(options['clients']):
+            request = Request(factory.get(
+                '/api/ingredients/',
+                REMOTE_ADDR=f'10.0.{index // 256}.{index % 256}'
+            ))
+            request._user = AnonymousUser()
+            requests.append(request)
+        view = IngredientViewSet(action='list')
+        total = options['requests']
+
+        with tempfile.TemporaryDirectory() as directory:
+            for label, sync_dir in (
+                ('без синхронизации', ''), ('с синхронизацией', directory)
+            ):
+                throttling.store = throttling.BucketStore()
+                with override_settings(
+                    THROTTLE_DIR=sync_dir, THROTTLE_SYNC_SECONDS=0.1
+                ):
+                    rejected = 0
+                    started = time.perf_counter()
+                    for number in range(total):
+                        throttle = throttling.TokenBucketThrottle()
+                        if not throttle.allow_request(
+                            requests[number % len(requests)], view
+                        ):
+                            rejected += 1
+                    elapsed = time.perf_counter() - started
+                cost = elapsed / total * 1e6
+                self.stdout.write(
+                    f'{label}: {cost:.2f} мкс/запрос, '
+                    f'отклонено {rejected} из {total}'
+                )
+        throttling.store = throttling.BucketStore()
+
+        if cost < BUDGET_US:
+            self.stdout.write(self.style.SUCCESS(
+                f'Укладывается в бюджет {BUDGET_US} мкс на запрос'
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'Превышен бюджет {BUDGET_US} мкс на запрос'
+            ))
@@ -0,0 +1,101 @@
+import json
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def load_stacks(path):
+    stacks = Counter()
+    with open(path) as file:
+        for line in file:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            stacks[stack] += int(count)
+    return stacks
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает сохранённые профили медленных запросов: список или '
+        'сводку по одному профилю (самые частые функции и SQL).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'name', nargs='?',
+            help='Имя профиля (без расширения) для подробной сводки.'
+        )
+        parser.add_argument('--view', help='Только профили этого view.')
+        parser.add_argument(
+            '--top', type=int, default=15,
+            help='Сколько профилей или строк сводки показать.'
+        )
+
+    def handle(self, *args, **options):
+        directory = settings.PROFILER_DIR
+        if not os.path.isdir(directory):
+            raise CommandError(f'Профилей нет: {directory} не существует.')
+        if options['name']:
+            return self.show(directory, options['name'], options['top'])
+
+        profiles = []
+        for name in sorted(os.listdir(directory), reverse=True):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(directory, name)) as file:
+                meta = json.load(file)
+            if options['view'] and meta['view'] != options['view']:
+                continue
+            profiles.append((name[:-len('.json')], meta))
+        for name, meta in profiles[:options['top']]:
+            self.stdout.write(
+                f'{name}\n    {meta["method"]} {meta["path"]}  '
+                f'{meta["duration_ms"]} ms, сэмплов: {meta["samples"]}, '
+                f'SQL: {len(meta["queries"])}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Профилей: {len(profiles)} в {directory}'
+        ))
+
+    def show(self, directory, name, top):
+        path = os.path.join(directory, name)
+        try:
+            with open(f'{path}.json') as file:
+                meta = json.load(file)
+            stacks = load_stacks(f'{path}.collapsed')
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать профиль: {error}')
+
+        samples = sum(stacks.values()) or 1
+        own = Counter()
+        total = Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+
+        self.stdout.write(
+            f'{meta["method"]} {meta["path"]} ({meta["view"]}): '
+            f'{meta["duration_ms"]} ms, сэмплов: {meta["samples"]} '
+            f'каждые {meta["interval_ms"]} ms'
+        )
+        self.stdout.write('\nСобственное время:')
+        for frame, count in own.most_common(top):
+            self.stdout.write(f'{count / samples:7.1%}  {frame}')
+        self.stdout.write('\nВключая вызванные функции:')
+        for frame, count in total.most_common(top):
+            self.stdout.write(f'{count / samples:7.1%}  {frame}')
+
+        queries = meta['queries']
+        self.stdout.write(
+            f'\nSQL: {len(queries)} запросов, '
+            f'{sum(query["duration_ms"] for query in queries):.1f} ms'
+        )
+        for query in sorted(
+            queries, key=lambda query: -query['duration_ms']
+        )[:top]:
+            self.stdout.write(
+                f'{query["duration_ms"]:9.2f} ms  {query["sql"][:150]}'
+            )
@@ -0,0 +1,103 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Выполняется в отдельном процессе, чтобы замерить настоящий холодный старт.
+# Время отсчитывается от запуска интерпретатора (по времени процесса).
+FIRST_REQUEST_SCRIPT = '''
+import io, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+from wsgiref.util import setup_testing_defaults
+application = get_wsgi_application()
+handler = time.perf_counter()
+environ = {{'PATH_INFO': {path!r}, 'wsgi.errors': io.StringIO()}}
+setup_testing_defaults(environ)
+statuses = []
+body = b''.join(application(environ, lambda status, *args: statuses.append(status)))
+done = time.perf_counter()
+print(statuses[0], len(body), setup - started, handler - setup, done - handler)
+'''
+
+
+def parse_importtime(stderr):
+    """Строки `-X importtime`: (собственное время, суммарное, модуль), мкс."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, module = line[len('import time:'):].split('|')
+        rows.append((int(own), int(cumulative), module.rstrip()))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Профиль холодного старта: суммарное время импорта модулей '
+        '(как python -X importtime) и время до первого ответа.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=25,
+            help='Сколько самых дорогих модулей показать.'
+        )
+        parser.add_argument(
+            '--path', default='/api/tags/',
+            help='Адрес первого запроса.'
+        )
+        parser.add_argument(
+            '--runs', type=int, default=3,
+            help='Сколько раз замерить время до первого ответа.'
+        )
+
+    def handle(self, *args, **options):
+        script = FIRST_REQUEST_SCRIPT.format(path=options['path'])
+
+        result = self.run_python(['-X', 'importtime', '-c', script])
+        rows = parse_importtime(result.stderr)
+        total = sum(own for own, _, _ in rows)
+        self.stdout.write(
+            f'Импортировано модулей: {len(rows)}, '
+            f'суммарно {total / 1000:.1f} ms'
+        )
+        self.stdout.write(f'{"self, ms":>9} {"cumul, ms":>10}  модуль')
+        for own, cumulative, module in sorted(
+            rows, key=lambda row: -row[1]
+        )[:options['top']]:
+            self.stdout.write(
+                f'{own / 1000:9.1f} {cumulative / 1000:10.1f}  {module}'
+            )
+
+        self.stdout.write('')
+        self.stdout.write(
+            f'{"setup, ms":>10} {"wsgi, ms":>9} {"request, ms":>12}  ответ'
+        )
+        for _ in range(options['runs']):
+            status, size, setup, handler, request = self.run_python(
+                ['-c', script]
+            ).stdout.strip().splitlines()[-1].rsplit(' ', 4)
+            self.stdout.write(
+                f'{float(setup) * 1000:10.1f} {float(handler) * 1000:9.1f} '
+                f'{float(request) * 1000:12.1f}  {status}, {size} байт'
+            )
+        self.stdout.write(self.style.SUCCESS('Профиль старта готов'))
+
+    def run_python(self, arguments):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        result = subprocess.run(
+            [sys.executable, *arguments],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        return result
@@ -0,0 +1,121 @@
+"""Избранное, корзина и подписки пользователя одним объектом.
+
+Флаги `is_favorited`, `is_in_shopping_cart`, `is_subscribed` и фильтры
+списка рецептов спрашивают одно и то же — входит ли id в множество
+пользователя. `Membership` хранит три множества как отсортированные
+массивы `array('q')` (8 байт на id): проверка — двоичный поиск, а
+в кеше запись занимает столько же, сколько сами id.
+
+Множества загружаются одним запросом (UNION ALL) и кешируются под
+меткой пользователя `user:<id>` из `foodgram.versions`: любое изменение
+избранного, корзины или подписок меняет метку, и старая запись больше
+не читается. Внутри запроса объект запоминается на пользователе. Если
+в текущем запросе множества уже менялись, они читаются из базы мимо
+кеша. Размер загруженных множеств попадает в метрику
+`foodgram_membership_size_bytes`.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import IntegerField, Value
+
+from foodgram import metrics, versions
+from recipes.models import Favorite, ShopingList
+from users.models import Follow
+
+KINDS = ('favorites', 'cart', 'following')
+SOURCES = (
+    (Favorite, 'recipe_id'),
+    (ShopingList, 'recipe_id'),
+    (Follow, 'author_id'),
+)
+
+
+def contains(values, pk):
+    index = bisect_left(values, pk)
+    return index < len(values) and values[index] == pk
+
+
+class Membership:
+    """Отсортированные id избранного, корзины и авторов подписок."""
+
+    __slots__ = KINDS
+
+    def __init__(self, favorites=(), cart=(), following=()):
+        self.favorites = array('q', sorted(favorites))
+        self.cart = array('q', sorted(cart))
+        self.following = array('q', sorted(following))
+
+    def __getstate__(self):
+        return tuple(getattr(self, kind).tobytes() for kind in KINDS)
+
+    def __setstate__(self, state):
+        for kind, data in zip(KINDS, state):
+            values = array('q')
+            values.frombytes(data)
+            setattr(self, kind, values)
+
+    def is_favorited(self, pk):
+        return contains(self.favorites, int(pk))
+
+    def is_in_cart(self, pk):
+        return contains(self.cart, int(pk))
+
+    def is_following(self, pk):
+        return contains(self.following, int(pk))
+
+    @property
+    def nbytes(self):
+        """Объём данных в байтах (без заголовков объектов)."""
+        return sum(
+            getattr(self, kind).itemsize * len(getattr(self, kind))
+            for kind in KINDS
+        )
+
+    @classmethod
+    def load(cls, user_id):
+        """Все три множества пользователя одним запросом."""
+        queries = [
+            model.objects.filter(user_id=user_id).order_by().annotate(
+                kind=Value(number, output_field=IntegerField())
+            ).values_list('kind', field)
+            for number, (model, field) in enumerate(SOURCES)
+        ]
+        sets = ([], [], [])
+        for kind, pk in queries[0].union(*queries[1:], all=True):
+            sets[kind].append(pk)
+        return cls(*sets)
+
+
+def cache_key(user_id, stamp):
+    return f'membership:{user_id}:{stamp}'
+
+
+def get_membership(user):
+    """Membership пользователя; None для анонимного."""
+    if user is None or user.is_anonymous:
+        return None
+    name = f'user:{user.pk}'
+    changed = versions.pending.get()
+    if changed is not None and name in changed:
+        return Membership.load(user.pk)
+    # Запоминаем только на время запроса (набор `changed` у каждого
+    # запроса свой): объект пользователя может пережить изменение.
+    memo = getattr(user, '_membership', None)
+    if changed is not None and memo is not None and memo[0] is changed:
+        return memo[1]
+    stamp, = versions.get_versions([name])
+    key = cache_key(user.pk, stamp)
+    membership = cache.get(key)
+    metrics.record_cache('membership', membership is not None)
+    if membership is None:
+        membership = Membership.load(user.pk)
+        metrics.observe(
+            'foodgram_membership_size_bytes', (), membership.nbytes
+        )
+        cache.set(key, membership, settings.HTTP_CACHE_VERSION_TIMEOUT)
+    if changed is not None:
+        user._membership = (changed, membership)
+    return membership
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import exceptions
+from rest_framework.decorators import action
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+
+class SparseFieldsetMixin:
+    """Выборочные поля ответа через `?fields=` и `?expand=`.
+
+    `?fields=id,name` оставляет в ответе только перечисленные поля,
+    `?expand=text,ingredients` добавляет поля к набору по умолчанию.
+    Набор по умолчанию для действия задаётся в `default_fields`;
+    если действия там нет, отдаются все поля сериализатора. Работает
+    только для безопасных методов и действий из `sparse_actions`.
+    """
+    fields_param = 'fields'
+    expand_param = 'expand'
+    sparse_actions = ('list', 'retrieve')
+    default_fields = {}
+
+    def get_available_fields(self):
+        serializer_class = self.get_serializer_class()
+        meta = getattr(serializer_class, 'Meta', None)
+        return tuple(meta.fields if meta else serializer_class.fields)
+
+    def parse_fields_param(self, param, available=None):
+        """Имена полей из параметра; неизвестные имена — ошибка 400."""
+        values = self.request.query_params.get(param, '')
+        names = {name.strip() for name in values.split(',') if name.strip()}
+        if available is None:
+            available = self.get_available_fields()
+        unknown = names - set(available)
+        if unknown:
+            raise exceptions.ValidationError({
+                param: 'Неизвестные поля: ' + ', '.join(sorted(unknown))
+            })
+        return names
+
+    def is_sparse_request(self):
+        return (
+            self.action in self.sparse_actions
+            and self.request.method in SAFE_METHODS
+        )
+
+    def get_requested_fields(self):
+        """Поля ответа в порядке сериализатора; None — все поля."""
+        if not self.is_sparse_request():
+            return None
+        available = self.get_available_fields()
+        requested = self.parse_fields_param(self.fields_param, available)
+        if not requested:
+            requested = set(self.default_fields.get(self.action, available))
+            requested |= self.parse_fields_param(self.expand_param, available)
+        return tuple(name for name in available if name in requested)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.is_sparse_request():
+            kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+
+class LimitedListMixin:
+    """Список без пагинации с мягким лимитом и потоковой выгрузкой.
+
+    `list` отдаёт не больше `list_limit` объектов (имя настройки в
+    `list_limit_setting`). Если объектов больше, в ответе есть заголовки
+    `X-Truncated: true` и `Link` на `dump/` с теми же параметрами —
+    явную выгрузку всех объектов. `dump/` отдаёт JSON-массив потоком,
+    читая таблицу частями по DUMP_CHUNK_SIZE строк. `fast_serializer` —
+    FastSerializer, которым собираются строки.
+    """
+    list_limit_setting = None
+    fast_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        limit = getattr(settings, self.list_limit_setting)
+        queryset = self.filter_queryset(self.get_queryset())
+        data = self.fast_serializer.from_values(queryset[:limit + 1])
+        if len(data) <= limit:
+            return Response(data)
+        response = Response(data[:limit])
+        url = self.reverse_action(self.dump.url_name)
+        if request.GET:
+            url = f'{url}?{request.GET.urlencode()}'
+        response['X-Truncated'] = 'true'
+        response['Link'] = f'<{url}>; rel="alternate"'
+        return response
+
+    @action(methods=['GET'], detail=False, url_path='dump', url_name='dump')
+    def dump(self, request):
+        """Все объекты потоком JSON-массива"""
+        queryset = self.filter_queryset(self.get_queryset())
+        return StreamingHttpResponse(
+            self.fast_serializer.stream_values(
+                queryset, settings.DUMP_CHUNK_SIZE
+            ),
+            content_type='application/json'
+        )
@@ -0,0 +1,47 @@
+"""JSON-рендерер с быстрым бэкендом.
+
+Если установлен orjson, ответы кодируются им; иначе используется
+стандартный JSONRenderer DRF. Вывод совпадает побайтно с JSONRenderer
+при настройках по умолчанию (компактный JSON, UTF-8 без экранирования).
+"""
+import json
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def dumps(data):
+    """Компактный JSON в UTF-8 — как FastJSONRenderer, но без DRF."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(
+        data, ensure_ascii=False, separators=(',', ':')
+    ).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer, который по возможности кодирует данные через orjson."""
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder.default)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как и JSONRenderer, экранируем разделители строк для JavaScript.
+        return ret.replace(
+            b'\xe2\x80\xa8', b'\\u2028'
+        ).replace(b'\xe2\x80\xa9', b'\\u2029')
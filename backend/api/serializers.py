@@ -1,17 +1,24 @@
 import re
 
+from django.conf import settings
 from django.core.validators import MinValueValidator
 from django.shortcuts import render, get_object_or_404
 from django.core.files.base import ContentFile
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from users.models import MyUser, Follow
-from recipes.models import Recipe, Tag, Ingredient, ShopingList, Recipe, RecipeIngredient, Favorite
-from rest_framework import serializers
+from recipes.changes import record
+from recipes.media import retain
+from recipes.models import Recipe, Tag, Ingredient, ShopingList, Recipe, RecipeIngredient, Favorite, RecipeChange
+from recipes.totals import update_recipe_totals
+from rest_framework import exceptions, serializers
 
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
+from django.db import transaction
 from .validators import (follow_unique_validator, color_validator, 
                         shopping_cart_validator, favorite_validator)
-from drf_extra_fields.fields import Base64ImageField
+from .fields import Base64ImageField
+from .fast_serializers import FastShortRecipeSerializer
+from .membership import get_membership
 
 
 
@@ -30,7 +37,17 @@ class MyUserCreateSerializer(UserCreateSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
 
-class MyUserSerializer(UserSerializer):
+class SparseFieldsMixin:
+    """Позволяет ограничить вывод сериализатора аргументом `fields`."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class MyUserSerializer(SparseFieldsMixin, UserSerializer):
     """Сериализатор модели User"""
     is_subscribed = serializers.SerializerMethodField(
         method_name='get_is_subscribed'
@@ -49,15 +66,13 @@ class MyUserSerializer(UserSerializer):
 
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user, author=obj).exists()
+        membership = get_membership(self.context['request'].user)
+        return membership is not None and membership.is_following(obj.pk)
 
  
 
 
-class UserFollowSerializer(UserSerializer):
+class UserFollowSerializer(SparseFieldsMixin, UserSerializer):
     """Сериализатор вывода авторов на которых только что подписался пользователь.  
     В выдачу добавляются рецепты."""
     recipes = serializers.SerializerMethodField(method_name='get_recipes')
@@ -80,13 +95,24 @@ class UserFollowSerializer(UserSerializer):
 
 
     def get_srs(self):
-        return ShortRecipeSerializer
+        return FastShortRecipeSerializer
+
+    def get_recipes_limit(self):
+        """`recipes_limit` из запроса, не больше SUBSCRIPTION_RECIPES_MAX.
+
+        Без параметра — SUBSCRIPTION_RECIPES_LIMIT; все рецепты автора
+        отдаёт /api/recipes/?author=<id> с пагинацией.
+        """
+        try:
+            limit = int(self.context['request'].GET['recipes_limit'])
+        except (KeyError, ValueError):
+            return settings.SUBSCRIPTION_RECIPES_LIMIT
+        return min(max(limit, 0), settings.SUBSCRIPTION_RECIPES_MAX)
 
     def get_recipes(self, obj):
-        author_recipes = Recipe.objects.filter(author=obj)
-        if 'recipes_limit' in self.context.get('request').GET:
-            recipes_limit = self.context.get('request').GET['recipes_limit']
-            author_recipes = author_recipes[:int(recipes_limit)]
+        author_recipes = Recipe.objects.filter(
+            author=obj
+        )[:self.get_recipes_limit()]
         if author_recipes:
             serializer = self.get_srs()(
                 author_recipes,
@@ -98,6 +124,8 @@ class UserFollowSerializer(UserSerializer):
 
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj).count()
         
 
@@ -175,6 +203,58 @@ class CreateUpdateRecipeIngredientsSerializer(serializers.ModelSerializer):
 
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Пакетное создание рецептов.
+
+    Существование ингредиентов всех рецептов проверяется одним запросом,
+    рецепты, их ингредиенты и теги вставляются тремя bulk_create в одной
+    транзакции. Ошибки возвращаются списком по позициям запроса.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            ids = {
+                item.get('id') for recipe in data if isinstance(recipe, dict)
+                for item in recipe.get('ingredients') or ()
+                if isinstance(item, dict)
+            }
+            self.context['ingredient_ids'] = set(
+                Ingredient.objects.filter(
+                    pk__in=[pk for pk in ids if isinstance(pk, int)]
+                ).values_list('pk', flat=True)
+            )
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        author = self.context['request'].user
+        with transaction.atomic():
+            recipes = Recipe.objects.bulk_create(
+                Recipe(author=author, **{
+                    key: value for key, value in item.items()
+                    if key not in ('tags', 'ingredients')
+                })
+                for item in validated_data
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient_id=ingredient['id'],
+                    amount=ingredient['amount']
+                )
+                for recipe, item in zip(recipes, validated_data)
+                for ingredient in item['ingredients']
+            )
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe=recipe, tag=tag)
+                for recipe, item in zip(recipes, validated_data)
+                for tag in item['tags']
+            )
+            update_recipe_totals([recipe.pk for recipe in recipes])
+            record([recipe.pk for recipe in recipes], RecipeChange.CREATED)
+            retain(recipe.image.name for recipe in recipes)
+        return recipes
+
+
 class GetRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для рецептов для GET-рецептов."""
     tags = serializers.PrimaryKeyRelatedField(
@@ -195,7 +275,14 @@ class GetRecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date',)
+        exclude = (
+            'pub_date',
+            'trending_score',
+            'popularity_score',
+            'total_calories',
+            'total_cost',
+            )
+        list_serializer_class = RecipeListSerializer
 
     def validate_tags(self, value):
         if not value:
@@ -215,8 +302,16 @@ class GetRecipeSerializer(serializers.ModelSerializer):
                 raise exceptions.ValidationError(
                     'У рецепта не может быть два одинаковых ингредиента.'
                 )
+        known = self.context.get('ingredient_ids')
+        if known is not None:
+            missing = sorted(set(ingredients) - known)
+            if missing:
+                raise exceptions.ValidationError(
+                    f'Нет ингредиентов с id: {missing}.'
+                )
         return value
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
@@ -231,8 +326,10 @@ class GetRecipeSerializer(serializers.ModelSerializer):
                 ingredient=ingredient,
                 amount=amount
             )
+        update_recipe_totals([recipe.pk])
         return recipe      
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags', None)
         if tags is not None:
@@ -248,6 +345,7 @@ class GetRecipeSerializer(serializers.ModelSerializer):
                     ingredient=ingredient,
                     defaults={'amount': amount}
                 )
+            update_recipe_totals([instance.pk])
         return super().update(instance, validated_data)
 
 
@@ -276,7 +374,20 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        fields = (
+            'id',
+            'ingredients',
+            'tags',
+            'image',
+            'author',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'name',
+            'text',
+            'cooking_time',
+            'servings',
+            'pub_date'
+            )
 
     def validate_cooking_time(self, value):
         if not isinstance(value, int):
@@ -295,17 +406,13 @@ class RecipeSerializer(serializers.ModelSerializer):
         return serializer.data
 
     def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False    
-        return Favorite.objects.filter(user=user, recipe=obj).exists()
+        membership = get_membership(self.context['request'].user)
+        return membership is not None and membership.is_favorited(obj.pk)
 
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return ShopingList.objects.filter(user=user, recipe=obj).exists()    
+        membership = get_membership(self.context['request'].user)
+        return membership is not None and membership.is_in_cart(obj.pk)
 
   
 
@@ -318,4 +425,27 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
             'name', 
             'image', 
             'cooking_time'
-            )
\ No newline at end of file
+            )
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных операций."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+
+class RecipeForkSerializer(serializers.Serializer):
+    """Необязательное новое название копии рецепта."""
+    name = serializers.CharField(max_length=200, required=False)
+
+
+class CartServingsSerializer(serializers.Serializer):
+    """Количество порций рецепта в списке покупок."""
+    servings = serializers.IntegerField(
+        min_value=1,
+        max_value=1000,
+        allow_null=True
+    )
@@ -0,0 +1,148 @@
+"""Одностатементные операции для избранного, корзины и подписок.
+
+Вставка выполняется как `INSERT ... SELECT ... ON CONFLICT DO NOTHING`:
+повторный запрос или двойной клик не приводят к IntegrityError, а
+несуществующие объекты просто пропускаются. Удаление — один DELETE.
+Обе функции возвращают число затронутых строк.
+
+Копия рецепта (`fork_recipe`) тоже собирается без построчной работы:
+строки ингредиентов и тегов копируются `INSERT ... SELECT` внутри базы,
+а картинка не перекодируется и не копируется — копия ссылается на тот
+же файл.
+"""
+from django.db import connections, router, transaction
+
+from foodgram import versions
+from recipes.events import publish_counters
+from recipes.models import Recipe, RecipeIngredient
+
+
+def add_links(model, owner_field, target_field, owner, target_ids):
+    """Создаёт связи `owner` с объектами `target_ids` одним запросом."""
+    target_ids = list(target_ids)
+    if not target_ids:
+        return 0
+    opts = model._meta
+    owner_field = opts.get_field(owner_field)
+    target_field = opts.get_field(target_field)
+    target_opts = target_field.related_model._meta
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+
+    instance = model(**{owner_field.name: owner})
+    columns = [owner_field.column, target_field.column]
+    select = ['%s', quote(target_opts.pk.column)]
+    params = [owner_field.get_db_prep_save(owner.pk, connection)]
+    for field in opts.concrete_fields:
+        if field.primary_key or field in (owner_field, target_field):
+            continue
+        columns.append(field.column)
+        select.append('%s')
+        params.append(field.get_db_prep_save(
+            field.pre_save(instance, add=True), connection
+        ))
+    params.extend(target_ids)
+
+    sql = (
+        'INSERT INTO {table} ({columns}) '
+        'SELECT {select} FROM {target_table} '
+        'WHERE {target_pk} IN ({ids}) '
+        'ON CONFLICT DO NOTHING'
+    ).format(
+        table=quote(opts.db_table),
+        columns=', '.join(quote(column) for column in columns),
+        select=', '.join(select),
+        target_table=quote(target_opts.db_table),
+        target_pk=quote(target_opts.pk.column),
+        ids=', '.join(['%s'] * len(target_ids)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        added = cursor.rowcount
+    if added:
+        versions.changed(model, owner.pk)
+        publish_counters(model, target_ids)
+    return added
+
+
+def remove_links(model, owner_field, target_field, owner, target_ids):
+    """Удаляет связи `owner` с объектами `target_ids` одним запросом.
+
+    DELETE пишется напрямую: у модели есть обработчик post_delete
+    (`foodgram.versions`), и QuerySet.delete() сначала выбрал бы строки,
+    чтобы отправить сигнал по каждой.
+    """
+    target_ids = list(target_ids)
+    if not target_ids:
+        return 0
+    opts = model._meta
+    owner_field = opts.get_field(owner_field)
+    target_field = opts.get_field(target_field)
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    sql = (
+        'DELETE FROM {table} '
+        'WHERE {owner} = %s AND {target} IN ({ids})'
+    ).format(
+        table=quote(opts.db_table),
+        owner=quote(owner_field.column),
+        target=quote(target_field.column),
+        ids=', '.join(['%s'] * len(target_ids)),
+    )
+    params = [owner_field.get_db_prep_value(owner.pk, connection)]
+    params.extend(
+        target_field.get_db_prep_value(pk, connection) for pk in target_ids
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        deleted = cursor.rowcount
+    if deleted:
+        versions.changed(model, owner.pk)
+        publish_counters(model, target_ids)
+    return deleted
+
+
+def copy_rows(model, field, source_id, target_id):
+    """Копирует строки `model` с `field=source_id` для `target_id`."""
+    opts = model._meta
+    field = opts.get_field(field)
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(item.column) for item in opts.concrete_fields
+        if not item.primary_key and item != field
+    )
+    sql = (
+        'INSERT INTO {table} ({field}, {columns}) '
+        'SELECT %s, {columns} FROM {table} WHERE {field} = %s'
+    ).format(
+        table=quote(opts.db_table),
+        field=quote(field.column),
+        columns=columns,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [target_id, source_id])
+        return cursor.rowcount
+
+
+@transaction.atomic
+def fork_recipe(source, author, name=None):
+    """Копия рецепта `source` от имени `author`.
+
+    Число запросов не зависит от числа ингредиентов: INSERT рецепта и
+    по одному INSERT ... SELECT для ингредиентов и тегов. Калорийность
+    и стоимость переносятся как есть, рейтинги начинаются с нуля.
+    """
+    recipe = Recipe.objects.create(
+        author=author,
+        name=name or source.name,
+        text=source.text,
+        image=source.image.name or None,
+        cooking_time=source.cooking_time,
+        servings=source.servings,
+        total_calories=source.total_calories,
+        total_cost=source.total_cost,
+    )
+    copy_rows(RecipeIngredient, 'recipe', source.pk, recipe.pk)
+    copy_rows(Recipe.tags.through, 'recipe', source.pk, recipe.pk)
+    return recipe
@@ -0,0 +1,177 @@
+"""Поток Server-Sent Events `/api/async/events/`.
+
+Отдельное ASGI-приложение, а не представление Django: Django 4.1 отдаёт
+потоковые ответы под ASGI через синхронный итератор, то есть держит по
+потоку на соединение. Здесь соединение — одна корутина и одна задача,
+ожидающая отключения клиента, в общем цикле событий; тысячи
+простаивающих клиентов стоят несколько килобайт памяти каждый
+(`manage.py bench_event_stream`).
+
+Параметры запроса:
+
+* `recipes=1,2,3` — счётчики избранного и корзины этих рецептов;
+* токен в `Authorization: Token <ключ>` или `?ticket=` — плюс новые
+  рецепты авторов, на которых подписан пользователь. Подписки читаются
+  при подключении.
+
+EventSource в браузере не умеет передавать заголовки, а токен в строке
+запроса оседает в журналах доступа. Поэтому браузер получает билет
+(`POST /api/users/me/events_ticket/`): подписанный id пользователя,
+действительный EVENTS_TICKET_SECONDS секунд. Билет проверяется только
+при подключении; после его истечения переподключиться можно лишь с
+новым билетом.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db import close_old_connections
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+
+from foodgram.events import broker
+from users.models import Follow, MyUser
+
+from .filters import parse_ids
+
+HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+async def send_json(send, status, data):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps(data, ensure_ascii=False).encode(),
+    })
+
+
+TICKET_SALT = 'foodgram.events.ticket'
+
+
+def make_ticket(user):
+    """Билет для подключения к потоку без токена в строке запроса."""
+    return signing.dumps(user.pk, salt=TICKET_SALT)
+
+
+def read_ticket(ticket):
+    """id пользователя из билета; None — билет неверен или истёк."""
+    try:
+        return signing.loads(
+            ticket, salt=TICKET_SALT, max_age=settings.EVENTS_TICKET_SECONDS
+        )
+    except signing.BadSignature:
+        return None
+
+
+def get_credentials(scope, query):
+    """(токен, билет) запроса; заголовок важнее строки запроса."""
+    for name, value in scope['headers']:
+        if name == b'authorization':
+            keyword, _, key = value.decode('latin-1').partition(' ')
+            return (key if keyword == 'Token' else None), None
+    return None, query.get('ticket', [None])[0]
+
+
+@sync_to_async
+def get_author_ids(key, ticket):
+    """Авторы, на которых подписан пользователь; None — доступ неверен."""
+    close_old_connections()
+    try:
+        if key:
+            user_id = Token.objects.filter(
+                key=key, user__is_active=True
+            ).values_list('user_id', flat=True).first()
+        else:
+            user_id = read_ticket(ticket)
+            if user_id is not None and not MyUser.objects.filter(
+                pk=user_id, is_active=True
+            ).exists():
+                user_id = None
+        if user_id is None:
+            return None
+        return list(Follow.objects.filter(
+            user_id=user_id
+        ).values_list('author_id', flat=True))
+    finally:
+        close_old_connections()
+
+
+async def wait_disconnect(receive, subscription):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    subscription.close()
+
+
+async def application(scope, receive, send):
+    if scope['method'] != 'GET':
+        await send_json(send, 405, {'detail': 'Метод не разрешен.'})
+        return
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    channels = []
+    if 'recipes' in query:
+        try:
+            recipe_ids = parse_ids(
+                'recipes', query['recipes'][0], settings.EVENTS_MAX_RECIPES
+            )
+        except ValidationError as error:
+            await send_json(send, 400, error.detail)
+            return
+        channels.extend(f'recipe:{pk}' for pk in recipe_ids)
+    key, ticket = get_credentials(scope, query)
+    if key or ticket:
+        author_ids = await get_author_ids(key, ticket)
+        if author_ids is None:
+            await send_json(
+                send, 401, {'detail': 'Недопустимый токен или билет.'}
+            )
+            return
+        channels.extend(f'author:{pk}' for pk in author_ids)
+    if not channels:
+        await send_json(
+            send, 400, {'detail': 'Нужны recipes, токен или билет.'}
+        )
+        return
+    if broker.count >= settings.EVENTS_MAX_CONNECTIONS:
+        await send_json(send, 503, {'detail': 'Слишком много подключений.'})
+        return
+
+    subscription = broker.subscribe(channels)
+    disconnect = asyncio.ensure_future(wait_disconnect(receive, subscription))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': HEADERS,
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': f'retry: {settings.EVENTS_RETRY_MS}\n\n'.encode(),
+            'more_body': True,
+        })
+        while True:
+            await subscription.wait(settings.EVENTS_HEARTBEAT_SECONDS)
+            if subscription.closed:
+                break
+            # Комментарий-пинг не даёт прокси закрыть тихое соединение.
+            body = subscription.drain() or b': ping\n\n'
+            await send({
+                'type': 'http.response.body',
+                'body': body,
+                'more_body': True,
+            })
+        if not disconnect.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        broker.unsubscribe(subscription)
+        disconnect.cancel()
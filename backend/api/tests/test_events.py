@@ -0,0 +1,79 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.streams import make_ticket, read_ticket
+from foodgram import events
+from foodgram.events import broker
+from recipes.events import publish_counters
+from recipes.models import Favorite, Recipe
+from users.models import MyUser
+
+
+@override_settings(EVENTS_BACKEND='local')
+class PublishCountersTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MyUser.objects.create_user(
+            username='reader', email='reader@example.com', password='x'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание', cooking_time=5
+        )
+
+    def test_no_listeners_no_queries(self):
+        with mock.patch.object(events, 'publish') as publish:
+            with self.assertNumQueries(0):
+                publish_counters(Favorite, [str(self.recipe.pk)])
+        publish.assert_not_called()
+
+    def test_listened_recipe_is_counted(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        channel = f'recipe:{self.recipe.pk}'
+        with mock.patch.dict(broker.channels, {channel: set()}), \
+                mock.patch.object(events, 'publish') as publish:
+            publish_counters(Favorite, [str(self.recipe.pk), 0])
+        self.assertEqual(list(publish.call_args.args[0]), [(
+            channel, 'counters', {'id': self.recipe.pk, 'favorites': 1}
+        )])
+
+    @override_settings(EVENTS_BACKEND='postgres')
+    def test_listeners_are_read_from_cache(self):
+        cache.clear()
+        cache.set(events.listeners_key('recipe:1'), 1)
+        self.assertEqual(
+            events.listened(['recipe:1', 'recipe:2']), {'recipe:1'}
+        )
+
+
+@override_settings(EVENTS_TICKET_SECONDS=60)
+class EventsTicketTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MyUser.objects.create_user(
+            username='reader', email='reader@example.com', password='x'
+        )
+
+    def test_ticket_identifies_user(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/users/me/events_ticket/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['expires_in'], 60)
+        self.assertEqual(read_ticket(response.json()['ticket']), self.user.pk)
+
+    def test_anonymous_gets_no_ticket(self):
+        response = APIClient().post('/api/users/me/events_ticket/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_expired_or_forged_ticket(self):
+        ticket = make_ticket(self.user)
+        with mock.patch('django.core.signing.time.time', return_value=0):
+            old = make_ticket(self.user)
+        self.assertIsNone(read_ticket(old))
+        self.assertIsNone(read_ticket(ticket + 'x'))
+        self.assertIsNone(read_ticket('token'))
@@ -0,0 +1,124 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Recipe, Tag
+from users.models import MyUser
+
+
+def make_archive(owner, recipes, favorites=(), images=None):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('manifest.json', json.dumps({'username': owner}))
+        archive.writestr('recipes.ndjson', ''.join(
+            json.dumps(record) + '\n' for record in recipes
+        ))
+        archive.writestr('favorites.ndjson', ''.join(
+            json.dumps(record) + '\n' for record in favorites
+        ))
+        for name, content in (images or {}).items():
+            archive.writestr(name, content)
+    buffer.seek(0)
+    buffer.name = 'collection.zip'
+    return buffer
+
+
+def recipe_record(pk, **extra):
+    return {
+        'id': pk,
+        'name': f'Рецепт {pk}',
+        'text': 'Описание',
+        'cooking_time': 5,
+        'tags': ['lunch'],
+        'ingredients': [
+            {'name': 'мука', 'measurement_unit': 'г', 'amount': 100},
+        ],
+        **extra,
+    }
+
+
+class ImportArchiveTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MyUser.objects.create_user(
+            username='reader', email='reader@example.com', password='x'
+        )
+        cls.author = MyUser.objects.create_user(
+            username='author', email='author@example.com', password='x'
+        )
+        Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        cls.other = Recipe.objects.create(
+            author=cls.author, name='Чужой', text='Описание', cooking_time=5
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, archive):
+        return self.client.post(
+            '/api/users/me/import/', {'file': archive}, format='multipart'
+        )
+
+    def stored_files(self):
+        return [
+            name for _, _, files in os.walk(self.media) for name in files
+        ]
+
+    def test_counts_only_inserted_links(self):
+        Favorite.objects.create(user=self.user, recipe=self.other)
+        favorites = [
+            {'recipe': 1, 'author': 'owner', 'name': 'Рецепт 1'},
+            {'recipe': 2, 'author': 'owner', 'name': 'Рецепт 2'},
+            {'recipe': 2, 'author': 'owner', 'name': 'Рецепт 2'},
+            {'recipe': self.other.pk, 'author': 'author', 'name': 'Чужой'},
+        ]
+        response = self.post(make_archive(
+            'owner', [recipe_record(1), recipe_record(2)], favorites
+        ))
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['recipes'], 2)
+        self.assertEqual(response.json()['favorites'], 2)
+        self.assertEqual(Favorite.objects.filter(user=self.user).count(), 3)
+
+    def test_failed_import_removes_written_images(self):
+        records = [
+            recipe_record(1, image='images/1.png'),
+            recipe_record(2, cooking_time='долго'),
+        ]
+        response = self.post(make_archive(
+            'owner', records, images={'images/1.png': b'png'}
+        ))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipe.objects.filter(author=self.user).exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_failed_import_keeps_shared_images(self):
+        archive = make_archive(
+            'owner', [recipe_record(1, image='images/1.png')],
+            images={'images/1.png': b'png'}
+        )
+        self.assertEqual(self.post(archive).status_code, 201)
+        records = [
+            recipe_record(1, image='images/1.png'),
+            recipe_record(2, cooking_time='долго'),
+        ]
+        response = self.post(make_archive(
+            'owner', records, images={'images/1.png': b'png'}
+        ))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.stored_files()), 1)
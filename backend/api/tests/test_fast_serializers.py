@@ -0,0 +1,162 @@
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api import renderers
+from api.fast_serializers import (FastIngredientSerializer,
+                                  FastRecipeSerializer,
+                                  FastShortRecipeSerializer,
+                                  FastTagSerializer)
+from api.serializers import (IngredientSerializer, RecipeSerializer,
+                             ShortRecipeSerializer, TagSerializer)
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShopingList, Tag)
+from users.models import Follow, MyUser
+
+
+class FastSerializerParityTest(TestCase):
+    """Быстрые сериализаторы отдают то же, что и сериализаторы DRF."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = MyUser.objects.create_user(
+            username='reader', email='reader@example.com', password='x',
+            first_name='Читатель', last_name='Первый'
+        )
+        cls.author = MyUser.objects.create_user(
+            username='author', email='author@example.com', password='x',
+            first_name='Автор', last_name='Второй'
+        )
+        breakfast = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        lunch = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        ingredients = [
+            Ingredient.objects.create(name=f'мука {i}', measurement_unit='г')
+            for i in range(3)
+        ]
+        cls.recipes = []
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=cls.author if number else cls.reader,
+                name=f'Рецепт {number}',
+                # U+2028 рендереры экранируют отдельно от остального JSON.
+                text='Описание\u2028«в две строки»',
+                cooking_time=number + 5,
+                servings=number + 1,
+                image=f'recipes/{number}.png' if number < 2 else None,
+            )
+            recipe.tags.set([breakfast, lunch][:number + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1
+                )
+                for index, ingredient in enumerate(ingredients[:number + 1])
+            )
+            cls.recipes.append(recipe)
+        Favorite.objects.create(user=cls.reader, recipe=cls.recipes[1])
+        ShopingList.objects.create(user=cls.reader, recipe=cls.recipes[2])
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        # Membership кешируется по меткам версий, а метки меняются после
+        # коммита, которого внутри TestCase нет.
+        cache.clear()
+
+    def make_request(self, user):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        return request
+
+    def read_queryset(self):
+        from api.views import RecipeViewSet
+
+        return RecipeViewSet().get_read_queryset(
+            FastRecipeSerializer.fields
+        ).order_by('id')
+
+    def assert_same_bytes(self, fast_data, drf_data):
+        """JSON быстрого пути побайтно равен JSON сериализатора DRF.
+
+        Проверяются оба пути FastJSONRenderer: orjson и запасной
+        стандартный json.
+        """
+        expected = JSONRenderer().render(drf_data)
+        backends = {'json': None}
+        if renderers.orjson is not None:
+            backends['orjson'] = renderers.orjson
+        for name, backend in backends.items():
+            with self.subTest(encoder=name), \
+                    mock.patch.object(renderers, 'orjson', backend):
+                self.assertEqual(
+                    renderers.FastJSONRenderer().render(fast_data), expected
+                )
+
+    def assert_same(self, fast_class, drf_class, objects, user):
+        context = {'request': self.make_request(user)}
+        self.assert_same_bytes(
+            fast_class(objects, many=True, context=context).data,
+            drf_class(objects, many=True, context=context).data,
+        )
+
+    def test_orjson_installed(self):
+        # orjson есть в requirements.txt; без него путь orjson не проверен.
+        self.assertIsNotNone(renderers.orjson)
+
+    def test_recipe_anonymous(self):
+        self.assert_same(
+            FastRecipeSerializer, RecipeSerializer,
+            list(self.read_queryset()), AnonymousUser()
+        )
+
+    def test_recipe_authenticated(self):
+        recipes = list(self.read_queryset())
+        self.assert_same(
+            FastRecipeSerializer, RecipeSerializer, recipes, self.reader
+        )
+        data = FastRecipeSerializer(
+            recipes, many=True,
+            context={'request': self.make_request(self.reader)}
+        ).data
+        self.assertEqual(
+            [(item['is_favorited'], item['is_in_shopping_cart'])
+             for item in data],
+            [(False, False), (True, False), (False, True)]
+        )
+        self.assertEqual(
+            [item['author']['is_subscribed'] for item in data],
+            [False, True, True]
+        )
+
+    def test_short_recipe(self):
+        recipes = list(Recipe.objects.order_by('id'))
+        for user in (AnonymousUser(), self.reader):
+            self.assert_same(
+                FastShortRecipeSerializer, ShortRecipeSerializer,
+                recipes, user
+            )
+
+    def test_tag(self):
+        self.assert_same(
+            FastTagSerializer, TagSerializer,
+            list(Tag.objects.all()), AnonymousUser()
+        )
+        self.assert_same_bytes(
+            FastTagSerializer.from_values(Tag.objects.all()),
+            TagSerializer(Tag.objects.all(), many=True).data
+        )
+
+    def test_ingredient(self):
+        self.assert_same(
+            FastIngredientSerializer, IngredientSerializer,
+            list(Ingredient.objects.all()), AnonymousUser()
+        )
+        self.assert_same_bytes(
+            FastIngredientSerializer.from_values(Ingredient.objects.all()),
+            IngredientSerializer(Ingredient.objects.all(), many=True).data
+        )
@@ -0,0 +1,52 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe, Tag
+from users.models import MyUser
+
+
+class RecipeTagsFilterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = MyUser.objects.create_user(
+            username='author', email='author@example.com', password='x'
+        )
+        breakfast = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        lunch = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner')
+        cls.recipes = {}
+        for name, tags in (
+            ('both', [breakfast, lunch]),
+            ('breakfast', [breakfast]),
+            ('none', []),
+        ):
+            recipe = Recipe.objects.create(
+                author=author, name=name, text='Описание', cooking_time=5
+            )
+            recipe.tags.set(tags)
+            cls.recipes[name] = recipe.pk
+
+    def setUp(self):
+        cache.clear()
+
+    def get_ids(self, query):
+        response = APIClient().get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        ids = [recipe['id'] for recipe in data['results']]
+        self.assertEqual(data['count'], len(ids))
+        return sorted(ids)
+
+    def test_several_tags_return_each_recipe_once(self):
+        self.assertEqual(
+            self.get_ids('tags=breakfast&tags=lunch'),
+            sorted([self.recipes['both'], self.recipes['breakfast']])
+        )
+
+    def test_single_tag(self):
+        self.assertEqual(self.get_ids('tags=lunch'), [self.recipes['both']])
+        self.assertEqual(self.get_ids('tags=dinner'), [])
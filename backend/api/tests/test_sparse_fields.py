@@ -0,0 +1,65 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe, Tag
+from users.models import Follow, MyUser
+
+
+class SparseFieldsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MyUser.objects.create_user(
+            username='reader', email='reader@example.com', password='x'
+        )
+        tag = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        for name in ('zoe', 'adam', 'mila'):
+            author = MyUser.objects.create_user(
+                username=name, email=f'{name}@example.com', password='x'
+            )
+            Follow.objects.create(user=cls.user, author=author)
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {name}', text='Описание',
+                cooking_time=5
+            )
+            recipe.tags.set([tag])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unknown_field_rejected(self):
+        for query in ('fields=bogus', 'fields=id,bogus', 'expand=bogus'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('bogus', str(response.json()))
+
+    def test_only_requested_relations_loaded(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/?fields=id,name')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(response.json()['results'][0]), {'id', 'name'}
+        )
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('recipes_tag', sql)
+        self.assertNotIn('recipes_recipeingredient', sql)
+
+    def test_subscriptions_order_does_not_depend_on_fields(self):
+        for query in ('', '?fields=id,username', '?fields=id,recipes_count'):
+            with self.subTest(query=query):
+                response = self.client.get(
+                    f'/api/users/subscriptions/{query}'
+                )
+                self.assertEqual(response.status_code, 200)
+                ids = [item['id'] for item in response.json()['results']]
+                self.assertEqual(ids, list(
+                    MyUser.objects.filter(
+                        following__user=self.user
+                    ).order_by('username').values_list('id', flat=True)
+                ))
@@ -0,0 +1,59 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from time import monotonic
+
+from django.test import SimpleTestCase
+
+from api.throttling import STALE_SECONDS, BucketStore
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+
+class BucketStoreSyncTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, written, spent):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as file:
+            json.dump({'time': written, 'spent': spent}, file)
+        return path
+
+    def test_stale_and_dead_snapshots_are_removed(self):
+        host = socket.gethostname()
+        now = time.time()
+        stale = self.write('other-1.json', now - STALE_SECONDS - 1, {})
+        dead = self.write(f'{host}-{dead_pid()}.json', now, {})
+        fresh = self.write('other-2.json', now, {'key': 1})
+        store = BucketStore()
+        store.others['other-3.json'] = {'key': 5}
+        store.sync(self.directory, monotonic())
+        self.assertFalse(os.path.exists(stale))
+        self.assertFalse(os.path.exists(dead))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertEqual(store.others, {'other-2.json': {'key': 1}})
+        own = os.path.join(self.directory, f'{host}-{os.getpid()}.json')
+        with open(own) as file:
+            self.assertAlmostEqual(json.load(file)['time'], now, delta=60)
+
+    def test_fresh_snapshot_spending_is_subtracted(self):
+        store = BucketStore()
+        now = monotonic()
+        store.take('key', 1, 10, now)
+        self.write('other-2.json', time.time(), {'key': 1})
+        store.sync(self.directory, now)
+        self.write('other-2.json', time.time(), {'key': 4})
+        store.sync(self.directory, now)
+        self.assertEqual(store.buckets['key'][0], 6)
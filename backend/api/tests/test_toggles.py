@@ -0,0 +1,126 @@
+import threading
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api.membership import get_membership
+from foodgram import versions
+from recipes.models import Favorite, Recipe, ShopingList
+from users.models import MyUser
+
+THREADS = 8
+
+
+@override_settings(THROTTLE_BUCKETS={})
+class ConcurrentToggleTest(TransactionTestCase):
+    """Параллельные POST одной пары (пользователь, рецепт)."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = MyUser.objects.create_user(
+            username='reader', email='reader@example.com', password='x'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание', cooking_time=5
+        )
+
+    def post_in_parallel(self, url):
+        barrier = threading.Barrier(THREADS)
+        statuses = []
+        errors = []
+
+        def post():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                statuses.append(client.post(url).status_code)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return sorted(statuses)
+
+    def test_favorite(self):
+        statuses = self.post_in_parallel(
+            f'/api/recipes/{self.recipe.pk}/favorite/'
+        )
+        self.assertEqual(statuses, [201] + [400] * (THREADS - 1))
+        self.assertEqual(
+            Favorite.objects.filter(user=self.user, recipe=self.recipe).count(),
+            1
+        )
+
+    def test_shopping_cart(self):
+        statuses = self.post_in_parallel(
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        )
+        self.assertEqual(statuses, [201] + [400] * (THREADS - 1))
+        self.assertEqual(
+            ShopingList.objects.filter(
+                user=self.user, recipe=self.recipe
+            ).count(),
+            1
+        )
+
+
+@override_settings(THROTTLE_BUCKETS={})
+class StaleMembershipToggleTest(TestCase):
+    """Переключатели верят базе, даже если кеш Membership отстал."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MyUser.objects.create_user(
+            username='reader', email='reader@example.com', password='x'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание', cooking_time=5
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/recipes/{self.recipe.pk}/favorite/'
+
+    # Записи без сигналов: метка пользователя не меняется, кеш отстаёт.
+
+    def test_add_after_unreported_delete(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        self.assertTrue(get_membership(self.user).is_favorited(self.recipe.pk))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM recipes_favorite WHERE user_id = %s '
+                'AND recipe_id = %s', [self.user.pk, self.recipe.pk]
+            )
+        self.assertEqual(self.client.post(self.url).status_code, 201)
+        self.assertEqual(self.client.post(self.url).status_code, 400)
+
+    def test_remove_after_unreported_add(self):
+        self.assertFalse(
+            get_membership(self.user).is_favorited(self.recipe.pk)
+        )
+        Favorite.objects.bulk_create(
+            [Favorite(user=self.user, recipe=self.recipe)]
+        )
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertEqual(self.client.delete(self.url).status_code, 400)
+
+    def test_cascade_delete_changes_user_version(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        name = f'user:{self.user.pk}'
+        before, = versions.get_versions([name])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        after, = versions.get_versions([name])
+        self.assertNotEqual(before, after)
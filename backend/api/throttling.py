@@ -0,0 +1,152 @@
+"""Ограничение частоты запросов корзинами токенов в памяти процесса.
+
+Лимиты задаются в `THROTTLE_BUCKETS` для действия (`Класс.действие`):
+
+    'IngredientViewSet.list': {'rate': '20/s', 'burst': 40, 'key': 'ip'}
+
+`rate` — скорость пополнения, `burst` — ёмкость корзины, `key` —
+считать по пользователю (`user`, для анонимов — по IP) или по IP.
+Действия без записи не ограничиваются.
+
+Корзины живут в памяти воркера и в кеш на каждый запрос не пишут.
+Чтобы лимит был общим для всех воркеров хотя бы приблизительно, раз в
+`THROTTLE_SYNC_SECONDS` воркер записывает в `THROTTLE_DIR` сколько
+токенов он потратил по каждому ключу и вычитает из своих корзин то, что
+с прошлой синхронизации потратили остальные. Снимки завершившихся
+воркеров этого хоста и снимки старше `STALE_SECONDS` (по записанному
+в них времени) удаляются.
+"""
+import json
+import os
+import socket
+import time
+from time import monotonic
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from foodgram.metrics import is_alive
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+# Корзины, к которым не обращались дольше, при синхронизации удаляются.
+IDLE_SECONDS = 3600
+# Снимок, который воркер не обновлял дольше, больше не читается: его
+# корзины всё равно устарели бы.
+STALE_SECONDS = IDLE_SECONDS
+
+
+def is_stale(name, written):
+    """Снимок `<хост>-<pid>.json` устарел или его процесса нет."""
+    if time.time() - written > STALE_SECONDS:
+        return True
+    host, _, pid = name[:-len('.json')].rpartition('-')
+    return (
+        host == socket.gethostname() and pid.isdigit()
+        and not is_alive(int(pid))
+    )
+
+
+def parse_rate(rate):
+    """'20/s' -> токенов в секунду."""
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period[0]]
+
+
+class BucketStore:
+    """Корзины процесса: ключ -> [токены, время последнего пополнения]."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.spent = {}
+        self.others = {}
+        self.last_sync = monotonic()
+
+    def take(self, key, rate, burst, now):
+        """Забирает токен; возвращает 0 или сколько секунд ждать."""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [burst, now]
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+        bucket[0] = tokens - 1
+        self.spent[key] = self.spent.get(key, 0) + 1
+        return 0
+
+    def sync(self, directory, now):
+        """Обменивается расходом токенов с другими воркерами."""
+        self.last_sync = now
+        for key, (_, last) in list(self.buckets.items()):
+            if now - last > IDLE_SECONDS:
+                del self.buckets[key]
+                self.spent.pop(key, None)
+        os.makedirs(directory, exist_ok=True)
+        name = f'{socket.gethostname()}-{os.getpid()}.json'
+        path = os.path.join(directory, name)
+        with open(path + '.tmp', 'w') as file:
+            json.dump({'time': time.time(), 'spent': self.spent}, file)
+        os.replace(path + '.tmp', path)
+
+        seen = set()
+        for other in os.listdir(directory):
+            if other == name or not other.endswith('.json'):
+                continue
+            other_path = os.path.join(directory, other)
+            try:
+                with open(other_path) as file:
+                    snapshot = json.load(file)
+                spent = snapshot['spent']
+                if is_stale(other, snapshot['time']):
+                    os.remove(other_path)
+                    continue
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+            seen.add(other)
+            previous = self.others.get(other, {})
+            for key, total in spent.items():
+                bucket = self.buckets.get(key)
+                if bucket is not None and key in previous:
+                    bucket[0] -= total - previous[key]
+            self.others[other] = spent
+        for other in set(self.others) - seen:
+            del self.others[other]
+
+
+store = BucketStore()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Лимиты из THROTTLE_BUCKETS по действию и пользователю/IP."""
+
+    def allow_request(self, request, view):
+        scope = (
+            f'{type(view).__name__}.'
+            f'{getattr(view, "action", None) or request.method.lower()}'
+        )
+        config = settings.THROTTLE_BUCKETS.get(scope)
+        if config is None:
+            return True
+        user = request.user
+        if config.get('key', 'user') == 'user' and user.is_authenticated:
+            ident = f'user:{user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+
+        now = monotonic()
+        if (
+            settings.THROTTLE_DIR
+            and now - store.last_sync > settings.THROTTLE_SYNC_SECONDS
+        ):
+            store.sync(settings.THROTTLE_DIR, now)
+        self.retry_after = store.take(
+            f'{scope}|{ident}',
+            parse_rate(config['rate']),
+            config.get('burst', 1),
+            now
+        )
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
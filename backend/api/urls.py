@@ -2,6 +2,7 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from rest_framework import routers
 from .views import MyUserViewSet, TagViewSet, IngredientViewSet,RecipeViewSet
+from foodgram.metrics import metrics_view
 
 app_name = 'api'
 
@@ -14,6 +15,7 @@ router.register(r'recipes', RecipeViewSet, basename='recipes')
 
 
 urlpatterns = [
+    path('metrics', metrics_view, name='metrics'),
     path('', include(router.urls)),
     path(r'auth/', include('djoser.urls.authtoken')),
     path(r'users/<int:id>/subscribe/', MyUserViewSet.as_view({
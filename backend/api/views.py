@@ -1,56 +1,77 @@
-from django.shortcuts import render, get_object_or_404
+from datetime import timedelta
+
+from django.conf import settings
+from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from djoser.views import UserViewSet
-from djoser.serializers import UserSerializer
-from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework import status, permissions, viewsets, exceptions, filters
-from django.db.models import Sum
-
-
-from django_filters.rest_framework import DjangoFilterBackend
-from reportlab.pdfgen import canvas
-from collections import defaultdict
+from django.db.models import Count, Prefetch, Q, Sum
+from django.utils import timezone
 
 from users.pagination import CustomPageNumberPagination
 
-from .filters import IngredientFilter, RecipeFilterBackend
+from .exports import export_archive, import_archive
+from .fast_serializers import (FastIngredientSerializer, FastRecipeSerializer,
+                               FastShortRecipeSerializer, FastTagSerializer)
+from .filters import (IngredientFilter, RecipeFilterBackend,
+                      RecipeOrderingFilter, parse_ids)
+from .mixins import LimitedListMixin, SparseFieldsetMixin
 from .permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
 from .serializers import (
-    MyUserSerializer, MyUserCreateSerializer, 
-    UserFollowSerializer, TagSerializer, 
-    IngredientSerializer, RecipeIngredientSerializer, CreateUpdateRecipeIngredientsSerializer,
-    GetRecipeSerializer, RecipeSerializer, ShortRecipeSerializer)
+    UserFollowSerializer, TagSerializer, IngredientSerializer,
+    GetRecipeSerializer, RecipeSerializer,
+    RecipeIdsSerializer, RecipeForkSerializer, CartServingsSerializer)
+from .services import add_links, fork_recipe, remove_links
+from .streams import make_ticket
 from users.models import MyUser, Follow
-from recipes.models import Tag, Ingredient, Recipe, Favorite, ShopingList, RecipeIngredient
+from recipes.models import Tag, Ingredient, Recipe, Favorite, ShopingList, RecipeIngredient, RecipeChange
+from recipes.totals import shopping_list, shopping_list_totals
 
 
 User = get_user_model()
 
-class MyUserViewSet(UserViewSet):
+# Сколько рецептов можно получить через ?ids= или создать через bulk.
+BATCH_LIMIT = 100
+
+
+def in_order(queryset, ids):
+    """Объекты queryset в порядке `ids`; отсутствующие пропускаются."""
+    objects = {obj.pk: obj for obj in queryset}
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+class MyUserViewSet(SparseFieldsetMixin, UserViewSet):
     """Viewset для объектов модели User"""
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     pagination_class = CustomPageNumberPagination
-    
+    sparse_actions = ('list', 'retrieve', 'me', 'subscriptions')
+
 
     @action(
         methods=['GET'],
         detail=False,
         url_path='subscriptions',
         url_name='subscriptions',
-        permission_classes=[IsAuthenticated, ]
+        permission_classes=[IsAuthenticated, ],
+        serializer_class=UserFollowSerializer
         )     
 
     def subscriptions(self, request):
         """Выдает авторов, на кого подписан пользователь"""
         user = request.user
-        queryset = MyUser.objects.filter(following__user=user)
+        queryset = MyUser.objects.filter(
+            following__user=user
+        ).order_by('username')
+        fields = self.get_requested_fields()
+        if fields is None or 'recipes_count' in fields:
+            queryset = queryset.annotate(recipes_count=Count('recipe'))
         pages = self.paginate_queryset(queryset)
-        serializer = UserFollowSerializer(
-            pages, many=True, context={'request': request}
-        )
+        serializer = self.get_serializer(pages, many=True)
         return self.get_paginated_response(serializer.data)
 
     @action(
@@ -63,50 +84,89 @@ class MyUserViewSet(UserViewSet):
     def subscribe(self, request, id=None):
         """Подписаться/отписаться на/от автора"""
         user = self.request.user
-        author = get_object_or_404(MyUser, pk=id)
 
         if self.request.method == 'POST':
+            author = get_object_or_404(MyUser, pk=id)
             if user == author:
                 raise exceptions.ValidationError(
                     'Подписка на самого себя запрещена.'
                 )
-            if Follow.objects.filter(
-                user=user,
-                author=author
-            ).exists():
+            if not add_links(Follow, 'user', 'author', user, [author.pk]):
                 raise exceptions.ValidationError('Подписка уже оформлена.')
-
-            Follow.objects.create(user=user, author=author)
             serializer = self.get_serializer(author)
 
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if self.request.method == 'DELETE':
-            if not Follow.objects.filter(
-                user=user,
-                author=author
-            ).exists():
+            if not remove_links(Follow, 'user', 'author', user, [id]):
+                get_object_or_404(MyUser, pk=id)
                 raise exceptions.ValidationError(
                     'Подписка не была оформлена, либо уже удалена.'
                 )
-            subscription = get_object_or_404(
-                Follow,
-                user=user,
-                author=author
-            )
-            subscription.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='me/export',
+        url_name='me_export',
+        permission_classes=[IsAuthenticated, ])
+
+    def export_collection(self, request):
+        """Zip-архив с рецептами, избранным и списком покупок"""
+        response = StreamingHttpResponse(
+            export_archive(request.user),
+            content_type='application/zip'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename=foodgram-{request.user.username}.zip'
+        )
+        return response
+
+    @action(
+        methods=['POST'],
+        detail=False,
+        url_path='me/import',
+        url_name='me_import',
+        permission_classes=[IsAuthenticated, ],
+        parser_classes=[MultiPartParser, ])
+
+    def import_collection(self, request):
+        """Загрузить архив из me/export в свою коллекцию"""
+        file = request.FILES.get('file')
+        if file is None:
+            raise exceptions.ValidationError({'file': 'Файл не передан.'})
+        return Response(
+            import_archive(request.user, file),
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(
+        methods=['POST'],
+        detail=False,
+        url_path='me/events_ticket',
+        url_name='me_events_ticket',
+        permission_classes=[IsAuthenticated, ])
+
+    def events_ticket(self, request):
+        """Билет для подключения к потоку событий из браузера"""
+        return Response({
+            'ticket': make_ticket(request.user),
+            'expires_in': settings.EVENTS_TICKET_SECONDS,
+        }, status=status.HTTP_201_CREATED)
+
+class TagViewSet(LimitedListMixin, viewsets.ReadOnlyModelViewSet):
     """Viewset для объектов модели Tag"""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    fast_serializer = FastTagSerializer
+    list_limit_setting = 'TAGS_LIST_LIMIT'
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(LimitedListMixin, viewsets.ModelViewSet):
     """Viewset для объектов модели Ingredient"""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -114,26 +174,204 @@ class IngredientViewSet(viewsets.ModelViewSet):
     filter_backends = (filters.SearchFilter,)
     search_fields = ('^name', )
     pagination_class = None
+    fast_serializer = FastIngredientSerializer
+    list_limit_setting = 'INGREDIENTS_LIST_LIMIT'
 
 
-
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """Viewset для объектов модели Recipe"""
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrReadOnly, )
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = [RecipeFilterBackend]
+    filter_backends = (RecipeFilterBackend, RecipeOrderingFilter)
     pagination_class = CustomPageNumberPagination
+    default_fields = {
+        'list': (
+            'id', 'tags', 'image', 'author', 'is_favorited',
+            'is_in_shopping_cart', 'name', 'cooking_time',
+        ),
+    }
+
+
+    def get_queryset(self):
+        """Для чтения подгружает только связи запрошенных полей"""
+        if self.action not in ('list', 'retrieve'):
+            return Recipe.objects.all()
+        fields = self.get_requested_fields()
+        return self.get_read_queryset(
+            FastRecipeSerializer.fields if fields is None else fields
+        )
 
+    def get_read_queryset(self, fields):
+        queryset = Recipe.objects.all()
+        if 'text' not in fields:
+            queryset = queryset.defer('text')
+        if 'author' in fields:
+            queryset = queryset.select_related('author')
+        if 'tags' in fields:
+            queryset = queryset.prefetch_related('tags')
+        if 'ingredients' in fields:
+            queryset = queryset.prefetch_related(Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ))
+        return queryset
 
     def get_serializer_class(self):
         """Определяет какой сериализатор использовать"""
         if self.action in ('create', 'partial_update'):
             return GetRecipeSerializer
+        if self.action in ('list', 'retrieve'):
+            return FastRecipeSerializer
 
         return RecipeSerializer
 
 
+    def list(self, request, *args, **kwargs):
+        """`?ids=3,1,2` отдаёт эти рецепты без пагинации в том же порядке"""
+        ids = request.query_params.get('ids')
+        if ids is None:
+            return super().list(request, *args, **kwargs)
+        ids = parse_ids('ids', ids, BATCH_LIMIT)
+        recipes = self.filter_queryset(self.get_queryset()).filter(pk__in=ids)
+        return Response(
+            self.get_serializer(in_order(recipes, ids), many=True).data
+        )
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='changes',
+        url_name='changes')
+    def changes(self, request):
+        """Изменения рецептов после токена `?since=`.
+
+        Отдаёт актуальные версии изменённых рецептов (`updated`), id
+        удалённых (`deleted`) и токен следующего запроса (`next`). Без
+        `since` возвращается только текущий токен. Записи моложе
+        CHANGES_LAG_SECONDS не отдаются, чтобы не обогнать транзакции,
+        которые ещё не закоммичены.
+        """
+        changes = RecipeChange.objects.order_by('id')
+        since = request.query_params.get('since')
+        if since is None:
+            last = changes.exclude(
+                action=RecipeChange.TRUNCATED
+            ).values_list('id', flat=True).last()
+            return Response({
+                'updated': [], 'deleted': [], 'next': str(last or 0),
+                'has_more': False,
+            })
+        try:
+            since = int(since)
+        except ValueError:
+            raise exceptions.ValidationError({'since': 'Неверный токен.'})
+        if changes.filter(
+            action=RecipeChange.TRUNCATED, id__gt=since
+        ).exists():
+            return Response(
+                {'detail': 'Журнал изменений усечён, нужна полная '
+                           'синхронизация.'},
+                status=status.HTTP_410_GONE
+            )
+
+        rows = list(changes.filter(
+            id__gt=since,
+            created__lte=timezone.now() - timedelta(
+                seconds=settings.CHANGES_LAG_SECONDS
+            ),
+        ).values_list('id', 'recipe_id', 'action')[
+            :settings.CHANGES_PAGE_SIZE + 1
+        ])
+        has_more = len(rows) > settings.CHANGES_PAGE_SIZE
+        rows = rows[:settings.CHANGES_PAGE_SIZE]
+        latest = {}
+        for _, recipe_id, action in rows:
+            latest.pop(recipe_id, None)
+            latest[recipe_id] = action
+        updated_ids = [
+            recipe_id for recipe_id, action in latest.items()
+            if action != RecipeChange.DELETED
+        ]
+        requested = self.parse_fields_param(
+            self.fields_param, FastRecipeSerializer.fields
+        )
+        fields = tuple(
+            name for name in FastRecipeSerializer.fields
+            if not requested or name in requested or name == 'id'
+        )
+        recipes = in_order(
+            self.get_read_queryset(fields).filter(pk__in=updated_ids),
+            updated_ids
+        )
+        found = {recipe.pk for recipe in recipes}
+        return Response({
+            'updated': FastRecipeSerializer(
+                recipes,
+                many=True,
+                fields=fields,
+                context=self.get_serializer_context()
+            ).data,
+            'deleted': [
+                recipe_id for recipe_id in latest
+                if recipe_id not in found
+            ],
+            'next': str(rows[-1][0] if rows else since),
+            'has_more': has_more,
+        })
+
+    @action(
+        methods=['POST'],
+        detail=False,
+        url_path='bulk',
+        url_name='bulk',
+        permission_classes=[IsAuthenticated, ])
+    def bulk(self, request):
+        """Создаёт список рецептов в одной транзакции"""
+        serializer = GetRecipeSerializer(
+            data=request.data,
+            many=True,
+            max_length=BATCH_LIMIT,
+            context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.save()
+        ids = [recipe.pk for recipe in recipes]
+        created = self.get_read_queryset(
+            FastRecipeSerializer.fields
+        ).filter(pk__in=ids)
+        return Response(
+            FastRecipeSerializer(
+                in_order(created, ids),
+                many=True,
+                context=self.get_serializer_context()
+            ).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(
+        methods=['POST'],
+        detail=True,
+        url_path='fork',
+        url_name='fork',
+        permission_classes=[IsAuthenticated, ])
+    def fork(self, request, pk=None):
+        """Копия рецепта в рецепты текущего пользователя"""
+        serializer = RecipeForkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        source = get_object_or_404(Recipe, pk=pk)
+        recipe = fork_recipe(
+            source, request.user, serializer.validated_data.get('name')
+        )
+        created = self.get_read_queryset(
+            FastRecipeSerializer.fields
+        ).get(pk=recipe.pk)
+        return Response(
+            FastRecipeSerializer(
+                created, context=self.get_serializer_context()
+            ).data,
+            status=status.HTTP_201_CREATED
+        )
+
     @action(
         methods=['POST',],
         detail=False,
@@ -179,33 +417,66 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def favorite(self, request, pk=None):
         """Для добавления/удаления в/из Избранное"""
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
-        if self.request.method == 'POST':
-            if Favorite.objects.filter(
-                user=user,
-                recipe=recipe
-            ).exists():
-                raise exceptions.ValidationError('Рецепт уже в избранном.')
-            Favorite.objects.create(user=user, recipe=recipe)
-            serializer = ShortRecipeSerializer(
-                recipe,
-                context={'request': request}
-            )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if self.request.method == 'DELETE':
-            if not Favorite.objects.filter(
-                user=user,
-                recipe=recipe
-            ).exists():
-                raise exceptions.ValidationError(
-                    'Рецепта нет в избранном, либо он уже удален.'
-                )
-            favorite = get_object_or_404(Favorite, user=user, recipe=recipe)
-            favorite.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        return self.toggle_recipe(
+            Favorite,
+            pk,
+            'Рецепт уже в избранном.',
+            'Рецепта нет в избранном, либо он уже удален.'
+        )
+
+    @action(
+        methods=['POST', 'DELETE'],
+        detail=False,
+        url_path='favorite/batch',
+        url_name='favorite_batch',
+        permission_classes=[IsAuthenticated, ])
 
+    def favorite_batch(self, request):
+        """Добавить / удалить несколько рецептов в/из Избранное"""
+        return self.toggle_recipes(Favorite)
+
+    @action(
+        methods=['GET'],
+        detail=True,
+        url_path='similar',
+        url_name='similar',
+        pagination_class=None)
+
+    def similar(self, request, pk=None):
+        """Похожие рецепты из заранее посчитанной таблицы соседей"""
+        recipes = Recipe.objects.filter(
+            neighbour_of__recipe_id=pk
+        ).order_by('-neighbour_of__score')
+        serializer = FastShortRecipeSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        return Response(serializer.data)
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='recommended',
+        url_name='recommended',
+        permission_classes=[IsAuthenticated, ])
+
+    def recommended(self, request):
+        """Рекомендации по соседям рецептов из избранного и покупок"""
+        user = request.user
+        seeds = Recipe.objects.filter(
+            Q(favorite__user=user) | Q(cart__user=user)
+        ).values('pk')
+        recipes = Recipe.objects.filter(
+            neighbour_of__recipe__in=seeds
+        ).exclude(
+            pk__in=seeds
+        ).annotate(
+            recommendation_score=Sum('neighbour_of__score')
+        ).order_by('-recommendation_score', '-pub_date')
+        pages = self.paginate_queryset(recipes)
+        serializer = FastShortRecipeSerializer(
+            pages, many=True, context={'request': request}
+        )
+        return self.get_paginated_response(serializer.data)
 
     @action(
         methods=['GET'],
@@ -217,23 +488,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def download_shopping_cart(self, request):
         """Скачать список покупок"""
-        shopping_cart = ShopingList.objects.filter(user=self.request.user)
-        recipes = [item.recipe.id for item in shopping_cart]
-        buy_list = RecipeIngredient.objects.filter(
-            recipe__in=recipes
-        ).values(
-            'ingredient'
-        ).annotate(
-            amount=Sum('amount')
-        )
         buy_list_text = 'Список покупок:\n\n'
-        for item in buy_list:
-            ingredient = Ingredient.objects.get(pk=item['ingredient'])
+        for item in shopping_list(self.request.user):
             amount = item['amount']
+            if amount.is_integer():
+                amount = int(amount)
             buy_list_text += (
-                f'{ingredient.name}, {amount} '
-                f'{ingredient.measurement_unit}\n'
+                f'{item["ingredient__name"]}, {amount} '
+                f'{item["ingredient__measurement_unit"]}\n'
             )
+        totals = shopping_list_totals(self.request.user)
+        if totals['calories'] is not None:
+            buy_list_text += f'\nКалорийность: {totals["calories"]:.0f} ккал\n'
+        if totals['price'] is not None:
+            buy_list_text += f'Стоимость: {totals["price"]:.2f} руб.\n'
         response = HttpResponse(buy_list_text, content_type="text/plain")
         response['Content-Disposition'] = (
             'attachment; filename=shopping-list.txt'
@@ -243,43 +511,84 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
 
     @action(
-        methods=['POST', 'DELETE'],
+        methods=['GET'],
+        detail=False,
+        url_path='shopping_cart/totals',
+        url_name='shopping_cart_totals',
+        permission_classes=[IsAuthenticated, ])
+
+    def shopping_cart_totals(self, request):
+        """Калорийность, БЖУ и стоимость списка покупок"""
+        return Response(shopping_list_totals(request.user))
+
+    @action(
+        methods=['POST', 'PATCH', 'DELETE'],
         detail=True,
         url_path='shopping_cart',
         url_name='shopping_cart',
         permission_classes=[IsAuthenticated, ])    
 
     def shopping_cart(self, request, pk=None ):
-        """Добавить / удалить рецепт в список покупок"""
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
-        if self.request.method == 'POST':
-            if ShopingList.objects.filter(
-                user=user,
-                recipe=recipe
-            ).exists():
+        """Добавить / удалить рецепт в список покупок, изменить порции"""
+        if request.method == 'PATCH':
+            serializer = CartServingsSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            servings = serializer.validated_data['servings']
+            if not ShopingList.objects.filter(
+                user=request.user, recipe_id=pk
+            ).update(servings=servings):
+                get_object_or_404(Recipe, pk=pk)
                 raise exceptions.ValidationError(
-                    'Рецепт уже в списке покупок.'
+                    'Рецепта нет в списке покупок.'
                 )
-            ShopingList.objects.create(user=user, recipe=recipe)
-            serializer = ShortRecipeSerializer(
+            return Response({'id': int(pk), 'servings': servings})
+        return self.toggle_recipe(
+            ShopingList,
+            pk,
+            'Рецепт уже в списке покупок.',
+            'Рецепта нет в списке покупок, либо он уже удален.'
+        )
+
+    @action(
+        methods=['POST', 'DELETE'],
+        detail=False,
+        url_path='shopping_cart/batch',
+        url_name='shopping_cart_batch',
+        permission_classes=[IsAuthenticated, ])
+
+    def shopping_cart_batch(self, request):
+        """Добавить / удалить несколько рецептов в списке покупок"""
+        return self.toggle_recipes(ShopingList)
+
+    def toggle_recipe(self, model, pk, exists_message, missing_message):
+        """Добавляет/удаляет рецепт в списке пользователя одним запросом.
+
+        Ответ решает число затронутых строк, а не закешированный
+        Membership: кеш может отставать от базы.
+        """
+        user = self.request.user
+        if self.request.method == 'POST':
+            recipe = get_object_or_404(Recipe, pk=pk)
+            if not add_links(model, 'user', 'recipe', user, [recipe.pk]):
+                raise exceptions.ValidationError(exists_message)
+            serializer = FastShortRecipeSerializer(
                 recipe,
-                context={'request': request}
+                context={'request': self.request}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if self.request.method == 'DELETE':
-            if not ShopingList.objects.filter(
-                user=user,
-                recipe=recipe
-            ).exists():
-                raise exceptions.ValidationError(
-                    'Рецепта нет в списке покупок, либо он уже удален.'
-                )
-            shopping_cart = get_object_or_404(
-                ShopingList,
-                user=user,
-                recipe=recipe
-            )
-            shopping_cart.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
\ No newline at end of file
+        if not remove_links(model, 'user', 'recipe', user, [pk]):
+            get_object_or_404(Recipe, pk=pk)
+            raise exceptions.ValidationError(missing_message)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def toggle_recipes(self, model):
+        """Добавляет/удаляет пачку рецептов в списке пользователя"""
+        serializer = RecipeIdsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        user = self.request.user
+        if self.request.method == 'POST':
+            added = add_links(model, 'user', 'recipe', user, recipe_ids)
+            return Response({'added': added}, status=status.HTTP_200_OK)
+        removed = remove_links(model, 'user', 'recipe', user, recipe_ids)
+        return Response({'removed': removed}, status=status.HTTP_200_OK)
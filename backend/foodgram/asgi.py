@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Импорт после настройки Django: модулю нужны модели.
+from django.conf import settings  # noqa: E402
+
+from api.streams import application as events_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Поток событий обслуживается напрямую, остальное — Django."""
+    if scope['type'] == 'http' and scope['path'] == settings.EVENTS_PATH:
+        await events_application(scope, receive, send)
+        return
+    await django_application(scope, receive, send)
@@ -0,0 +1,199 @@
+"""Условные запросы и сжатие ответов API.
+
+Для представлений из `HTTP_CACHE_VIEWS` слабый ETag собирается из меток
+версий (`foodgram.versions`), от которых зависит ответ, и метки
+пользователя, если запрос с токеном. Метки читаются из кеша до вызова
+представления, поэтому на совпавший `If-None-Match` ответ 304 уходит без
+запросов к рецептам и сериализации. Там же задаётся `Cache-Control`:
+анонимные ответы публичные на `max_age` секунд, ответы с токеном —
+`private, no-cache` (браузер каждый раз сверяет ETag).
+
+Метки новее `DB_PIN_SECONDS` значат, что реплики могут ещё не видеть
+изменение: такой запрос читает с основной базы, иначе под новым ETag
+закешировалось бы старое тело с реплики.
+
+JSON длиннее `HTTP_COMPRESS_MIN_SIZE` сжимается brotli (если установлен
+пакет brotli и клиент его принимает) или gzip. Потоковый JSON (выгрузки
+`dump/`) сжимается gzip по мере генерации.
+
+Условные запросы обрабатываются только для синхронных представлений;
+асинхронные ответы только сжимаются.
+"""
+import gzip
+import zlib
+from asyncio import iscoroutinefunction
+
+from django.conf import settings
+from django.http import HttpResponseNotModified
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.authtoken.models import Token
+
+from . import versions
+from .db_routers import read_from_replica
+from .metrics import get_view_label
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+SAFE_METHODS = ('GET', 'HEAD')
+VARY = ('Accept', 'Authorization', 'Accept-Encoding')
+
+
+def get_user_id(request):
+    auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(auth) != 2 or auth[0].lower() != 'token':
+        return None
+    return Token.objects.filter(
+        key=auth[1]
+    ).values_list('user_id', flat=True).first()
+
+
+def get_etag(request):
+    """(ETag, настройки представления, недавние ли метки).
+
+    Для представлений без ETag — (None, None, False).
+    """
+    if (
+        request.method not in SAFE_METHODS
+        or not request.path_info.startswith('/api/')
+    ):
+        return None, None, False
+    try:
+        request.resolver_match = resolve(request.path_info)
+    except Resolver404:
+        return None, None, False
+    config = settings.HTTP_CACHE_VIEWS.get(get_view_label(request))
+    if config is None:
+        return None, None, False
+    names = list(config['versions'])
+    if 'HTTP_AUTHORIZATION' in request.META:
+        user_id = get_user_id(request)
+        if user_id is None:
+            return None, None, False
+        names.append(f'user:{user_id}')
+    stamps = versions.get_versions(names)
+    etag = f'W/"{settings.HTTP_CACHE_SALT}-{"-".join(stamps)}"'
+    return etag, config, versions.is_recent(stamps, settings.DB_PIN_SECONDS)
+
+
+def matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    tags = {
+        tag.strip().replace('W/', '', 1) for tag in header.split(',')
+    }
+    return '*' in tags or etag.replace('W/', '', 1) in tags
+
+
+def set_cache_headers(request, response, etag, config):
+    response['ETag'] = etag
+    if not response.has_header('Cache-Control'):
+        if 'HTTP_AUTHORIZATION' in request.META:
+            response['Cache-Control'] = 'private, no-cache'
+        else:
+            response['Cache-Control'] = (
+                f'public, max-age={config["max_age"]}'
+            )
+    patch_vary_headers(response, VARY)
+
+
+def accepted_encodings(request):
+    encodings = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = item.partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+def gzip_stream(content):
+    compressor = zlib.compressobj(
+        settings.HTTP_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+    )
+    for chunk in content:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def compress(request, response):
+    """Сжимает JSON-ответ, если он достаточно большой."""
+    if (
+        response.status_code != 200
+        or response.has_header('Content-Encoding')
+        or not response.get('Content-Type', '').startswith(
+            'application/json'
+        )
+    ):
+        return response
+    if response.streaming:
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if 'gzip' in accepted_encodings(request):
+            response.streaming_content = gzip_stream(
+                response.streaming_content
+            )
+            response['Content-Encoding'] = 'gzip'
+        return response
+    if len(response.content) < settings.HTTP_COMPRESS_MIN_SIZE:
+        return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encodings = accepted_encodings(request)
+    if brotli is not None and 'br' in encodings:
+        response.content = brotli.compress(
+            response.content, quality=settings.HTTP_BROTLI_QUALITY
+        )
+        response['Content-Encoding'] = 'br'
+    elif 'gzip' in encodings:
+        response.content = gzip.compress(
+            response.content, compresslevel=settings.HTTP_GZIP_LEVEL
+        )
+        response['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response['Content-Length'] = str(len(response.content))
+    return response
+
+
+@sync_and_async_middleware
+def conditional_middleware(get_response):
+    """ETag, 304, Cache-Control и сжатие для API."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return compress(request, await get_response(request))
+        return middleware
+
+    def middleware(request):
+        etag, config, recent = get_etag(request)
+        if etag is not None and matches(request, etag):
+            response = HttpResponseNotModified()
+            set_cache_headers(request, response, etag, config)
+            return response
+        token = versions.pending.set(set())
+        # Тело под этим ETag должно содержать изменение, которое ещё
+        # может не дойти до реплик.
+        replica_token = read_from_replica.set(False) if recent else None
+        try:
+            response = get_response(request)
+        finally:
+            if replica_token is not None:
+                read_from_replica.reset(replica_token)
+            names = versions.pending.get()
+            versions.pending.reset(token)
+            if names:
+                versions.bump(names)
+        if etag is not None and response.status_code == 200:
+            set_cache_headers(request, response, etag, config)
+        return compress(request, response)
+    return middleware
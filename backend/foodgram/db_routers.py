@@ -0,0 +1,49 @@
+"""Маршрутизация запросов к репликам базы данных.
+
+Чтение уходит на реплику, только если `database_routing_middleware`
+пометил текущий запрос как безопасный (GET/HEAD/OPTIONS) и транзакция
+на основной базе не открыта. Запись и миграции — всегда на default.
+
+После успешного изменяющего запроса клиент на `DB_PIN_SECONDS` секунд
+закрепляется за основной базой (cookie и запись в кеше по ключу его
+токена или сессии), чтобы сразу видеть свои изменения несмотря на
+отставание реплик. Токены и сессии всегда читаются с основной базы:
+только что выданный токен может ещё не доехать до реплики.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+read_from_replica = ContextVar('read_from_replica', default=False)
+
+PRIMARY_ONLY_MODELS = ('authtoken.token', 'sessions.session')
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+class ReplicaRouter:
+
+    def __init__(self):
+        self.replicas = replica_aliases()
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or not read_from_replica.get():
+            return DEFAULT_DB_ALIAS
+        if model._meta.label_lower in PRIMARY_ONLY_MODELS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,296 @@
+"""Публикация событий для потока Server-Sent Events.
+
+Подписчики — соединения `/api/async/events/` в ASGI-процессе — получают
+события от `broker` этого процесса. Каждое событие относится к каналу
+(`recipe:<id>`, `author:<id>`); сообщение кодируется один раз и одними и
+теми же байтами раздаётся всем подписчикам канала. Раздача идёт в цикле
+событий, синхронный код передаёт события туда через
+`call_soon_threadsafe`.
+
+Между процессами события идут через PostgreSQL (EVENTS_BACKEND=postgres):
+`publish()` выполняет `pg_notify` в текущей транзакции — уведомление
+уходит при коммите и пропадает при откате, — а каждый ASGI-процесс
+держит одно соединение с `LISTEN` и раздаёт полученное своим
+подписчикам. С EVENTS_BACKEND=local события раздаются только внутри
+процесса после коммита; так работают разработка на sqlite и замеры.
+
+Публикация стоит запросов (счётчики, `pg_notify`), поэтому сначала
+`listened()` отбирает каналы, у которых есть подписчики. ASGI-процесс
+раз в EVENTS_LISTENERS_SECONDS записывает в общий кеш ключи своих
+каналов, а новые каналы — сразу при подключении; ключ живёт два
+периода. Событие, случившееся между подключением и записью ключа,
+может не дойти — как и при переподключении, его покажет
+/api/recipes/changes/.
+"""
+import asyncio
+import json
+import logging
+import sys
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+logger = logging.getLogger('foodgram.events')
+
+# Предел размера payload у NOTIFY — 8000 байт.
+NOTIFY_PAYLOAD_SIZE = 7900
+LISTEN_RETRY_SECONDS = 5
+
+
+def listeners_key(channel):
+    return f'events:listeners:{channel}'
+
+
+def encode(event, data):
+    """Сообщение в формате text/event-stream."""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f'event: {event}\ndata: {payload}\n\n'.encode()
+
+
+class Subscription:
+    """Очередь сообщений одного соединения.
+
+    Вместо asyncio.Queue с wait_for — список и один Future на время
+    ожидания: простаивающее соединение не держит лишних задач.
+    """
+
+    __slots__ = ('channels', 'messages', 'waiter', 'closed')
+
+    def __init__(self, channels):
+        self.channels = channels
+        self.messages = []
+        self.waiter = None
+        self.closed = False
+
+    def put(self, message):
+        if self.closed:
+            return
+        if len(self.messages) >= settings.EVENTS_QUEUE_SIZE:
+            # Клиент не успевает читать: поток закрывается, и клиент
+            # переподключится с актуальным состоянием.
+            self.close()
+            return
+        self.messages.append(message)
+        self.wake()
+
+    def close(self):
+        self.closed = True
+        self.wake()
+
+    def wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def wait(self, timeout):
+        """Ждёт сообщений, закрытия или истечения `timeout`."""
+        if self.messages or self.closed:
+            return
+        loop = asyncio.get_running_loop()
+        self.waiter = loop.create_future()
+        handle = loop.call_later(timeout, self.wake)
+        try:
+            await self.waiter
+        finally:
+            handle.cancel()
+            self.waiter = None
+
+    def drain(self):
+        data = b''.join(self.messages)
+        self.messages.clear()
+        return data
+
+
+class Broker:
+    """Подписки процесса: канал -> множество Subscription."""
+
+    def __init__(self):
+        self.channels = defaultdict(set)
+        self.count = 0
+        self.loop = None
+        self.listener = None
+        self.advertiser = None
+        # Каналы, ещё не записанные в кеш, и сигнал о них для advertise().
+        self.joined = set()
+        self.joined_event = None
+
+    def subscribe(self, channels):
+        # Одинаковые имена каналов у тысяч соединений — одна строка.
+        channels = [sys.intern(channel) for channel in channels]
+        self.loop = asyncio.get_running_loop()
+        if settings.EVENTS_BACKEND == 'postgres':
+            if self.listener is None or self.listener.done():
+                self.listener = self.loop.create_task(listen(self))
+            if self.advertiser is None or self.advertiser.done():
+                self.joined_event = asyncio.Event()
+                self.advertiser = self.loop.create_task(advertise(self))
+            joined = [
+                channel for channel in channels
+                if channel not in self.channels
+            ]
+            if joined:
+                self.joined.update(joined)
+                self.joined_event.set()
+        subscription = Subscription(channels)
+        for channel in channels:
+            self.channels[channel].add(subscription)
+        self.count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for channel in subscription.channels:
+            subscribers = self.channels.get(channel)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.channels[channel]
+        self.count -= 1
+
+    def dispatch(self, messages):
+        for channel, message in messages:
+            for subscription in list(self.channels.get(channel, ())):
+                subscription.put(message)
+
+    def publish(self, messages):
+        """Раздаёт события [(канал, событие, данные)]; из любого потока."""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        encoded = [
+            (channel, encode(event, data))
+            for channel, event, data in messages
+            if channel in self.channels
+        ]
+        if not encoded:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.dispatch(encoded)
+        else:
+            loop.call_soon_threadsafe(self.dispatch, encoded)
+
+
+broker = Broker()
+
+
+def payloads(messages):
+    """Режет события на JSON-массивы, помещающиеся в один NOTIFY."""
+    chunk = []
+    size = 2
+    for message in messages:
+        item = json.dumps(message, separators=(',', ':'))
+        if chunk and size + len(item.encode()) + 1 > NOTIFY_PAYLOAD_SIZE:
+            yield '[' + ','.join(chunk) + ']'
+            chunk = []
+            size = 2
+        chunk.append(item)
+        size += len(item.encode()) + 1
+    if chunk:
+        yield '[' + ','.join(chunk) + ']'
+
+
+def listened(channels):
+    """Каналы из `channels`, у которых есть подписчики."""
+    channels = list(channels)
+    if settings.EVENTS_BACKEND != 'postgres':
+        return {channel for channel in channels if channel in broker.channels}
+    keys = {listeners_key(channel): channel for channel in channels}
+    return {keys[key] for key in cache.get_many(list(keys))}
+
+
+def publish(messages, using=DEFAULT_DB_ALIAS):
+    """Публикует события [(канал, событие, данные)] после коммита."""
+    messages = list(messages)
+    if not messages:
+        return
+    if settings.EVENTS_BACKEND != 'postgres':
+        transaction.on_commit(partial(broker.publish, messages), using=using)
+        return
+    with connections[using].cursor() as cursor:
+        for payload in payloads(messages):
+            cursor.execute(
+                'SELECT pg_notify(%s, %s)',
+                [settings.EVENTS_CHANNEL, payload]
+            )
+
+
+def connect():
+    import psycopg2
+    from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+    params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+    connection = psycopg2.connect(**params)
+    connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    with connection.cursor() as cursor:
+        cursor.execute(f'LISTEN {settings.EVENTS_CHANNEL}')
+    return connection
+
+
+async def advertise(broker):
+    """Держит в кеше ключи каналов, которые слушают в этом процессе."""
+    loop = asyncio.get_running_loop()
+    period = settings.EVENTS_LISTENERS_SECONDS
+    refreshed = None
+    while True:
+        if refreshed is None or loop.time() - refreshed >= period:
+            channels = list(broker.channels)
+            refreshed = loop.time()
+        else:
+            channels = list(broker.joined)
+        broker.joined.clear()
+        broker.joined_event.clear()
+        if channels:
+            try:
+                await cache.aset_many(
+                    {listeners_key(channel): 1 for channel in channels},
+                    2 * period
+                )
+            except Exception:
+                logger.exception('Ошибка записи слушателей в кеш')
+        try:
+            await asyncio.wait_for(
+                broker.joined_event.wait(),
+                max(0, refreshed + period - loop.time())
+            )
+        except asyncio.TimeoutError:
+            pass
+
+
+async def listen(broker):
+    """Получает NOTIFY других процессов и раздаёт их подписчикам.
+
+    При обрыве соединения переподключается; события, пришедшие за это
+    время, теряются — клиенты добирают их через /api/recipes/changes/.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        connection = None
+        try:
+            connection = await loop.run_in_executor(None, connect)
+            fileno = connection.fileno()
+            ready = asyncio.Event()
+            loop.add_reader(fileno, ready.set)
+            try:
+                while True:
+                    await ready.wait()
+                    ready.clear()
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        broker.publish(json.loads(notify.payload))
+            finally:
+                loop.remove_reader(fileno)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Ошибка LISTEN %s', settings.EVENTS_CHANNEL)
+        finally:
+            if connection is not None:
+                connection.close()
+        await asyncio.sleep(LISTEN_RETRY_SECONDS)
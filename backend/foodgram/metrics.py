@@ -0,0 +1,289 @@
+"""Метрики запросов в формате Prometheus.
+
+Каждый процесс копит счётчики и гистограммы в обычных словарях без
+блокировок (при гонке потоков возможна потеря единичных событий, для
+статистики это допустимо) и раз в `METRICS_FLUSH_SECONDS` сбрасывает
+снимок в `METRICS_DIR/<хост>-<pid>.json`. Эндпоинт `/api/metrics` складывает
+снимки всех воркеров. Без `METRICS_DIR` отдаются метрики только
+текущего процесса.
+
+Метки запроса — класс DRF-представления и действие, например
+`RecipeViewSet.download_shopping_cart`. Обращения к кешам во время
+запроса копятся в `cache_events` и записываются с той же меткой после
+ответа, когда представление уже известно; вне запроса метка — `none`.
+
+Снимки процессов, которых больше нет, удаляются при сборе: для своего
+хоста — если процесс с этим pid не существует, для других хостов
+(контейнеров) — если снимок не обновлялся `METRICS_STALE_SECONDS`.
+"""
+import json
+import os
+import socket
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import monotonic
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+SIZE_BUCKETS = (
+    256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+)
+
+HELP = {
+    'foodgram_http_requests_total': (
+        'counter', 'Число запросов по представлению, методу и статусу.'
+    ),
+    'foodgram_http_request_duration_seconds': (
+        'histogram', 'Время обработки запроса.'
+    ),
+    'foodgram_http_response_size_bytes': (
+        'histogram', 'Размер тела ответа.'
+    ),
+    'foodgram_db_queries_total': (
+        'counter', 'Число SQL-запросов.'
+    ),
+    'foodgram_db_query_duration_seconds_total': (
+        'counter', 'Суммарное время SQL-запросов.'
+    ),
+    'foodgram_db_connections_opened_total': (
+        'counter', 'Число открытых соединений с базой.'
+    ),
+    'foodgram_cache_requests_total': (
+        'counter', 'Обращения к кешам по представлению: result=hit|miss.'
+    ),
+    'foodgram_membership_size_bytes': (
+        'histogram', 'Размер id избранного, корзины и подписок пользователя.'
+    ),
+}
+
+# (метрика, метки) -> значение; для гистограмм — список
+# [счётчики по корзинам..., +Inf, сумма, количество].
+counters = {}
+histograms = {}
+buckets = {
+    'foodgram_http_request_duration_seconds': DURATION_BUCKETS,
+    'foodgram_http_response_size_bytes': SIZE_BUCKETS,
+    'foodgram_membership_size_bytes': SIZE_BUCKETS,
+}
+
+last_flush = monotonic()
+view_labels = {}
+
+# {(кеш, попадание): число} текущего запроса; None вне запроса.
+cache_events = ContextVar('cache_events', default=None)
+
+
+def inc(name, labels=(), value=1):
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, labels, value):
+    key = (name, labels)
+    series = histograms.get(key)
+    bounds = buckets[name]
+    if series is None:
+        series = histograms[key] = [0] * (len(bounds) + 3)
+    series[bisect_left(bounds, value)] += 1
+    series[-2] += value
+    series[-1] += 1
+
+
+def record_cache(cache, hit):
+    events = cache_events.get()
+    if events is None:
+        inc_cache((('view', 'none'),), cache, hit)
+    else:
+        events[cache, hit] = events.get((cache, hit), 0) + 1
+
+
+def inc_cache(view, cache, hit, value=1):
+    inc('foodgram_cache_requests_total', view + (
+        ('cache', cache), ('result', 'hit' if hit else 'miss')
+    ), value)
+
+
+def get_view_label(request):
+    """`Класс.действие` для DRF, `модуль.функция` для обычных views."""
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched'
+    key = (match.func, request.method)
+    label = view_labels.get(key)
+    if label is None:
+        func = match.func
+        cls = getattr(func, 'cls', None)
+        if cls is None:
+            label = f'{func.__module__}.{func.__name__}'
+        else:
+            method = request.method.lower()
+            action = (getattr(func, 'actions', None) or {}).get(method, method)
+            label = f'{cls.__name__}.{action}'
+        view_labels[key] = label
+    return label
+
+
+def record_request(request, response, duration, stats):
+    view = (('view', get_view_label(request)),)
+    for (cache, hit), value in stats.cache_events.items():
+        inc_cache(view, cache, hit, value)
+    inc('foodgram_http_requests_total', view + (
+        ('method', request.method), ('status', str(response.status_code))
+    ))
+    observe('foodgram_http_request_duration_seconds', view, duration)
+    if not response.streaming:
+        observe(
+            'foodgram_http_response_size_bytes', view, len(response.content)
+        )
+    if stats.queries:
+        inc('foodgram_db_queries_total', view, stats.queries)
+        inc('foodgram_db_query_duration_seconds_total', view, stats.duration)
+    if monotonic() - last_flush > settings.METRICS_FLUSH_SECONDS:
+        flush()
+
+
+def snapshot():
+    return {
+        'counters': [
+            [name, labels, value]
+            for (name, labels), value in list(counters.items())
+        ],
+        'histograms': [
+            [name, labels, series]
+            for (name, labels), series in list(histograms.items())
+        ],
+    }
+
+
+def flush():
+    """Атомарно записывает снимок процесса в METRICS_DIR."""
+    global last_flush
+    last_flush = monotonic()
+    directory = settings.METRICS_DIR
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(
+        directory, f'{socket.gethostname()}-{os.getpid()}.json'
+    )
+    with open(path + '.tmp', 'w') as file:
+        json.dump(snapshot(), file)
+    os.replace(path + '.tmp', path)
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def is_dead_snapshot(name, path):
+    """Снимок `<хост>-<pid>.json` процесса, которого больше нет."""
+    host, _, pid = name[:-len('.json')].rpartition('-')
+    if host == socket.gethostname():
+        return pid.isdigit() and not is_alive(int(pid))
+    return (
+        time.time() - os.path.getmtime(path) > settings.METRICS_STALE_SECONDS
+    )
+
+
+def collect():
+    """Сумма снимков живых процессов (или только текущего)."""
+    directory = settings.METRICS_DIR
+    if not directory:
+        snapshots = [snapshot()]
+    else:
+        flush()
+        snapshots = []
+        for name in os.listdir(directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                if is_dead_snapshot(name, path):
+                    os.remove(path)
+                    continue
+                with open(path) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+    total_counters = {}
+    total_histograms = {}
+    for data in snapshots:
+        for name, labels, value in data['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            total_counters[key] = total_counters.get(key, 0) + value
+        for name, labels, series in data['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = total_histograms.setdefault(key, [0] * len(series))
+            for index, value in enumerate(series):
+                total[index] += value
+    return total_counters, total_histograms
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def render():
+    """Текстовый формат Prometheus 0.0.4."""
+    total_counters, total_histograms = collect()
+    series = {}
+    for (name, labels), value in sorted(total_counters.items()):
+        series.setdefault(name, []).append(
+            f'{name}{format_labels(labels)} {value}'
+        )
+    for (name, labels), values in sorted(total_histograms.items()):
+        lines = series.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(
+            buckets[name] + ('+Inf',), values[:-2]
+        ):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket'
+                f'{format_labels(labels + (("le", bound),))} {cumulative}'
+            )
+        lines.append(f'{name}_sum{format_labels(labels)} {values[-2]}')
+        lines.append(f'{name}_count{format_labels(labels)} {values[-1]}')
+    output = []
+    for name in sorted(series):
+        kind, description = HELP[name]
+        output.append(f'# HELP {name} {description}')
+        output.append(f'# TYPE {name} {kind}')
+        output.extend(series[name])
+    return '\n'.join(output) + '\n'
+
+
+def metrics_view(request):
+    """Метрики всех воркеров для Prometheus.
+
+    Без METRICS_TOKEN эндпоинт закрыт: /api/ проксируется наружу, а
+    метрики раскрывают задержки и трафик каждого представления.
+    """
+    if not settings.METRICS_TOKEN:
+        return HttpResponse(status=404)
+    if not constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''),
+        f'Bearer {settings.METRICS_TOKEN}'
+    ):
+        return HttpResponse(status=403)
+    return HttpResponse(
+        render(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,192 @@
+"""Middleware работы с базой данных: выбор реплики и метрики соединений.
+
+Обе функции подходят и для WSGI, и для ASGI: состояние запроса хранится
+в ContextVar, который asgiref копирует в потоки sync_to_async.
+"""
+import hashlib
+import logging
+from asyncio import iscoroutinefunction
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics
+from .db_routers import read_from_replica
+
+logger = logging.getLogger('foodgram.db')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'db_pin'
+
+
+class QueryStats:
+    __slots__ = ('queries', 'duration', 'connections', 'cache_events')
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+        self.connections = 0
+        self.cache_events = {}
+
+
+current_stats = ContextVar('current_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.duration += perf_counter() - started
+
+
+def install_wrapper(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def track_connection(sender, connection, **kwargs):
+    """Подключает счётчик запросов к каждому новому соединению."""
+    install_wrapper(connection)
+    metrics.inc('foodgram_db_connections_opened_total')
+    stats = current_stats.get()
+    if stats is not None:
+        stats.connections += 1
+
+
+connection_created.connect(track_connection)
+for connection in connections.all(initialized_only=True):
+    install_wrapper(connection)
+
+
+def finish_request(request, response, stats, started):
+    duration = perf_counter() - started
+    if settings.METRICS_ENABLED:
+        metrics.record_request(request, response, duration, stats)
+    logger.debug(
+        '%s %s: %d SQL, %.1f ms в базе, новых соединений: %d',
+        request.method, request.path, stats.queries,
+        stats.duration * 1000, stats.connections
+    )
+    if settings.DB_METRICS_HEADERS:
+        response['Server-Timing'] = (
+            f'db;dur={stats.duration * 1000:.1f};desc="{stats.queries} SQL", '
+            f'app;dur={duration * 1000:.1f}'
+        )
+        response['X-DB-Queries'] = stats.queries
+        response['X-DB-Connections'] = stats.connections
+    return response
+
+
+@sync_and_async_middleware
+def database_metrics_middleware(get_response):
+    """Считает SQL-запросы, время в базе и новые соединения за запрос."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats, started = QueryStats(), perf_counter()
+            token = current_stats.set(stats)
+            events_token = metrics.cache_events.set(stats.cache_events)
+            try:
+                response = await get_response(request)
+            finally:
+                current_stats.reset(token)
+                metrics.cache_events.reset(events_token)
+            return finish_request(request, response, stats, started)
+    else:
+        def middleware(request):
+            stats, started = QueryStats(), perf_counter()
+            token = current_stats.set(stats)
+            events_token = metrics.cache_events.set(stats.cache_events)
+            try:
+                response = get_response(request)
+            finally:
+                current_stats.reset(token)
+                metrics.cache_events.reset(events_token)
+            return finish_request(request, response, stats, started)
+    return middleware
+
+
+def pin_key(request):
+    """Ключ закрепления клиента: хеш его токена или сессии."""
+    credentials = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if credentials:
+        return 'db-pin:' + hashlib.sha1(credentials.encode()).hexdigest()
+    return None
+
+
+def is_pinned(key):
+    pinned = bool(cache.get(key))
+    metrics.record_cache('db_pin', pinned)
+    return pinned
+
+
+async def ais_pinned(key):
+    pinned = bool(await cache.aget(key))
+    metrics.record_cache('db_pin', pinned)
+    return pinned
+
+
+def pin_to_primary(request, response):
+    """Ставит cookie после успешной записи; возвращает ключ для кеша."""
+    if request.method in SAFE_METHODS or response.status_code >= 400:
+        return None
+    response.set_cookie(
+        PIN_COOKIE, '1',
+        max_age=settings.DB_PIN_SECONDS, httponly=True, samesite='Lax'
+    )
+    return pin_key(request)
+
+
+@sync_and_async_middleware
+def database_routing_middleware(get_response):
+    """Разрешает чтение с реплик в запросах безопасными методами.
+
+    Клиент, недавно что-то изменивший, читает с основной базы.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            key = pin_key(request)
+            replica = (
+                request.method in SAFE_METHODS
+                and PIN_COOKIE not in request.COOKIES
+                and not (key and await ais_pinned(key))
+            )
+            token = read_from_replica.set(replica)
+            try:
+                response = await get_response(request)
+            finally:
+                read_from_replica.reset(token)
+            key = pin_to_primary(request, response)
+            if key:
+                await cache.aset(key, True, settings.DB_PIN_SECONDS)
+            return response
+    else:
+        def middleware(request):
+            key = pin_key(request)
+            replica = (
+                request.method in SAFE_METHODS
+                and PIN_COOKIE not in request.COOKIES
+                and not (key and is_pinned(key))
+            )
+            token = read_from_replica.set(replica)
+            try:
+                response = get_response(request)
+            finally:
+                read_from_replica.reset(token)
+            key = pin_to_primary(request, response)
+            if key:
+                cache.set(key, True, settings.DB_PIN_SECONDS)
+            return response
+    return middleware
@@ -0,0 +1,150 @@
+"""Выборочный профилировщик медленных запросов.
+
+Для доли запросов `PROFILER_SAMPLE_RATE` поток-сэмплер каждые
+`PROFILER_INTERVAL_MS` снимает стек потока, обрабатывающего запрос, а
+обёртка соединений записывает выполненный SQL. Если запрос к одному из
+`PROFILER_VIEWS` длился дольше `PROFILER_THRESHOLD_MS`, в `PROFILER_DIR`
+сохраняются два файла:
+
+    <имя>.collapsed   стеки в формате flamegraph.pl / speedscope
+    <имя>.json        запрос, длительность и SQL с временем выполнения
+
+Профилируются только синхронные запросы; асинхронные пропускаются.
+Список профилей — `manage.py list_profiles`.
+"""
+import json
+import os
+import random
+import sys
+import threading
+from asyncio import iscoroutinefunction
+from collections import Counter
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.decorators import sync_and_async_middleware
+
+from .metrics import get_view_label
+
+MAX_QUERIES = 500
+
+
+def collapse(frame):
+    """Стек кадра в строку `корень;...;лист`."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f'{frame.f_globals.get("__name__", "?")}.'
+            f'{getattr(code, "co_qualname", code.co_name)}'
+        )
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler(threading.Thread):
+    """Поток, который периодически снимает стек другого потока."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class QueryLog:
+    """Обёртка выполнения SQL: запоминает запросы и их время."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append({
+                    'sql': sql,
+                    'duration_ms': round((perf_counter() - started) * 1000, 3),
+                })
+
+
+def save_profile(request, view, duration, sampler, query_log):
+    directory = settings.PROFILER_DIR
+    os.makedirs(directory, exist_ok=True)
+    created = timezone.now()
+    name = (
+        f'{created:%Y%m%d-%H%M%S}-{view}-{int(duration * 1000)}ms-'
+        f'{os.getpid()}'
+    )
+    with open(os.path.join(directory, f'{name}.collapsed'), 'w') as file:
+        for stack, count in sampler.stacks.most_common():
+            file.write(f'{stack} {count}\n')
+    with open(os.path.join(directory, f'{name}.json'), 'w') as file:
+        json.dump({
+            'created': created.isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': view,
+            'duration_ms': round(duration * 1000, 1),
+            'interval_ms': settings.PROFILER_INTERVAL_MS,
+            'samples': sum(sampler.stacks.values()),
+            'queries': query_log.queries,
+        }, file, ensure_ascii=False, indent=1)
+
+
+def should_save(view, duration):
+    return (
+        duration * 1000 >= settings.PROFILER_THRESHOLD_MS
+        and view.split('.', 1)[0] in settings.PROFILER_VIEWS
+    )
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    """Профилирует долю запросов и сохраняет профили медленных."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return await get_response(request)
+        return middleware
+
+    def middleware(request):
+        if (
+            not settings.PROFILER_ENABLED
+            or random.random() >= settings.PROFILER_SAMPLE_RATE
+        ):
+            return get_response(request)
+        sampler = Sampler(
+            threading.get_ident(), settings.PROFILER_INTERVAL_MS / 1000
+        )
+        query_log = QueryLog()
+        started = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_log))
+            sampler.start()
+            try:
+                response = get_response(request)
+            finally:
+                sampler.stop()
+        duration = perf_counter() - started
+        view = get_view_label(request)
+        if should_save(view, duration):
+            save_profile(request, view, duration, sampler, query_log)
+        return response
+    return middleware
@@ -56,6 +56,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.database_metrics_middleware',
+    'foodgram.middleware.database_routing_middleware',
+    'foodgram.conditional.conditional_middleware',
+    'foodgram.profiler.profiling_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -99,10 +103,170 @@ DATABASES = {
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        # Соединение живёт между запросами и проверяется перед повторным
+        # использованием; 0 — закрывать после каждого запроса.
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        # За PgBouncer в режиме transaction серверные курсоры не работают.
+        'DISABLE_SERVER_SIDE_CURSORS': config(
+            'DB_PGBOUNCER', default=False, cast=bool
+        ),
     }
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS=replica1,replica2 создаёт алиасы
+# replica1, replica2 с теми же параметрами, что и default.
+for number, host in enumerate(
+    config('DB_REPLICA_HOSTS', default='', cast=Csv()), start=1
+):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'NAME': config('DB_REPLICA_NAME', default=DATABASES['default']['NAME']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['foodgram.db_routers.ReplicaRouter']
+
+# Сколько секунд после записи клиент читает с основной базы.
+DB_PIN_SECONDS = config('DB_PIN_SECONDS', default=10, cast=int)
+
+# Заголовки Server-Timing / X-DB-* с числом запросов к базе в ответах.
+DB_METRICS_HEADERS = config('DB_METRICS_HEADERS', default=DEBUG, cast=bool)
+
+# Метрики Prometheus на /api/metrics. METRICS_DIR — общий каталог, через
+# который складываются метрики всех воркеров; METRICS_TOKEN — эндпоинт
+# требует заголовок `Authorization: Bearer <токен>`, без токена отдаёт 404.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=5, cast=int)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Снимок другого хоста (контейнера), не обновлявшийся столько секунд,
+# считается снимком остановленного процесса и удаляется.
+METRICS_STALE_SECONDS = config(
+    'METRICS_STALE_SECONDS', default=24 * 60 * 60, cast=int
+)
+
+# Выборочный профилировщик медленных запросов (по умолчанию выключен).
+PROFILER_ENABLED = config('PROFILER_ENABLED', default=False, cast=bool)
+PROFILER_SAMPLE_RATE = config('PROFILER_SAMPLE_RATE', default=0.01, cast=float)
+PROFILER_THRESHOLD_MS = config('PROFILER_THRESHOLD_MS', default=500, cast=int)
+PROFILER_INTERVAL_MS = config('PROFILER_INTERVAL_MS', default=5, cast=int)
+PROFILER_VIEWS = config(
+    'PROFILER_VIEWS', default='RecipeViewSet,MyUserViewSet', cast=Csv()
+)
+PROFILER_DIR = config('PROFILER_DIR', default=os.path.join(BASE_DIR, 'profiles'))
+
+# Лимиты запросов (api.throttling): действие -> скорость, ёмкость корзины
+# и ключ (`user` — по пользователю, для анонимов по IP; `ip` — по IP).
+THROTTLE_BUCKETS = {
+    'IngredientViewSet.list': {'rate': '20/s', 'burst': 40, 'key': 'ip'},
+    'RecipeViewSet.download_shopping_cart': {'rate': '6/m', 'burst': 3},
+    'RecipeViewSet.bulk': {'rate': '6/m', 'burst': 3},
+    'RecipeViewSet.fork': {'rate': '1/s', 'burst': 10},
+    'RecipeViewSet.favorite': {'rate': '2/s', 'burst': 20},
+    'RecipeViewSet.favorite_batch': {'rate': '1/s', 'burst': 5},
+    'RecipeViewSet.shopping_cart': {'rate': '2/s', 'burst': 20},
+    'RecipeViewSet.shopping_cart_batch': {'rate': '1/s', 'burst': 5},
+    'MyUserViewSet.subscribe': {'rate': '2/s', 'burst': 20},
+    'TokenCreateView.post': {'rate': '10/m', 'burst': 10, 'key': 'ip'},
+    'IngredientViewSet.dump': {'rate': '6/m', 'burst': 3, 'key': 'ip'},
+    'TagViewSet.dump': {'rate': '6/m', 'burst': 3, 'key': 'ip'},
+}
+# Общий для воркеров каталог, через который корзины синхронизируются.
+THROTTLE_DIR = config('THROTTLE_DIR', default='')
+THROTTLE_SYNC_SECONDS = config('THROTTLE_SYNC_SECONDS', default=1, cast=float)
+
+# Общий для всех воркеров кеш: метки версий для ETag, привязка к основной
+# базе. LocMemCache годится только для одного процесса.
+CACHES = {
+    'default': {
+        'BACKEND': config(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    }
+}
+
+# ETag и Cache-Control (foodgram.conditional): действие -> группы данных,
+# от которых зависит ответ, и max-age для анонимных запросов.
+RECIPE_VERSIONS = ('recipes', 'tags', 'ingredients', 'users')
+HTTP_CACHE_VIEWS = {
+    'TagViewSet.list': {'versions': ('tags',), 'max_age': 300},
+    'TagViewSet.retrieve': {'versions': ('tags',), 'max_age': 300},
+    'IngredientViewSet.list': {'versions': ('ingredients',), 'max_age': 300},
+    'IngredientViewSet.retrieve': {
+        'versions': ('ingredients',), 'max_age': 300
+    },
+    'IngredientViewSet.dump': {'versions': ('ingredients',), 'max_age': 300},
+    'TagViewSet.dump': {'versions': ('tags',), 'max_age': 300},
+    'RecipeViewSet.list': {'versions': RECIPE_VERSIONS, 'max_age': 10},
+    'RecipeViewSet.retrieve': {'versions': RECIPE_VERSIONS, 'max_age': 10},
+}
+# Меняется при выкладке, если поменялся формат ответов.
+HTTP_CACHE_SALT = config('HTTP_CACHE_SALT', default='1')
+HTTP_CACHE_VERSION_TIMEOUT = config(
+    'HTTP_CACHE_VERSION_TIMEOUT', default=300, cast=int
+)
+HTTP_COMPRESS_MIN_SIZE = config('HTTP_COMPRESS_MIN_SIZE', default=1024, cast=int)
+HTTP_GZIP_LEVEL = config('HTTP_GZIP_LEVEL', default=5, cast=int)
+HTTP_BROTLI_QUALITY = config('HTTP_BROTLI_QUALITY', default=4, cast=int)
+
+# Журнал изменений рецептов (/api/recipes/changes/): сколько секунд ждать
+# возможных незакоммиченных транзакций и сколько записей отдавать за раз.
+CHANGES_LAG_SECONDS = config('CHANGES_LAG_SECONDS', default=2, cast=int)
+CHANGES_PAGE_SIZE = config('CHANGES_PAGE_SIZE', default=500, cast=int)
+
+# Фильтры is_favorited / is_in_shopping_cart передают id из кеша
+# Membership списком, пока их не больше этого числа, иначе — подзапросом.
+MEMBERSHIP_IN_LIMIT = config('MEMBERSHIP_IN_LIMIT', default=500, cast=int)
+
+# Мягкие лимиты списков без пагинации. Больше лимита — только явная
+# потоковая выгрузка /dump/, которая читает таблицу частями.
+INGREDIENTS_LIST_LIMIT = config('INGREDIENTS_LIST_LIMIT', default=100, cast=int)
+TAGS_LIST_LIMIT = config('TAGS_LIST_LIMIT', default=100, cast=int)
+DUMP_CHUNK_SIZE = config('DUMP_CHUNK_SIZE', default=1000, cast=int)
+# Рецепты автора в подписках: без recipes_limit и предел для него.
+SUBSCRIPTION_RECIPES_LIMIT = config(
+    'SUBSCRIPTION_RECIPES_LIMIT', default=10, cast=int
+)
+SUBSCRIPTION_RECIPES_MAX = config(
+    'SUBSCRIPTION_RECIPES_MAX', default=50, cast=int
+)
+
+# Поток событий SSE (api/streams.py, только под ASGI). EVENTS_BACKEND:
+# postgres — между процессами через LISTEN/NOTIFY, local — только внутри
+# процесса.
+EVENTS_PATH = '/api/async/events/'
+EVENTS_BACKEND = config(
+    'EVENTS_BACKEND',
+    default=(
+        'postgres' if 'postgresql' in DATABASES['default']['ENGINE']
+        else 'local'
+    )
+)
+EVENTS_CHANNEL = config('EVENTS_CHANNEL', default='foodgram_events')
+EVENTS_HEARTBEAT_SECONDS = config(
+    'EVENTS_HEARTBEAT_SECONDS', default=25, cast=int
+)
+EVENTS_RETRY_MS = config('EVENTS_RETRY_MS', default=5000, cast=int)
+EVENTS_QUEUE_SIZE = config('EVENTS_QUEUE_SIZE', default=100, cast=int)
+EVENTS_MAX_RECIPES = config('EVENTS_MAX_RECIPES', default=200, cast=int)
+EVENTS_MAX_CONNECTIONS = config(
+    'EVENTS_MAX_CONNECTIONS', default=10000, cast=int
+)
+# Срок жизни билета для ?ticket= и как часто ASGI-процесс сообщает в кеш,
+# какие каналы у него слушают (без слушателей события не публикуются).
+EVENTS_TICKET_SECONDS = config('EVENTS_TICKET_SECONDS', default=60, cast=int)
+EVENTS_LISTENERS_SECONDS = config(
+    'EVENTS_LISTENERS_SECONDS', default=30, cast=int
+)
+
 
 
 # Password validation
@@ -130,9 +294,16 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'SEARCH_PARAM': 'name',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
+    'DEFAULT_THROTTLE_CLASSES': ('api.throttling.TokenBucketThrottle',),
+    # nginx передаёт адрес клиента в X-Forwarded-For.
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
 
 }
 
@@ -169,6 +340,9 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Файлы называются по хешу содержимого (foodgram/storage.py); сиротские
+# удаляет manage.py collect_media.
+DEFAULT_FILE_STORAGE = 'foodgram.storage.ContentAddressedStorage'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
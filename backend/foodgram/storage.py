@@ -0,0 +1,53 @@
+"""Хранилище файлов с адресацией по содержимому.
+
+Имя файла — SHA-256 содержимого: `recipes/ab/ab12…ef.png` (каталог из
+`upload_to`, подкаталог из первых двух символов хеша, расширение
+исходного файла). Одинаковые картинки — копии рецептов, повторная
+загрузка той же картинки при редактировании — пишутся на диск один
+раз. Содержимое файла по такому имени никогда не меняется, поэтому
+nginx отдаёт `/media/` с `Cache-Control: immutable`.
+
+Удалением файлов занимается только `manage.py collect_media` по
+счётчикам ссылок из `recipes.media`.
+"""
+import hashlib
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, в котором имя файла — хеш его содержимого."""
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = posixpath.splitext(filename)[1].lower()
+        hexdigest = digest.hexdigest()
+        return posixpath.join(
+            directory, hexdigest[:2], f'{hexdigest}{extension}'
+        )
+
+    def save(self, name, content, max_length=None):
+        from recipes.media import touch
+
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        validate_file_name(name, allow_relative_path=True)
+        # Запись о файле появляется раньше файла: сборщик мусора не
+        # удалит файл, который только что понадобился снова.
+        touch(name, content.size)
+        if not self.exists(name):
+            saved = super().save(name, content, max_length)
+            if saved != name:
+                # Тот же файл одновременно записал другой процесс.
+                self.delete(saved)
+        return name
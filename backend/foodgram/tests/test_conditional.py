@@ -0,0 +1,64 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from foodgram import versions
+from foodgram.conditional import conditional_middleware
+from foodgram.db_routers import ReplicaRouter
+from foodgram.middleware import database_routing_middleware
+from recipes.models import Tag
+
+
+@override_settings(DB_PIN_SECONDS=10)
+class EtagReplicaTest(SimpleTestCase):
+    """Тело под свежим ETag читается с основной базы."""
+
+    def setUp(self):
+        cache.clear()
+        replica_router = next(
+            item for item in router.routers
+            if isinstance(item, ReplicaRouter)
+        )
+        patcher = mock.patch.object(replica_router, 'replicas', ['replica1'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self):
+        used = {}
+
+        def view(request):
+            used['read'] = Tag.objects.all().db
+            return HttpResponse(b'[]', content_type='application/json')
+
+        middleware = database_routing_middleware(conditional_middleware(view))
+        response = middleware(RequestFactory().get('/api/tags/'))
+        return response, used['read']
+
+    def set_stamp(self, age):
+        cache.set(
+            versions.key('tags'),
+            f'{int(time.time() - age):x}.00000000',
+            300
+        )
+
+    def test_recent_change_reads_from_primary(self):
+        self.set_stamp(age=1)
+        response, read = self.get()
+        self.assertEqual(read, DEFAULT_DB_ALIAS)
+        self.assertIn('ETag', response)
+
+    def test_old_change_reads_from_replica(self):
+        self.set_stamp(age=60)
+        response, read = self.get()
+        self.assertEqual(read, 'replica1')
+        self.assertIn('ETag', response)
+
+    def test_bump_makes_stamp_recent(self):
+        self.set_stamp(age=60)
+        versions.bump(['tags'])
+        _, read = self.get()
+        self.assertEqual(read, DEFAULT_DB_ALIAS)
@@ -0,0 +1,69 @@
+from unittest import mock
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import SimpleTestCase
+from rest_framework.authtoken.models import Token
+
+from foodgram.db_routers import ReplicaRouter, read_from_replica
+from recipes.models import Recipe
+
+
+def make_router(aliases):
+    """Роутер для базы default и реплик `aliases`."""
+    databases = {
+        alias: settings.DATABASES[DEFAULT_DB_ALIAS]
+        for alias in (DEFAULT_DB_ALIAS, *aliases)
+    }
+    with mock.patch.object(settings, 'DATABASES', databases):
+        return ReplicaRouter()
+
+
+class ReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = make_router(['replica1'])
+
+    def read(self, model, replica):
+        token = read_from_replica.set(replica)
+        try:
+            return self.router.db_for_read(model)
+        finally:
+            read_from_replica.reset(token)
+
+    def test_replica_aliases(self):
+        self.assertEqual(self.router.replicas, ['replica1'])
+
+    def test_safe_request_reads_from_replica(self):
+        self.assertEqual(self.read(Recipe, True), 'replica1')
+
+    def test_other_reads_from_primary(self):
+        self.assertEqual(self.read(Recipe, False), DEFAULT_DB_ALIAS)
+
+    def test_primary_only_models(self):
+        self.assertEqual(self.read(Token, True), DEFAULT_DB_ALIAS)
+
+    def test_reads_inside_transaction_from_primary(self):
+        with mock.patch.object(
+            connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True
+        ):
+            self.assertEqual(self.read(Recipe, True), DEFAULT_DB_ALIAS)
+
+    def test_writes_and_migrations_on_primary(self):
+        token = read_from_replica.set(True)
+        try:
+            self.assertEqual(
+                self.router.db_for_write(Recipe), DEFAULT_DB_ALIAS
+            )
+        finally:
+            read_from_replica.reset(token)
+        self.assertTrue(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'recipes'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'recipes'))
+
+    def test_without_replicas(self):
+        router = make_router([])
+        token = read_from_replica.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Recipe), DEFAULT_DB_ALIAS)
+        finally:
+            read_from_replica.reset(token)
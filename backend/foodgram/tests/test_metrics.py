@@ -0,0 +1,99 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from foodgram import metrics
+from users.models import MyUser
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+
+class CollectSnapshotsTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(
+            METRICS_DIR=self.directory, METRICS_STALE_SECONDS=60
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write(self, host, pid, age=0):
+        path = os.path.join(self.directory, f'{host}-{pid}.json')
+        with open(path, 'w') as file:
+            json.dump({
+                'counters': [['foodgram_db_connections_opened_total', [], 1]],
+                'histograms': [],
+            }, file)
+        modified = time.time() - age
+        os.utime(path, (modified, modified))
+        return path
+
+    def test_dead_snapshots_are_removed(self):
+        host = socket.gethostname()
+        dead = self.write(host, dead_pid())
+        stale = self.write('other-host', 1, age=120)
+        fresh = self.write('other-host', 2)
+        counters, _ = metrics.collect()
+        self.assertFalse(os.path.exists(dead))
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertTrue(os.path.exists(
+            os.path.join(self.directory, f'{host}-{os.getpid()}.json')
+        ))
+        own = dict(metrics.counters).get(
+            ('foodgram_db_connections_opened_total', ()), 0
+        )
+        self.assertEqual(
+            counters[('foodgram_db_connections_opened_total', ())], own + 1
+        )
+
+
+class CacheMetricsTest(TestCase):
+
+    def test_cache_requests_have_view_label(self):
+        # Закрепление за базой проверяется до выбора представления.
+        cache.clear()
+        user = MyUser.objects.create_user(
+            username='reader', email='reader@example.com', password='x'
+        )
+        client = APIClient()
+        client.force_login(user)
+        before = dict(metrics.counters)
+        self.assertEqual(client.get('/api/recipes/').status_code, 200)
+        key = ('foodgram_cache_requests_total', (
+            ('view', 'RecipeViewSet.list'),
+            ('cache', 'db_pin'),
+            ('result', 'miss'),
+        ))
+        self.assertEqual(metrics.counters[key] - before.get(key, 0), 1)
+
+
+class MetricsViewTest(SimpleTestCase):
+
+    @override_settings(METRICS_TOKEN='')
+    def test_closed_without_token(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 404)
+
+    @override_settings(METRICS_TOKEN='secret', METRICS_DIR='')
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+        response = self.client.get(
+            '/api/metrics', HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE', response.content)
@@ -0,0 +1,80 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from foodgram.db_routers import ReplicaRouter
+from foodgram.middleware import PIN_COOKIE, database_routing_middleware
+from recipes.models import Recipe
+
+
+@override_settings(DB_PIN_SECONDS=10)
+class DatabaseRoutingMiddlewareTest(SimpleTestCase):
+    """Какая база читается и пишется внутри запроса."""
+
+    def setUp(self):
+        cache.clear()
+        replica_router = next(
+            item for item in router.routers
+            if isinstance(item, ReplicaRouter)
+        )
+        patcher = mock.patch.object(replica_router, 'replicas', ['replica1'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = RequestFactory()
+
+    def call(self, method, status=200, token='first', cookies=None):
+        """Выполняет запрос; возвращает (ответ, база чтения, база записи)."""
+        used = {}
+
+        def view(request):
+            used['read'] = Recipe.objects.all().db
+            used['write'] = router.db_for_write(Recipe)
+            return HttpResponse(status=status)
+
+        request = getattr(self.factory, method)(
+            '/api/recipes/', HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        request.COOKIES.update(cookies or {})
+        response = database_routing_middleware(view)(request)
+        return response, used['read'], used['write']
+
+    def test_safe_methods_read_from_replica(self):
+        for method in ('get', 'head', 'options'):
+            with self.subTest(method=method):
+                _, read, write = self.call(method)
+                self.assertEqual(read, 'replica1')
+                self.assertEqual(write, DEFAULT_DB_ALIAS)
+
+    def test_writes_use_primary(self):
+        for method in ('post', 'put', 'patch', 'delete'):
+            with self.subTest(method=method):
+                _, read, write = self.call(method, status=201)
+                self.assertEqual(read, DEFAULT_DB_ALIAS)
+                self.assertEqual(write, DEFAULT_DB_ALIAS)
+
+    def test_reads_after_write_by_cookie(self):
+        response, _, _ = self.call('post', status=201)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 10)
+        cache.clear()
+        _, read, _ = self.call(
+            'get', cookies={PIN_COOKIE: response.cookies[PIN_COOKIE].value}
+        )
+        self.assertEqual(read, DEFAULT_DB_ALIAS)
+
+    def test_reads_after_write_by_cache_key(self):
+        self.call('post', status=201)
+        # Другой клиент того же пользователя: cookie нет, токен тот же.
+        _, read, _ = self.call('get')
+        self.assertEqual(read, DEFAULT_DB_ALIAS)
+        _, read, _ = self.call('get', token='second')
+        self.assertEqual(read, 'replica1')
+
+    def test_failed_write_does_not_pin(self):
+        response, _, _ = self.call('post', status=400)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        _, read, _ = self.call('get')
+        self.assertEqual(read, 'replica1')
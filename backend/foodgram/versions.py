@@ -0,0 +1,135 @@
+"""Версии данных для ETag.
+
+Каждой группе данных (`tags`, `ingredients`, `recipes`, `users`) и
+каждому пользователю (`user:<id>` — его избранное, корзина и подписки)
+соответствует случайная метка в кеше. Любое изменение меняет метку, и
+ETag ответов, которые от неё зависят, перестаёт совпадать. Метки живут
+`HTTP_CACHE_VERSION_TIMEOUT` секунд: изменение, о котором никто не
+сообщил, устаревает не дольше этого срока.
+
+Изменения через модели (save/delete, теги рецепта) отслеживаются
+сигналами. Массовые операции (bulk_create, update, remove_links)
+сигналов не шлют и вызывают `changed()` сами.
+
+Во время запроса метки меняются после ответа, когда все записи запроса
+уже выполнены; иначе — после коммита транзакции.
+
+Метка начинается со времени её создания (`<секунды hex>.<случайная
+часть>`): по ней видно, что данные изменились недавно и реплики могли
+их ещё не получить (`is_recent`).
+"""
+import secrets
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+MODEL_VERSIONS = {
+    'recipes.tag': 'tags',
+    'recipes.ingredient': 'ingredients',
+    'recipes.recipe': 'recipes',
+    'recipes.recipeingredient': 'recipes',
+    'users.myuser': 'users',
+}
+# Модели, изменения которых видны только владельцу (поле user).
+USER_MODELS = ('recipes.favorite', 'recipes.shopinglist', 'users.follow')
+
+# Метки, изменённые в текущем запросе; None вне запроса.
+pending = ContextVar('pending_versions', default=None)
+
+
+def key(name):
+    return f'version:{name}'
+
+
+def new_stamp():
+    return f'{int(time.time()):x}.{secrets.token_hex(4)}'
+
+
+def is_recent(stamps, seconds):
+    """Создана ли какая-то из меток меньше `seconds` секунд назад.
+
+    Метки без времени (старого формата) считаются недавними.
+    """
+    now = time.time()
+    for stamp in stamps:
+        created, dot, _ = stamp.partition('.')
+        try:
+            if not dot or now - int(created, 16) < seconds:
+                return True
+        except ValueError:
+            return True
+    return False
+
+
+def get_versions(names):
+    """Текущие метки групп `names` (недостающие создаются)."""
+    keys = [key(name) for name in names]
+    found = cache.get_many(keys)
+    for missing in set(keys) - set(found):
+        stamp = new_stamp()
+        if not cache.add(
+            missing, stamp, settings.HTTP_CACHE_VERSION_TIMEOUT
+        ):
+            stamp = cache.get(missing, stamp)
+        found[missing] = stamp
+    return [found[item] for item in keys]
+
+
+def bump(names):
+    cache.set_many(
+        {key(name): new_stamp() for name in names},
+        settings.HTTP_CACHE_VERSION_TIMEOUT
+    )
+
+
+def changed(model, user_id=None):
+    """Сообщает, что данные модели изменились."""
+    label = model._meta.label_lower
+    if label in USER_MODELS:
+        if user_id is None:
+            return
+        name = f'user:{user_id}'
+    else:
+        name = MODEL_VERSIONS.get(label)
+        if name is None:
+            return
+    mark(name)
+
+
+def mark(name):
+    names = pending.get()
+    if names is not None:
+        names.add(name)
+    else:
+        transaction.on_commit(lambda: bump([name]))
+
+
+def model_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    changed(sender, getattr(instance, 'user_id', None))
+
+
+def model_deleted(sender, instance, **kwargs):
+    changed(sender, getattr(instance, 'user_id', None))
+
+
+def tags_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        mark('recipes')
+
+
+def connect_signals():
+    from recipes.models import Recipe
+
+    # Для связей пользователя post_delete нужен ради удалений из админки
+    # и каскадов (рецепт, пользователь); remove_links пишет DELETE сам и
+    # сигналов не шлёт.
+    for label in (*MODEL_VERSIONS, *USER_MODELS):
+        post_save.connect(model_saved, sender=label)
+        post_delete.connect(model_deleted, sender=label)
+    m2m_changed.connect(tags_changed, sender=Recipe.tags.through)
@@ -1,7 +1,21 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.views.main import ChangeList
+from django.db.models import Count
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils.html import format_html
+
+from foodgram.admin_utils import AuthorFilter, BigTableAdmin, UserFilter
+from .duplicates import (find_duplicates, merge_ingredients, merge_ratios,
+                         target_order, usage_counts)
+from .models import Recipe, Ingredient, Tag, RecipeIngredient, Favorite, ShopingList
+from .totals import update_ingredient_recipes_totals, update_recipe_totals
 
+MAX_DUPLICATE_MESSAGES = 20
+# Сколько затронутых рецептов перечислять на странице подтверждения.
+MAX_MERGE_RECIPES = 50
 
-from .models import Recipe, Ingredient, Tag, RecipeIngredient, Favorite, ShopingList
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -18,38 +32,181 @@ class TagAdmin(admin.ModelAdmin):
 
 class IngredientsInRecipeInline(admin.TabularInline):
     model = Recipe.ingredients.through
+    autocomplete_fields = ('ingredient',)
+    extra = 1
 
 
-class IngredientAdmin(admin.ModelAdmin):
-    inlines = [
-        IngredientsInRecipeInline,
-    ]
+class IngredientAdmin(BigTableAdmin):
     list_display = ('id', 'name', 'measurement_unit')
-    list_filter = ('name',)
+    search_fields = ('^name',)
     empty_value_display = '-empty-'
-
-
-class RecipeAdmin(admin.ModelAdmin):
+    readonly_fields = ('recipes_link',)
+    actions = ('find_duplicates', 'merge_selected')
+
+    @admin.action(description='Найти похожие среди выбранных')
+    def find_duplicates(self, request, queryset):
+        groups = find_duplicates(queryset)
+        for group in groups[:MAX_DUPLICATE_MESSAGES]:
+            target, *duplicates = group['ingredients']
+            self.message_user(request, (
+                f'{group["score"]:.2f}: {target} (id {target.pk}) <- '
+                + '; '.join(
+                    f'{duplicate} (id {duplicate.pk})'
+                    for duplicate in duplicates
+                )
+                + ('' if group['mergeable'] else ' [разные единицы]')
+            ))
+        self.message_user(request, f'Найдено групп: {len(groups)}.')
+
+    @admin.action(description='Объединить выбранные в самый используемый')
+    def merge_selected(self, request, queryset):
+        """Как delete_selected: сначала страница подтверждения."""
+        ingredients = list(queryset)
+        if len(ingredients) < 2:
+            self.message_user(
+                request, 'Выберите хотя бы два ингредиента.', messages.ERROR
+            )
+            return None
+        usage = usage_counts([ingredient.pk for ingredient in ingredients])
+        target, *duplicates = sorted(
+            ingredients, key=lambda item: target_order(item, usage)
+        )
+        try:
+            merge_ratios(target, duplicates)
+        except ValueError as error:
+            self.message_user(request, str(error), messages.ERROR)
+            return None
+        if request.POST.get('post'):
+            recipes = merge_ingredients(target, duplicates)
+            self.message_user(
+                request,
+                f'Объединено в «{target}»: {len(duplicates)}, '
+                f'затронуто рецептов: {recipes}.',
+                messages.SUCCESS
+            )
+            return None
+
+        groups = find_duplicates(queryset)
+        recipes = Recipe.objects.filter(
+            recipe_ingredients__ingredient__in=ingredients
+        ).distinct().order_by('name')
+        return TemplateResponse(
+            request,
+            'admin/recipes/ingredient/merge_confirmation.html',
+            {
+                **self.admin_site.each_context(request),
+                'title': 'Объединить ингредиенты?',
+                'opts': self.model._meta,
+                'queryset': ingredients,
+                'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+                'target': (target, usage[target.pk]),
+                'duplicates': [
+                    (duplicate, usage[duplicate.pk])
+                    for duplicate in duplicates
+                ],
+                # Все выбранные — одна группа похожих названий.
+                'similar': len(groups) == 1 and len(
+                    groups[0]['ingredients']
+                ) == len(ingredients),
+                'recipes': recipes[:MAX_MERGE_RECIPES],
+                'recipes_count': recipes.count(),
+            }
+        )
+
+    def recipes_link(self, obj):
+        """Ссылка на постраничный список рецептов вместо inline"""
+        if obj.pk is None:
+            return '-'
+        url = reverse('admin:recipes_recipeingredient_changelist')
+        return format_html(
+            '<a href="{}?ingredient__id__exact={}">Рецепты ({})</a>',
+            url, obj.pk, obj.recipe_ingredients.count()
+        )
+
+    recipes_link.short_description = 'Используется в рецептах'
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_ingredient_recipes_totals([form.instance.pk])
+
+
+class RecipeChangeList(ChangeList):
+    """Число добавлений в избранное считается только для рецептов
+    текущей страницы одним запросом, а не агрегатом по всей таблице."""
+
+    def get_results(self, request):
+        super().get_results(request)
+        recipes = list(self.result_list)
+        counts = dict(
+            Favorite.objects.filter(
+                recipe_id__in=[recipe.pk for recipe in recipes]
+            ).order_by().values('recipe_id').annotate(
+                total=Count('id')
+            ).values_list('recipe_id', 'total')
+        )
+        for recipe in recipes:
+            recipe.favorites_count = counts.get(recipe.pk, 0)
+
+
+class RecipeAdmin(BigTableAdmin):
     inlines = [
         IngredientsInRecipeInline,
     ]
     exclude = ('ingredients',)
     list_display = ('id', 'author', 'name', 'count_favorite')
-    list_filter = ('author', 'name', 'tags')
+    list_select_related = ('author',)
+    list_filter = (AuthorFilter, 'tags')
+    search_fields = ('name',)
+    autocomplete_fields = ('author', 'tags')
     empty_value_display = '-empty-'
 
     readonly_fields = ('count_favorite',)
 
+    def get_changelist(self, request, **kwargs):
+        return RecipeChangeList
+
     def count_favorite(self, obj):
-        return obj.favorite.all().count()
+        if hasattr(obj, 'favorites_count'):
+            return obj.favorites_count
+        return obj.favorite.count()
 
     count_favorite.short_description = 'Избранных'
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_recipe_totals([form.instance.pk])
+
+
+class RecipeIngredientAdmin(BigTableAdmin):
+    list_display = ('id', 'recipe', 'ingredient', 'amount')
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        update_recipe_totals([obj.recipe_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        update_recipe_totals([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        update_recipe_totals(recipe_ids)
+
+
+class UserRecipeAdmin(BigTableAdmin):
+    list_display = ('id', 'user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    list_filter = (UserFilter,)
+    autocomplete_fields = ('user', 'recipe')
+
 
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
-admin.site.register(RecipeIngredient)
-admin.site.register(Favorite)
-admin.site.register(ShopingList)        
+admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
+admin.site.register(Favorite, UserRecipeAdmin)
+admin.site.register(ShopingList, UserRecipeAdmin)        
 
 
@@ -0,0 +1,112 @@
+"""Журнал изменений рецептов для дельта-синхронизации.
+
+Каждое создание, изменение и удаление рецепта, его ингредиентов и тегов
+попадает в `RecipeChange`; номер записи монотонно растёт и служит
+токеном синхронизации. Внутри транзакции события копятся и пишутся
+одним INSERT после коммита — по одной записи на рецепт, так что
+рецепт с десятью ингредиентами даёт одно событие, а откаченные
+изменения не попадают в журнал. Вне транзакции событие пишется сразу.
+
+Буфер транзакции — объект `ChangeBatch`, зарегистрированный через
+`transaction.on_commit`. Соединение хранит на него только слабую
+ссылку: при откате Django забывает обработчик, буфер освобождается, и
+следующая транзакция начинает новый.
+
+Сигналы ловят изменения через модели. Массовые операции (bulk_create,
+update) сигналов не шлют и вызывают `record()` сами.
+
+Сжатие и срок хранения — `manage.py compact_recipe_changes`. Новые
+рецепты сразу после записи публикуются в поток событий
+(`recipes.events`).
+"""
+import weakref
+
+from django.db import router, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .events import publish_recipes
+from .models import Recipe, RecipeChange, RecipeIngredient
+
+
+def write(events):
+    RecipeChange.objects.bulk_create(
+        RecipeChange(recipe_id=recipe_id, action=action)
+        for recipe_id, action in events.items()
+    )
+    created = [
+        recipe_id for recipe_id, action in events.items()
+        if action == RecipeChange.CREATED
+    ]
+    if created:
+        publish_recipes(created)
+
+
+class ChangeBatch:
+    """События рецептов одной транзакции: {id рецепта: действие}."""
+    __slots__ = ('events', 'written', '__weakref__')
+
+    def __init__(self):
+        self.events = {}
+        self.written = False
+
+    def __call__(self):
+        self.written = True
+        write(self.events)
+
+
+def get_batch(connection, using):
+    """Буфер текущей транзакции; новый, если прежний записан или откачен."""
+    ref = getattr(connection, 'recipe_changes', None)
+    batch = ref() if ref is not None else None
+    if batch is None or batch.written:
+        batch = ChangeBatch()
+        transaction.on_commit(batch, using=using)
+        connection.recipe_changes = weakref.ref(batch)
+    return batch
+
+
+def record(recipe_ids, action):
+    """Записывает событие `action` для рецептов `recipe_ids`."""
+    using = router.db_for_write(RecipeChange)
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        write(dict.fromkeys(recipe_ids, action))
+        return
+    events = get_batch(connection, using).events
+    for recipe_id in recipe_ids:
+        if action == RecipeChange.DELETED or recipe_id not in events:
+            events[recipe_id] = action
+
+
+def recipe_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        record(
+            [instance.pk],
+            RecipeChange.CREATED if created else RecipeChange.UPDATED
+        )
+
+
+def recipe_deleted(sender, instance, **kwargs):
+    record([instance.pk], RecipeChange.DELETED)
+
+
+def ingredient_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record([instance.recipe_id], RecipeChange.UPDATED)
+
+
+def tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        record([instance.pk], RecipeChange.UPDATED)
+    elif pk_set:
+        record(pk_set, RecipeChange.UPDATED)
+
+
+def connect_signals():
+    post_save.connect(recipe_saved, sender=Recipe)
+    post_delete.connect(recipe_deleted, sender=Recipe)
+    post_save.connect(ingredient_changed, sender=RecipeIngredient)
+    post_delete.connect(ingredient_changed, sender=RecipeIngredient)
+    m2m_changed.connect(tags_changed, sender=Recipe.tags.through)
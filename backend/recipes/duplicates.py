@@ -0,0 +1,297 @@
+"""Поиск и объединение дубликатов ингредиентов.
+
+Кандидаты находятся двумя способами:
+
+* одинаковый нормализованный ключ — регистр, «ё», пунктуация, лишние
+  пробелы и порядок слов не учитываются, единицы приводятся к одному
+  написанию («гр» -> «г», «кг» -> «г» с множителем 1000);
+* похожие названия — MinHash по символьным триграммам и LSH: подпись
+  режется на полосы, в пары попадают только ингредиенты с совпавшей
+  полосой, и для них считается точный коэффициент Жаккара. Время
+  работы почти линейно от размера каталога.
+
+Пары объединяются в группы (система непересекающихся множеств). Главный
+ингредиент группы — самый используемый в рецептах. Объединять можно
+только группы, единицы которых приводятся к одной базовой; остальные
+(«пекарский порошок, г» / «... , ч. л.») только показываются.
+"""
+import random
+import re
+import zlib
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .changes import record
+from .models import Ingredient, RecipeChange, RecipeIngredient
+from .totals import NUTRITION_FIELDS, update_recipe_totals
+
+SHINGLE_SIZE = 3
+NUM_PERM = 128
+BANDS = 32
+THRESHOLD = 0.7
+PRIME = (1 << 61) - 1
+SEED = 42
+
+UNIT_ALIASES = {
+    'гр': 'г',
+    'грамм': 'г',
+    'килограмм': 'кг',
+    'миллилитр': 'мл',
+    'литр': 'л',
+    'штука': 'шт',
+    'штуки': 'шт',
+    'ст л': 'ст л',
+    'столовая ложка': 'ст л',
+    'ч л': 'ч л',
+    'чайная ложка': 'ч л',
+}
+# Единица -> (базовая единица, сколько базовых в одной).
+UNIT_FACTORS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+
+WORD_RE = re.compile(r'[^\w%]+')
+
+
+def normalize_name(name):
+    words = WORD_RE.sub(' ', name.lower().replace('ё', 'е')).split()
+    return ' '.join(sorted(words))
+
+
+def normalize_unit(unit):
+    """Единица -> (базовая единица, множитель)."""
+    unit = ' '.join(WORD_RE.sub(' ', unit.lower()).split())
+    unit = UNIT_ALIASES.get(unit, unit)
+    return UNIT_FACTORS.get(unit, (unit, 1))
+
+
+def shingles(name):
+    text = f' {name} '
+    return {
+        zlib.crc32(text[start:start + SHINGLE_SIZE].encode())
+        for start in range(max(len(text) - SHINGLE_SIZE + 1, 1))
+    }
+
+
+def permutations(count=NUM_PERM, seed=SEED):
+    generator = random.Random(seed)
+    return [
+        (generator.randrange(1, PRIME), generator.randrange(0, PRIME))
+        for _ in range(count)
+    ]
+
+
+def signature(hashes, params):
+    """MinHash: минимум каждой хеш-функции по триграммам."""
+    return [
+        min((a * value + b) % PRIME for value in hashes)
+        for a, b in params
+    ]
+
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second)
+
+
+class DisjointSet:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent.setdefault(item, item)
+        if parent != item:
+            parent = self.parent[item] = self.find(parent)
+        return parent
+
+    def union(self, first, second):
+        self.parent[self.find(first)] = self.find(second)
+
+    def groups(self):
+        groups = defaultdict(list)
+        for item in self.parent:
+            groups[self.find(item)].append(item)
+        return [members for members in groups.values() if len(members) > 1]
+
+
+def candidate_pairs(items, threshold=THRESHOLD, bands=BANDS):
+    """Пары (id, id, сходство) из {id: нормализованное название}."""
+    params = permutations()
+    rows = NUM_PERM // bands
+    buckets = defaultdict(list)
+    grams = {}
+    for pk, name in items.items():
+        grams[pk] = shingles(name)
+        sign = signature(grams[pk], params)
+        for band in range(bands):
+            buckets[
+                band, tuple(sign[band * rows:(band + 1) * rows])
+            ].append(pk)
+
+    seen = set()
+    for members in buckets.values():
+        for index, first in enumerate(members):
+            for second in members[index + 1:]:
+                pair = (first, second) if first < second else (second, first)
+                if pair in seen:
+                    continue
+                seen.add(pair)
+                score = jaccard(grams[first], grams[second])
+                if score >= threshold:
+                    yield first, second, score
+
+
+def usage_counts(ingredient_ids):
+    """Сколько рецептов использует каждый ингредиент."""
+    return Counter(dict(
+        RecipeIngredient.objects.filter(
+            ingredient__in=ingredient_ids
+        ).values_list('ingredient').annotate(count=Count('pk')).order_by()
+    ))
+
+
+def target_order(ingredient, usage):
+    """Ключ сортировки: главным становится ингредиент в базовой единице,
+    а из них — самый используемый."""
+    return (
+        normalize_unit(ingredient.measurement_unit)[1],
+        -usage[ingredient.pk],
+        ingredient.pk,
+    )
+
+
+def find_duplicates(queryset=None, threshold=THRESHOLD, bands=BANDS):
+    """Группы похожих ингредиентов, главный — первый в группе.
+
+    Каждая группа — словарь: `ingredients` (главный первым), `usage`
+    (число рецептов по id), `score` (наименьшее сходство пары) и
+    `mergeable` (единицы приводятся к одной базовой).
+    """
+    if queryset is None:
+        queryset = Ingredient.objects.all()
+    ingredients = {
+        ingredient.pk: ingredient
+        for ingredient in queryset
+    }
+    names = {
+        pk: normalize_name(ingredient.name)
+        for pk, ingredient in ingredients.items()
+    }
+    units = {
+        pk: normalize_unit(ingredient.measurement_unit)
+        for pk, ingredient in ingredients.items()
+    }
+
+    links = DisjointSet()
+    scores = {}
+    by_name = defaultdict(list)
+    for pk, name in names.items():
+        by_name[name].append(pk)
+    for members in by_name.values():
+        for pk in members[1:]:
+            links.union(members[0], pk)
+    for first, second, score in candidate_pairs(names, threshold, bands):
+        links.union(first, second)
+        scores[first, second] = score
+
+    groups = links.groups()
+    usage = usage_counts([pk for members in groups for pk in members])
+    group_scores = defaultdict(list)
+    for (first, _), score in scores.items():
+        group_scores[links.find(first)].append(score)
+    result = []
+    for members in groups:
+        members.sort(key=lambda pk: target_order(ingredients[pk], usage))
+        result.append({
+            'ingredients': [ingredients[pk] for pk in members],
+            'usage': {pk: usage[pk] for pk in members},
+            'score': min(
+                group_scores[links.find(members[0])], default=1.0
+            ),
+            'mergeable': len({units[pk][0] for pk in members}) == 1,
+        })
+    result.sort(key=lambda group: -group['score'])
+    return result
+
+
+def merge_ratios(target, duplicates):
+    """{id дубликата: сколько единиц `target` в его единице}.
+
+    ValueError — единицу дубликата нельзя перевести в единицу `target`.
+    """
+    base, factor = normalize_unit(target.measurement_unit)
+    ratios = {}
+    for duplicate in duplicates:
+        unit, duplicate_factor = normalize_unit(duplicate.measurement_unit)
+        if unit != base or duplicate_factor % factor:
+            raise ValueError(
+                f'Нельзя перевести «{duplicate.measurement_unit}» '
+                f'в «{target.measurement_unit}».'
+            )
+        ratios[duplicate.pk] = duplicate_factor // factor
+    return ratios
+
+
+def merge_ingredients(target, duplicates):
+    """Переносит строки рецептов с `duplicates` на `target` и удаляет их.
+
+    Количества пересчитываются в единицу `target`; если в рецепте есть
+    несколько ингредиентов группы, их количества складываются. Всё
+    выполняется в одной транзакции. Возвращает число рецептов.
+    """
+    ratios = merge_ratios(target, duplicates)
+    duplicate_ids = list(ratios)
+    group = [target.pk, *duplicate_ids]
+    ratios[target.pk] = 1
+
+    with transaction.atomic():
+        list(Ingredient.objects.select_for_update().filter(pk__in=group))
+        rows = RecipeIngredient.objects.filter(ingredient__in=group)
+        shared = set(
+            rows.order_by().values('recipe').annotate(
+                count=Count('pk')
+            ).filter(count__gt=1).values_list('recipe', flat=True)
+        )
+        if shared:
+            totals = defaultdict(int)
+            for recipe_id, ingredient_id, amount in rows.filter(
+                recipe__in=shared
+            ).values_list('recipe', 'ingredient', 'amount'):
+                totals[recipe_id] += amount * ratios[ingredient_id]
+            rows.filter(recipe__in=shared).delete()
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe_id=recipe_id, ingredient=target, amount=amount
+                )
+                for recipe_id, amount in totals.items()
+            )
+        for ratio in set(ratios.values()) - {1}:
+            rows.filter(ingredient__in=[
+                pk for pk, value in ratios.items() if value == ratio
+            ]).update(amount=F('amount') * ratio)
+        recipe_ids = list(
+            RecipeIngredient.objects.filter(
+                ingredient__in=group
+            ).order_by().values_list('recipe', flat=True).distinct()
+        )
+        RecipeIngredient.objects.filter(
+            ingredient__in=duplicate_ids
+        ).update(ingredient=target)
+
+        missing = [
+            field for field in NUTRITION_FIELDS
+            if getattr(target, field) is None
+        ]
+        for duplicate in duplicates:
+            for field in list(missing):
+                value = getattr(duplicate, field)
+                if value is not None:
+                    setattr(target, field, value / ratios[duplicate.pk])
+                    missing.remove(field)
+        target.save()
+        Ingredient.objects.filter(pk__in=duplicate_ids).delete()
+        update_recipe_totals(recipe_ids)
+        record(recipe_ids, RecipeChange.UPDATED)
+    return len(recipe_ids)
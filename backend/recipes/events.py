@@ -0,0 +1,57 @@
+"""События рецептов для потока /api/async/events/.
+
+* `counters` в канал `recipe:<id>` — новое число добавлений рецепта в
+  избранное (`favorites`) или в списки покупок (`shopping_cart`);
+* `recipe` в канал `author:<id>` — автор опубликовал новый рецепт.
+"""
+from django.db.models import Count
+
+from foodgram import events
+
+from .models import Favorite, Recipe, ShopingList
+
+COUNTERS = {
+    Favorite: 'favorites',
+    ShopingList: 'shopping_cart',
+}
+
+
+def publish_counters(model, recipe_ids):
+    """Публикует счётчик `model` для рецептов `recipe_ids`.
+
+    Счётчики считаются только для рецептов, за которыми кто-то следит:
+    обычное добавление в избранное не стоит ни COUNT, ни `pg_notify`.
+    """
+    field = COUNTERS.get(model)
+    if field is None:
+        return
+    # id из URL приходят строками.
+    watched = events.listened(f'recipe:{int(pk)}' for pk in recipe_ids)
+    recipe_ids = [
+        pk for pk in sorted({int(pk) for pk in recipe_ids})
+        if f'recipe:{pk}' in watched
+    ]
+    if not recipe_ids:
+        return
+    counts = dict(
+        model.objects.filter(recipe__in=recipe_ids).values_list(
+            'recipe'
+        ).annotate(count=Count('pk')).order_by()
+    )
+    events.publish(
+        (f'recipe:{pk}', 'counters', {'id': pk, field: counts.get(pk, 0)})
+        for pk in recipe_ids
+    )
+
+
+def publish_recipes(recipe_ids):
+    """Публикует новые рецепты подписчикам их авторов."""
+    events.publish(
+        (
+            f'author:{author}', 'recipe',
+            {'id': pk, 'name': name, 'author': author}
+        )
+        for pk, name, author in Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).values_list('pk', 'name', 'author').order_by()
+    )
@@ -0,0 +1,167 @@
+from collections import defaultdict
+from math import sqrt
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from recipes.models import (Favorite, Recipe, RecipeChange, RecipeIngredient,
+                            RecipeSimilarity, ScoreCheckpoint, ShopingList)
+
+CHECKPOINT = 'similarity'
+BATCH_SIZE = 1000
+
+
+def load_matrix(queryset, row_field, column_field):
+    """Разреженная бинарная матрица: строка -> множество столбцов."""
+    rows = defaultdict(set)
+    for row, column in queryset.values_list(
+        row_field, column_field
+    ).iterator(chunk_size=BATCH_SIZE):
+        rows[row].add(column)
+    return rows
+
+
+def transpose(matrix):
+    columns = defaultdict(set)
+    for row, values in matrix.items():
+        for value in values:
+            columns[value].add(row)
+    return columns
+
+
+def cosine_neighbours(recipe_id, matrix, index):
+    """Косинусное сходство строки `recipe_id` со всеми остальными.
+
+    Пересечения считаются через обратный индекс, поэтому затрагиваются
+    только рецепты, у которых есть общие столбцы.
+    """
+    vector = matrix.get(recipe_id)
+    if not vector:
+        return {}
+    overlap = defaultdict(int)
+    for column in vector:
+        for other in index[column]:
+            if other != recipe_id:
+                overlap[other] += 1
+    norm = sqrt(len(vector))
+    return {
+        other: count / (norm * sqrt(len(matrix[other])))
+        for other, count in overlap.items()
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает таблицу похожих рецептов по совместным добавлениям '
+        'в избранное/список покупок и общим ингредиентам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k', type=int, default=20,
+            help='Сколько соседей хранить для каждого рецепта.'
+        )
+        parser.add_argument(
+            '--interactions-weight', type=float, default=0.7,
+            help='Вес сходства по пользователям (остальное — ингредиенты).'
+        )
+        parser.add_argument(
+            '--recipes', type=int, nargs='+',
+            help='Пересчитать только указанные рецепты.'
+        )
+        parser.add_argument(
+            '--changed', action='store_true',
+            help=(
+                'Пересчитать рецепты, у которых с прошлого запуска появились '
+                'новые добавления, новые и изменённые рецепты и рецепты, '
+                'в соседях которых есть изменённые.'
+            )
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        interactions = load_matrix(
+            Favorite.objects.all(), 'recipe_id', 'user_id'
+        )
+        for recipe_id, users in load_matrix(
+            ShopingList.objects.all(), 'recipe_id', 'user_id'
+        ).items():
+            interactions[recipe_id] |= users
+        ingredients = load_matrix(
+            RecipeIngredient.objects.all(), 'recipe_id', 'ingredient_id'
+        )
+        user_index = transpose(interactions)
+        ingredient_index = transpose(ingredients)
+
+        targets, full = self.get_targets(options)
+        weight = options['interactions_weight']
+        top_k = options['top_k']
+        rows = []
+        for recipe_id in targets:
+            scores = defaultdict(float)
+            for other, score in cosine_neighbours(
+                recipe_id, interactions, user_index
+            ).items():
+                scores[other] += weight * score
+            for other, score in cosine_neighbours(
+                recipe_id, ingredients, ingredient_index
+            ).items():
+                scores[other] += (1 - weight) * score
+            best = sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+            rows.extend(
+                RecipeSimilarity(
+                    recipe_id=recipe_id, similar_recipe_id=other, score=score
+                )
+                for other, score in best
+            )
+
+        with transaction.atomic():
+            stale = RecipeSimilarity.objects.all()
+            if not full:
+                stale = stale.filter(recipe_id__in=targets)
+            stale.delete()
+            RecipeSimilarity.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+            # После --recipes остальные рецепты не пересчитаны: отметка
+            # сдвинула бы --changed мимо их изменений.
+            if not options['recipes']:
+                ScoreCheckpoint.objects.update_or_create(
+                    name=CHECKPOINT, defaults={'computed_at': started}
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты пересчитаны: {len(targets)} рецептов, '
+            f'{len(rows)} связей'
+        ))
+
+    def get_targets(self, options):
+        """(id рецептов для пересчёта, пересчитываются ли все)."""
+        recipes = Recipe.objects.all()
+        if options['recipes']:
+            recipes = recipes.filter(pk__in=options['recipes'])
+            return list(recipes.values_list('pk', flat=True)), False
+        checkpoint = None
+        if options['changed']:
+            checkpoint = ScoreCheckpoint.objects.filter(
+                name=CHECKPOINT
+            ).first()
+        # Журнал изменений усечён после отметки: часть правок потеряна.
+        if checkpoint is None or RecipeChange.objects.filter(
+            action=RecipeChange.TRUNCATED,
+            created__gte=checkpoint.computed_at,
+        ).exists():
+            return list(recipes.values_list('pk', flat=True)), True
+        since = checkpoint.computed_at
+        # Правки ингредиентов видны только в журнале изменений.
+        edited = RecipeChange.objects.filter(
+            created__gt=since,
+            action__in=(RecipeChange.CREATED, RecipeChange.UPDATED),
+        ).values('recipe_id')
+        recipes = recipes.filter(
+            Q(pub_date__gt=since)
+            | Q(favorite__date_added__gt=since)
+            | Q(cart__date_add__gt=since)
+            | Q(pk__in=edited)
+            | Q(neighbours__similar_recipe_id__in=edited)
+        ).distinct()
+        return list(recipes.values_list('pk', flat=True)), False
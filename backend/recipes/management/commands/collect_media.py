@@ -0,0 +1,159 @@
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.models import MediaFile, Recipe
+
+UPLOAD_DIR = 'recipes'
+
+
+def walk(storage, directory):
+    """Имена всех файлов каталога хранилища, включая подкаталоги."""
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield f'{directory}/{name}'
+    for name in directories:
+        yield from walk(storage, f'{directory}/{name}')
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def reference_counts(names):
+    return Counter(
+        Recipe.objects.filter(image__in=names).values_list('image', flat=True)
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет файлы картинок, на которые не ссылается ни один рецепт. '
+        'Кандидаты — записи MediaFile с refs <= 0 старше срока ожидания; '
+        'перед удалением ссылки сверяются с рецептами, счётчики '
+        'исправляются. Работает пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Не трогать файлы, использованные позже этого срока.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Пауза между пачками в секундах.'
+        )
+        parser.add_argument(
+            '--rescan', action='store_true',
+            help=f'Сначала зарегистрировать файлы из media/{UPLOAD_DIR}/, '
+                 'которых нет в MediaFile (старые имена, откаты).'
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        self.storage = default_storage
+        self.options = options
+        if options['rescan']:
+            self.rescan()
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        candidates = MediaFile.objects.filter(refs__lte=0, updated__lt=cutoff)
+        removed = fixed = freed = 0
+        last_id = 0
+        while True:
+            batch = list(candidates.filter(id__gt=last_id).order_by(
+                'id'
+            ).values_list('id', 'name', 'size')[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            names = self.collect(batch, cutoff)
+            fixed += len(batch) - len(names)
+            removed += len(names)
+            freed += sum(size for _, name, size in batch if name in names)
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        prefix = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} файлов: {removed} ({freed / 1024 / 1024:.1f} МБ), '
+            f'исправлено счётчиков: {fixed}'
+        ))
+
+    def collect(self, batch, cutoff):
+        """Удаляет сирот пачки; возвращает множество их имён.
+
+        Файлы удаляются до коммита, пока строки MediaFile заблокированы:
+        touch() и retain() того же имени ждут коммита, после него
+        заводят новую запись, и хранилище записывает файл заново.
+        """
+        with transaction.atomic():
+            rows = dict(
+                MediaFile.objects.select_for_update(skip_locked=True).filter(
+                    id__in=[pk for pk, _, _ in batch],
+                    refs__lte=0,
+                    updated__lt=cutoff,
+                ).values_list('name', 'id')
+            )
+            counts = reference_counts(list(rows))
+            by_count = defaultdict(list)
+            for name, count in counts.items():
+                by_count[count].append(rows.pop(name))
+            if self.options['dry_run']:
+                return set(rows)
+            for count, ids in by_count.items():
+                MediaFile.objects.filter(id__in=ids).update(refs=count)
+            # Условие повторяется в DELETE: без блокировок строк (sqlite)
+            # запись, которую успели использовать снова, остаётся вместе
+            # с файлом. После DELETE строки уже не изменятся до коммита.
+            MediaFile.objects.filter(
+                id__in=rows.values(), refs__lte=0, updated__lt=cutoff
+            ).delete()
+            orphans = set(rows) - set(MediaFile.objects.filter(
+                id__in=rows.values()
+            ).values_list('name', flat=True))
+            for name in orphans:
+                self.storage.delete(name)
+        return orphans
+
+    def rescan(self):
+        registered = 0
+        for names in batched(
+            walk(self.storage, UPLOAD_DIR), self.options['batch_size']
+        ):
+            known = set(MediaFile.objects.filter(
+                name__in=names
+            ).values_list('name', flat=True))
+            missing = [name for name in names if name not in known]
+            if not missing or self.options['dry_run']:
+                registered += len(missing)
+                continue
+            counts = reference_counts(missing)
+            # Файлы старые, ждать срок ожидания для них не нужно.
+            long_ago = timezone.now() - timedelta(days=365)
+            MediaFile.objects.bulk_create(
+                [
+                    MediaFile(
+                        name=name,
+                        size=self.storage.size(name),
+                        refs=counts[name],
+                        updated=long_ago,
+                    )
+                    for name in missing
+                ],
+                ignore_conflicts=True
+            )
+            registered += len(missing)
+        self.stdout.write(f'Зарегистрировано файлов: {registered}')
@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from recipes.models import RecipeChange
+
+
+class Command(BaseCommand):
+    help = (
+        'Сжимает журнал изменений рецептов: оставляет по одной последней '
+        'записи на рецепт и удаляет записи старше срока хранения. Клиенты '
+        'с токеном старше удалённых записей получат 410 и синхронизируются '
+        'заново.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=30,
+            help='Срок хранения записей в днях.'
+        )
+
+    def handle(self, *args, **options):
+        changes = RecipeChange.objects.exclude(
+            action=RecipeChange.TRUNCATED
+        )
+        with transaction.atomic():
+            # Для клиента важно только последнее событие рецепта после
+            # его токена, поэтому более ранние можно удалить.
+            superseded, _ = changes.exclude(
+                id__in=changes.order_by().values('recipe_id').annotate(
+                    last=Max('id')
+                ).values('last')
+            ).delete()
+
+            expired = changes.filter(
+                created__lt=timezone.now() - timedelta(days=options['days'])
+            )
+            horizon = expired.aggregate(last=Max('id'))['last']
+            removed = 0
+            if horizon is not None:
+                removed, _ = expired.exclude(id=horizon).delete()
+                RecipeChange.objects.filter(
+                    action=RecipeChange.TRUNCATED
+                ).delete()
+                RecipeChange.objects.filter(id=horizon).update(
+                    action=RecipeChange.TRUNCATED
+                )
+                removed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено повторных записей: {superseded}, '
+            f'старых: {removed}; осталось: {changes.count()}'
+        ))
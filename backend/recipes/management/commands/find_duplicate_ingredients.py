@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.duplicates import (BANDS, NUM_PERM, THRESHOLD, find_duplicates,
+                                merge_ingredients)
+
+
+def describe(ingredient, usage):
+    return (
+        f'{ingredient.name}, {ingredient.measurement_unit} '
+        f'(id {ingredient.pk}, рецептов: {usage[ingredient.pk]})'
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Ищет дубликаты и похожие названия в каталоге ингредиентов '
+        '(нормализованный ключ + MinHash/LSH по триграммам) и предлагает '
+        'объединения; с --merge объединяет группы с совместимыми единицами '
+        'и достаточным сходством.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold', type=float, default=THRESHOLD,
+            help='Минимальное сходство Жаккара по триграммам.'
+        )
+        parser.add_argument(
+            '--bands', type=int, default=BANDS,
+            help=f'Число полос LSH (делитель {NUM_PERM}); больше полос — '
+                 'больше кандидатов с низким сходством.'
+        )
+        parser.add_argument(
+            '--merge', action='store_true',
+            help='Объединить найденные группы с совместимыми единицами.'
+        )
+        parser.add_argument(
+            '--merge-threshold', type=float, default=1.0,
+            help='С --merge объединять только группы, где сходство всех '
+                 'пар не ниже этого (1.0 — совпадающие ключи).'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        groups = find_duplicates(
+            threshold=options['threshold'], bands=options['bands']
+        )
+        elapsed = time.perf_counter() - started
+
+        merged = recipes = 0
+        for group in groups:
+            target, *duplicates = group['ingredients']
+            usage = group['usage']
+            status = '' if group['mergeable'] else '  [разные единицы]'
+            self.stdout.write(
+                f'{group["score"]:.2f}  {describe(target, usage)}{status}'
+            )
+            for duplicate in duplicates:
+                self.stdout.write(f'      <- {describe(duplicate, usage)}')
+            if (
+                options['merge']
+                and group['mergeable']
+                and group['score'] >= options['merge_threshold']
+            ):
+                recipes += merge_ingredients(target, duplicates)
+                merged += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Групп: {len(groups)}, поиск занял {elapsed:.2f} с'
+        ))
+        if options['merge']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Объединено групп: {merged}, затронуто рецептов: {recipes}'
+            ))
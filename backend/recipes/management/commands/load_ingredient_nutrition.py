@@ -0,0 +1,63 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from foodgram import versions
+from recipes.models import Ingredient
+from recipes.totals import NUTRITION_FIELDS, update_recipe_totals
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает калорийность, БЖУ и цену ингредиентов из CSV с колонками '
+        'name,measurement_unit,calories,proteins,fats,carbohydrates,price '
+        '(значения на единицу измерения) и пересчитывает итоги рецептов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='/app/data/ingredients_nutrition.csv'
+        )
+
+    def handle(self, *args, **options):
+        ingredients = {
+            (ingredient.name, ingredient.measurement_unit): ingredient
+            for ingredient in Ingredient.objects.all().iterator()
+        }
+        changed = []
+        missing = 0
+        try:
+            with open(options['path'], encoding='utf-8') as file:
+                for row in csv.DictReader(file):
+                    ingredient = ingredients.get(
+                        (row['name'], row['measurement_unit'])
+                    )
+                    if ingredient is None:
+                        missing += 1
+                        continue
+                    for field in NUTRITION_FIELDS:
+                        value = (row.get(field) or '').strip()
+                        setattr(
+                            ingredient,
+                            field,
+                            float(value.replace(',', '.')) if value else None
+                        )
+                    changed.append(ingredient)
+        except (OSError, KeyError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать файл: {error}')
+
+        with transaction.atomic():
+            Ingredient.objects.bulk_update(
+                changed, NUTRITION_FIELDS, batch_size=BATCH_SIZE
+            )
+            versions.changed(Ingredient)
+            recipes = update_recipe_totals()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено ингредиентов: {len(changed)}, рецептов: {recipes}, '
+            f'не найдено в базе: {missing}'
+        ))
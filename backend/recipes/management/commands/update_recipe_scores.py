@@ -0,0 +1,113 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Value, When
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from foodgram import versions
+from recipes.models import Favorite, Recipe, ScoreCheckpoint, ShopingList
+
+# Вес события и поле даты для каждого источника.
+EVENT_SOURCES = (
+    (Favorite, 'date_added', 1.0),
+    (ShopingList, 'date_add', 0.5),
+)
+
+# Рейтинг: поле рецепта и период полураспада в часах.
+SCORES = {
+    'trending_score': 72,
+    'popularity_score': 24 * 30,
+}
+
+BATCH_SIZE = 500
+
+
+def decay(hours, half_life):
+    return 0.5 ** (hours / half_life)
+
+
+class Command(BaseCommand):
+    help = (
+        'Инкрементально пересчитывает рейтинги рецептов (тренды и '
+        'популярность) по добавлениям в избранное и список покупок.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Обнулить рейтинги и учесть все события заново.'
+        )
+        parser.add_argument(
+            '--lag',
+            type=int,
+            default=30,
+            help='Не учитывать события последних N секунд.'
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now() - timedelta(seconds=options['lag'])
+        with transaction.atomic():
+            checkpoint = ScoreCheckpoint.objects.select_for_update().filter(
+                name='recipes'
+            ).first()
+            if options['rebuild'] or checkpoint is None:
+                Recipe.objects.update(
+                    **{field: Value(0.0) for field in SCORES}
+                )
+                since = None
+            else:
+                since = checkpoint.computed_at
+                self.decay_scores((now - since).total_seconds() / 3600)
+            updated = self.add_events(since, now)
+            ScoreCheckpoint.objects.update_or_create(
+                name='recipes', defaults={'computed_at': now}
+            )
+            versions.changed(Recipe)
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинги пересчитаны, обновлено рецептов: {updated}'
+        ))
+
+    def decay_scores(self, hours):
+        """Затухание всех рейтингов одним UPDATE."""
+        if hours <= 0:
+            return
+        Recipe.objects.exclude(
+            trending_score=0, popularity_score=0
+        ).update(**{
+            field: F(field) * decay(hours, half_life)
+            for field, half_life in SCORES.items()
+        })
+
+    def add_events(self, since, now):
+        """Прибавляет вклад событий окна (since, now], сгруппированных по часу."""
+        deltas = {}
+        for model, date_field, weight in EVENT_SOURCES:
+            events = model.objects.filter(**{f'{date_field}__lte': now})
+            if since is not None:
+                events = events.filter(**{f'{date_field}__gt': since})
+            buckets = events.annotate(
+                hour=TruncHour(date_field)
+            ).values_list('recipe_id', 'hour').annotate(count=Count('id'))
+            for recipe_id, hour, count in buckets.iterator():
+                age = max((now - hour).total_seconds() / 3600, 0)
+                scores = deltas.setdefault(recipe_id, dict.fromkeys(SCORES, 0))
+                for field, half_life in SCORES.items():
+                    scores[field] += weight * count * decay(age, half_life)
+
+        recipe_ids = list(deltas)
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            batch = recipe_ids[start:start + BATCH_SIZE]
+            Recipe.objects.filter(pk__in=batch).update(**{
+                field: F(field) + Case(
+                    *(
+                        When(pk=pk, then=Value(deltas[pk][field]))
+                        for pk in batch
+                    ),
+                    output_field=FloatField(),
+                )
+                for field in SCORES
+            })
+        return len(recipe_ids)
@@ -0,0 +1,113 @@
+"""Счётчики ссылок на файлы картинок рецептов.
+
+Хранилище (`foodgram.storage.ContentAddressedStorage`) регистрирует
+каждый записанный или повторно использованный файл в `MediaFile`.
+Сигналы рецепта меняют `refs`: создание — +1 новому файлу, замена
+картинки — +1 новому и −1 старому, удаление рецепта — −1. Массовые
+операции (bulk_create) сигналов не шлют и вызывают `retain()` сами.
+
+Счётчик — подсказка для сборщика мусора, а не источник истины: файлы
+с `refs <= 0` старше срока ожидания `manage.py collect_media` ещё раз
+сверяет с рецептами и только потом удаляет, а найденные ссылки
+записывает в `refs`.
+"""
+from collections import Counter, defaultdict
+
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from .models import MediaFile, Recipe
+
+
+def touch(name, size=0):
+    """Отмечает использование файла; создаёт запись, если её нет."""
+    if not MediaFile.objects.filter(name=name).update(
+        updated=timezone.now()
+    ):
+        MediaFile.objects.bulk_create(
+            [MediaFile(name=name, size=size, updated=timezone.now())],
+            ignore_conflicts=True
+        )
+
+
+def adjust(deltas):
+    """Меняет `refs` на {имя: изменение}; пустые имена пропускаются."""
+    by_delta = defaultdict(list)
+    for name, delta in deltas.items():
+        if name and delta:
+            by_delta[delta].append(name)
+    if not by_delta:
+        return
+    now = timezone.now()
+    names = [name for group in by_delta.values() for name in group]
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=name, updated=now) for name in names],
+        ignore_conflicts=True
+    )
+    for delta, group in by_delta.items():
+        MediaFile.objects.filter(name__in=group).update(
+            refs=F('refs') + delta, updated=now
+        )
+
+
+def retain(names):
+    adjust(Counter(names))
+
+
+def discard(names):
+    """Удаляет файлы `names`, записанные в откатившейся транзакции.
+
+    Файл, у которого есть запись в MediaFile, уже используется кем-то
+    ещё (то же содержимое) и остаётся на месте.
+    """
+    names = set(names)
+    if not names:
+        return
+    used = set(MediaFile.objects.filter(
+        name__in=names
+    ).values_list('name', flat=True))
+    for name in names - used:
+        default_storage.delete(name)
+
+
+def image_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Старое имя нужно только при изменении существующего рецепта. Обычно
+    # оно запомнено при загрузке (Recipe.from_db); перечитывается только
+    # у объектов, собранных вручную или загруженных без картинки.
+    instance._stored_image = None
+    if (
+        raw
+        or instance._state.adding
+        or (update_fields is not None and 'image' not in update_fields)
+    ):
+        return
+    stored = getattr(instance, '_loaded_image', None)
+    if stored is None:
+        stored = Recipe.objects.filter(
+            pk=instance.pk
+        ).values_list('image', flat=True).first()
+    instance._stored_image = stored or ''
+
+
+def image_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = '' if created else getattr(instance, '_stored_image', None)
+    new = instance.image.name or ''
+    if old is not None and old != new:
+        adjust({new: 1, old: -1})
+    if old is not None:
+        # Повторное сохранение того же объекта сравнивает уже с `new`.
+        instance._loaded_image = new
+
+
+def image_deleted(sender, instance, **kwargs):
+    adjust({instance.image.name: -1})
+
+
+def connect_signals():
+    pre_save.connect(image_saving, sender=Recipe)
+    post_save.connect(image_saved, sender=Recipe)
+    post_delete.connect(image_deleted, sender=Recipe)
@@ -14,6 +14,31 @@ class Ingredient(models.Model):
         max_length = 200,
         verbose_name = "Единицы измерения",
     )    
+    calories = models.FloatField(
+        verbose_name='Калории на единицу',
+        blank=True,
+        null=True,
+    )
+    proteins = models.FloatField(
+        verbose_name='Белки на единицу',
+        blank=True,
+        null=True,
+    )
+    fats = models.FloatField(
+        verbose_name='Жиры на единицу',
+        blank=True,
+        null=True,
+    )
+    carbohydrates = models.FloatField(
+        verbose_name='Углеводы на единицу',
+        blank=True,
+        null=True,
+    )
+    price = models.FloatField(
+        verbose_name='Цена за единицу',
+        blank=True,
+        null=True,
+    )
 
     class Meta:
         ordering = ['name']
@@ -83,6 +108,13 @@ class Recipe(models.Model):
             1, message='Мин. время приготовления 1 минута'), 
             ]
             )
+    servings = models.PositiveSmallIntegerField(
+        verbose_name='Количество порций',
+        default=1,
+        validators=[MinValueValidator(
+            1, message='Мин. количество порций 1'),
+            ]
+            )
     pub_date = models.DateTimeField(
         verbose_name='Время публикации',
         auto_now_add=True,
@@ -96,16 +128,54 @@ class Recipe(models.Model):
         verbose_name='Тэги',
         related_name='recipes'
         )
+    trending_score = models.FloatField(
+        verbose_name='Рейтинг в трендах',
+        default=0,
+        )
+    popularity_score = models.FloatField(
+        verbose_name='Рейтинг популярности',
+        default=0,
+        )
+    total_calories = models.FloatField(
+        verbose_name='Калорийность',
+        blank=True,
+        null=True,
+        db_index=True,
+        )
+    total_cost = models.FloatField(
+        verbose_name='Стоимость',
+        blank=True,
+        null=True,
+        db_index=True,
+        )
     
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=('-trending_score', '-pub_date'),
+                name='recipe_trending_idx'
+                ),
+            models.Index(
+                fields=('-popularity_score', '-pub_date'),
+                name='recipe_popularity_idx'
+                ),
+        ]
 
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Имя картинки из базы: recipes.media сравнивает с ним новое при
+        # сохранении, не перечитывая строку. None — поле не загружено.
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
+
 
 class RecipeIngredient(models.Model):
     """ Модель связи ингредиента и рецепта. """
@@ -188,6 +258,15 @@ class ShopingList(models.Model):
         related_name='cart',
         verbose_name='Список покупок'
         )
+    servings = models.PositiveSmallIntegerField(
+        verbose_name='Количество порций',
+        help_text='Пусто — столько же, сколько в рецепте',
+        blank=True,
+        null=True,
+        validators=[MinValueValidator(
+            1, message='Мин. количество порций 1'),
+            ]
+        )
     date_add = models.DateTimeField(auto_now_add=True)     
 
     class Meta:
@@ -201,4 +280,131 @@ class ShopingList(models.Model):
         ]
 
     def __str__(self):
-        return f'Пользователь: {self.user} добавил в cписок покупок: {self.recipe}'     
\ No newline at end of file
+        return f'Пользователь: {self.user} добавил в cписок покупок: {self.recipe}'
+
+
+class ScoreCheckpoint(models.Model):
+    """Момент, до которого учтены события в рейтингах рецептов"""
+    name = models.CharField(
+        max_length=50,
+        unique=True,
+        verbose_name='Название рейтинга'
+        )
+    computed_at = models.DateTimeField(
+        verbose_name='Учтены события до'
+        )
+
+    class Meta:
+        verbose_name = 'Пересчёт рейтинга'
+        verbose_name_plural = 'Пересчёты рейтингов'
+
+    def __str__(self):
+        return f'{self.name}: {self.computed_at}'
+
+
+class RecipeSimilarity(models.Model):
+    """Похожий рецепт из заранее посчитанного списка соседей"""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbours',
+        verbose_name='Рецепт'
+        )
+    similar_recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbour_of',
+        verbose_name='Похожий рецепт'
+        )
+    score = models.FloatField(
+        verbose_name='Сходство'
+        )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ('recipe', '-score')
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'similar_recipe'),
+                name='unique_recipe_similarity'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('recipe', '-score'),
+                name='recipe_similarity_score_idx'
+                ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar_recipe}: {self.score:.3f}'
+
+
+class RecipeChange(models.Model):
+    """Запись журнала изменений рецептов для дельта-синхронизации"""
+    CREATED = 1
+    UPDATED = 2
+    DELETED = 3
+    # Граница усечённого журнала: изменения до неё удалены.
+    TRUNCATED = 4
+    ACTIONS = (
+        (CREATED, 'Создан'),
+        (UPDATED, 'Изменён'),
+        (DELETED, 'Удалён'),
+        (TRUNCATED, 'Журнал усечён'),
+    )
+
+    recipe_id = models.BigIntegerField(
+        verbose_name='Рецепт'
+        )
+    action = models.PositiveSmallIntegerField(
+        choices=ACTIONS,
+        verbose_name='Действие'
+        )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Время изменения'
+        )
+
+    class Meta:
+        verbose_name = 'Изменение рецепта'
+        verbose_name_plural = 'Журнал изменений рецептов'
+        ordering = ('id',)
+
+    def __str__(self):
+        return f'{self.id}: {self.get_action_display()} {self.recipe_id}'
+
+
+class MediaFile(models.Model):
+    """Файл хранилища картинок и число рецептов, которые на него ссылаются"""
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Имя файла'
+        )
+    size = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Размер'
+        )
+    refs = models.IntegerField(
+        default=0,
+        verbose_name='Число ссылок'
+        )
+    updated = models.DateTimeField(
+        verbose_name='Последнее изменение'
+        )
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+        indexes = [
+            models.Index(
+                fields=('refs', 'updated'),
+                name='mediafile_orphans_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.refs})'
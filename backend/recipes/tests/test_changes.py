@@ -0,0 +1,70 @@
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from recipes.changes import record
+from recipes.models import Recipe, RecipeChange
+from users.models import MyUser
+
+
+class RecipeChangeBufferTest(TransactionTestCase):
+    """Настоящие коммиты и откаты: TestCase никогда не коммитит."""
+
+    def setUp(self):
+        author = MyUser.objects.create_user(
+            username='author', email='author@example.com', password='x'
+        )
+        self.recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=5
+            )
+            for number in range(3)
+        ]
+        RecipeChange.objects.all().delete()
+
+    def changes(self):
+        return list(RecipeChange.objects.order_by('id').values_list(
+            'recipe_id', 'action'
+        ))
+
+    def test_one_event_per_recipe_after_commit(self):
+        first, second, _ = self.recipes
+        with transaction.atomic():
+            record([first.pk], RecipeChange.CREATED)
+            record([first.pk, second.pk], RecipeChange.UPDATED)
+            record([second.pk], RecipeChange.DELETED)
+            self.assertEqual(self.changes(), [])
+        self.assertEqual(self.changes(), [
+            (first.pk, RecipeChange.CREATED),
+            (second.pk, RecipeChange.DELETED),
+        ])
+
+    def test_rollback_drops_buffer(self):
+        first, second, _ = self.recipes
+        try:
+            with transaction.atomic():
+                record([first.pk], RecipeChange.UPDATED)
+                raise ValueError
+        except ValueError:
+            pass
+        with transaction.atomic():
+            record([second.pk], RecipeChange.UPDATED)
+        self.assertEqual(self.changes(), [(second.pk, RecipeChange.UPDATED)])
+
+    def test_rolled_back_savepoint_starts_new_buffer(self):
+        first, second, third = self.recipes
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record([first.pk], RecipeChange.UPDATED)
+                    raise ValueError
+            except ValueError:
+                pass
+            record([second.pk], RecipeChange.UPDATED)
+        self.assertEqual(self.changes(), [(second.pk, RecipeChange.UPDATED)])
+        with transaction.atomic():
+            record([third.pk], RecipeChange.UPDATED)
+        self.assertEqual(self.changes(), [
+            (second.pk, RecipeChange.UPDATED),
+            (third.pk, RecipeChange.UPDATED),
+        ])
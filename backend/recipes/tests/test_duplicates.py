@@ -0,0 +1,115 @@
+from django.test import TestCase
+
+from recipes.duplicates import merge_ingredients
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from users.models import MyUser
+
+
+class MergeIngredientsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = MyUser.objects.create_user(
+            username='author', email='author@example.com', password='x',
+            is_staff=True, is_superuser=True
+        )
+        cls.grams = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        cls.kilograms = Ingredient.objects.create(
+            name='Мука', measurement_unit='кг', calories=3640, price=80
+        )
+
+    def make_recipe(self, name, *rows):
+        recipe = Recipe.objects.create(
+            author=self.author, name=name, text='Описание', cooking_time=5
+        )
+        for ingredient, amount in rows:
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            )
+        return recipe
+
+    def amounts(self, recipe):
+        return list(recipe.recipe_ingredients.values_list(
+            'ingredient_id', 'amount'
+        ))
+
+
+class MergeIngredientsTest(MergeIngredientsTestCase):
+
+    def test_amounts_scaled_to_target_unit(self):
+        recipe = self.make_recipe('Хлеб', (self.kilograms, 2))
+        self.assertEqual(merge_ingredients(self.grams, [self.kilograms]), 1)
+        self.assertEqual(self.amounts(recipe), [(self.grams.pk, 2000)])
+        self.assertFalse(
+            Ingredient.objects.filter(pk=self.kilograms.pk).exists()
+        )
+
+    def test_rows_of_one_recipe_are_summed(self):
+        recipe = self.make_recipe(
+            'Пирог', (self.grams, 100), (self.kilograms, 1)
+        )
+        other = self.make_recipe('Блины', (self.grams, 300))
+        self.assertEqual(merge_ingredients(self.grams, [self.kilograms]), 2)
+        self.assertEqual(self.amounts(recipe), [(self.grams.pk, 1100)])
+        self.assertEqual(self.amounts(other), [(self.grams.pk, 300)])
+
+    def test_missing_nutrition_filled_per_target_unit(self):
+        self.grams.price = 0.1
+        self.grams.save()
+        merge_ingredients(self.grams, [self.kilograms])
+        self.grams.refresh_from_db()
+        self.assertAlmostEqual(self.grams.calories, 3.64)
+        # Заполненные значения главного не меняются.
+        self.assertEqual(self.grams.price, 0.1)
+        self.assertIsNone(self.grams.fats)
+
+    def test_unconvertible_units_rejected(self):
+        pieces = Ingredient.objects.create(
+            name='мука', measurement_unit='шт'
+        )
+        recipe = self.make_recipe('Хлеб', (pieces, 1))
+        with self.assertRaises(ValueError):
+            merge_ingredients(self.grams, [pieces])
+        # Из кг в г можно, из г в кг — нет: количества целые.
+        with self.assertRaises(ValueError):
+            merge_ingredients(self.kilograms, [self.grams])
+        self.assertEqual(self.amounts(recipe), [(pieces.pk, 1)])
+
+
+class MergeSelectedActionTest(MergeIngredientsTestCase):
+
+    def setUp(self):
+        self.client.force_login(self.author)
+        self.recipe = self.make_recipe('Хлеб', (self.kilograms, 2))
+
+    def post(self, ingredients, **extra):
+        return self.client.post('/admin/recipes/ingredient/', {
+            'action': 'merge_selected',
+            '_selected_action': [ingredient.pk for ingredient in ingredients],
+            **extra,
+        })
+
+    def test_confirmation_before_merge(self):
+        response = self.post([self.grams, self.kilograms])
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(
+            response, 'admin/recipes/ingredient/merge_confirmation.html'
+        )
+        self.assertContains(response, 'Хлеб')
+        self.assertNotContains(response, 'не похожи')
+        self.assertTrue(
+            Ingredient.objects.filter(pk=self.kilograms.pk).exists()
+        )
+        response = self.post([self.grams, self.kilograms], post='yes')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.amounts(self.recipe), [(self.grams.pk, 2000)])
+
+    def test_unrelated_names_are_flagged(self):
+        sugar = Ingredient.objects.create(
+            name='сахар', measurement_unit='г'
+        )
+        response = self.post([self.grams, sugar])
+        self.assertContains(response, 'не похожи')
+        self.assertTrue(Ingredient.objects.filter(pk=sugar.pk).exists())
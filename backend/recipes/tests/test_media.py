@@ -0,0 +1,108 @@
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from recipes.management.commands.collect_media import Command
+from recipes.media import touch
+from recipes.models import MediaFile, Recipe
+from users.models import MyUser
+
+
+class MediaTestCase(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def store(self, content):
+        return default_storage.save('recipes/image.png', ContentFile(content))
+
+    def age(self, name, hours=48):
+        MediaFile.objects.filter(name=name).update(
+            updated=timezone.now() - timedelta(hours=hours)
+        )
+
+
+class ImageRefsTest(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        author = MyUser.objects.create_user(
+            username='author', email='author@example.com', password='x'
+        )
+        self.old = self.store(b'old')
+        Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание', cooking_time=5,
+            image=self.old
+        )
+
+    def refs(self, name):
+        return MediaFile.objects.get(name=name).refs
+
+    def test_save_does_not_reread_image(self):
+        recipe = Recipe.objects.get()
+        recipe.name = 'Другое'
+        with CaptureQueriesContext(connection) as queries:
+            recipe.save()
+        self.assertFalse([
+            query for query in queries
+            if query['sql'].startswith('SELECT')
+            and 'FROM "recipes_recipe"' in query['sql']
+        ])
+        self.assertEqual(self.refs(self.old), 1)
+
+    def test_image_change_counted_once(self):
+        new = self.store(b'new')
+        recipe = Recipe.objects.get()
+        recipe.image = new
+        recipe.save()
+        recipe.save()
+        self.assertEqual(self.refs(self.old), 0)
+        self.assertEqual(self.refs(new), 1)
+
+    def test_deferred_image_is_read_from_database(self):
+        new = self.store(b'new')
+        recipe = Recipe.objects.only('id').get()
+        recipe.image = new
+        recipe.save()
+        self.assertEqual(self.refs(self.old), 0)
+        self.assertEqual(self.refs(new), 1)
+
+
+class CollectMediaTest(MediaTestCase):
+
+    def collect(self, name):
+        command = Command()
+        command.storage = default_storage
+        command.options = {'dry_run': False}
+        row = MediaFile.objects.get(name=name)
+        cutoff = timezone.now() - timedelta(hours=24)
+        return command.collect([(row.id, name, row.size)], cutoff)
+
+    def test_removes_orphans(self):
+        name = self.store(b'orphan')
+        self.age(name)
+        call_command('collect_media', stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+
+    def test_keeps_file_used_after_listing(self):
+        name = self.store(b'orphan')
+        self.age(name)
+        # Файл снова понадобился между выборкой кандидатов и удалением.
+        touch(name)
+        self.assertEqual(self.collect(name), set())
+        self.assertTrue(default_storage.exists(name))
+        self.assertTrue(MediaFile.objects.filter(name=name).exists())
@@ -0,0 +1,86 @@
+import io
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from recipes.management.commands.build_recipe_similarity import CHECKPOINT
+from recipes.models import (Ingredient, Recipe, RecipeChange,
+                            RecipeIngredient, RecipeSimilarity,
+                            ScoreCheckpoint)
+from users.models import MyUser
+
+
+class BuildRecipeSimilarityTest(TransactionTestCase):
+    """Журнал изменений пишется после коммита, поэтому без TestCase."""
+
+    def setUp(self):
+        author = MyUser.objects.create_user(
+            username='author', email='author@example.com', password='x'
+        )
+        self.flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        self.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        self.recipes = []
+        for name, ingredient in (
+            ('Хлеб', self.flour), ('Блины', self.flour), ('Рассол', self.salt)
+        ):
+            recipe = Recipe.objects.create(
+                author=author, name=name, text='Описание', cooking_time=5
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=100
+            )
+            self.recipes.append(recipe)
+
+    def build(self, *args):
+        call_command('build_recipe_similarity', *args, stdout=io.StringIO())
+
+    def checkpoint(self):
+        return ScoreCheckpoint.objects.get(name=CHECKPOINT).computed_at
+
+    def neighbours(self, recipe):
+        return set(RecipeSimilarity.objects.filter(
+            recipe=recipe
+        ).values_list('similar_recipe_id', flat=True))
+
+    def test_partial_run_keeps_checkpoint(self):
+        self.build()
+        computed_at = self.checkpoint()
+        self.build('--recipes', str(self.recipes[0].pk))
+        self.assertEqual(self.checkpoint(), computed_at)
+        self.build('--changed')
+        self.assertGreater(self.checkpoint(), computed_at)
+
+    def test_edited_ingredients_are_changed(self):
+        bread, pancakes, brine = self.recipes
+        self.build()
+        self.assertEqual(self.neighbours(brine), set())
+        RecipeIngredient.objects.create(
+            recipe=brine, ingredient=self.flour, amount=10
+        )
+        self.build('--changed')
+        self.assertEqual(self.neighbours(brine), {bread.pk, pancakes.pk})
+        # Рецепты, в соседях которых изменённый, тоже пересчитаны.
+        RecipeIngredient.objects.filter(
+            recipe=brine, ingredient=self.flour
+        ).delete()
+        self.build('--changed')
+        self.assertEqual(self.neighbours(brine), set())
+        self.assertEqual(self.neighbours(bread), {pancakes.pk})
+
+    def test_truncated_log_forces_full_run(self):
+        bread, pancakes, _ = self.recipes
+        self.build()
+        RecipeSimilarity.objects.all().delete()
+        RecipeChange.objects.create(
+            recipe_id=bread.pk, action=RecipeChange.TRUNCATED
+        )
+        ScoreCheckpoint.objects.filter(name=CHECKPOINT).update(
+            computed_at=self.checkpoint() - timedelta(minutes=1)
+        )
+        self.build('--changed')
+        self.assertEqual(self.neighbours(pancakes), {bread.pk})
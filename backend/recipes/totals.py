@@ -0,0 +1,134 @@
+"""Калорийность и стоимость рецептов и списков покупок.
+
+Итоги рецепта хранятся в `Recipe.total_calories` и `Recipe.total_cost`
+и пересчитываются одним UPDATE при изменении его ингредиентов. Если
+хотя бы у одного ингредиента нет данных, итог остаётся пустым.
+
+Список покупок учитывает порции: количество ингредиента умножается на
+`ShopingList.servings / Recipe.servings` прямо в агрегирующем запросе,
+так что итогов, зависящих от корзины, в базе не хранится.
+"""
+from django.db.models import (Case, Count, F, FloatField, OuterRef, Q,
+                              Subquery, Sum, Value, When)
+from django.db.models.functions import Cast, Ceil, Coalesce, Round
+
+from foodgram import versions
+
+from .models import Recipe, RecipeIngredient
+
+NUTRITION_FIELDS = ('calories', 'proteins', 'fats', 'carbohydrates', 'price')
+
+RECIPE_TOTALS = {
+    'total_calories': 'calories',
+    'total_cost': 'price',
+}
+
+# Штучные единицы округляются вверх до целого, граммы и миллилитры тоже
+# до целого, ложки и стаканы — до половины, остальное — до сотых.
+PIECE_UNITS = (
+    'шт.', 'банка', 'батон', 'бутылка', 'веточка', 'горсть', 'долька',
+    'звездочка', 'зубчик', 'капля', 'кусок', 'лист', 'пакет', 'пакетик',
+    'пачка', 'пласт', 'пучок', 'стебель', 'стручок', 'тушка', 'упаковка',
+    'щепотка',
+)
+WHOLE_UNITS = ('г', 'мл')
+HALF_UNITS = ('ст. л.', 'ч. л.', 'стакан')
+EPSILON = 1e-6
+
+
+def recipe_total(field):
+    """Подзапрос: сумма `amount * ingredient.<field>` по рецепту."""
+    return Subquery(
+        RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            missing=Count('pk', filter=Q(**{f'ingredient__{field}': None})),
+            total=Sum(
+                F('amount') * F(f'ingredient__{field}'),
+                output_field=FloatField()
+            ),
+        ).filter(missing=0).values('total'),
+        output_field=FloatField()
+    )
+
+
+def update_recipe_totals(recipe_ids=None):
+    """Пересчитывает итоги рецептов; без аргумента — всех рецептов."""
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    versions.changed(Recipe)
+    return recipes.update(**{
+        total: recipe_total(field) for total, field in RECIPE_TOTALS.items()
+    })
+
+
+def update_ingredient_recipes_totals(ingredient_ids):
+    """Пересчитывает итоги рецептов, в которых есть эти ингредиенты."""
+    return update_recipe_totals(
+        RecipeIngredient.objects.filter(
+            ingredient__in=ingredient_ids
+        ).values('recipe_id')
+    )
+
+
+def scaled_amount():
+    """Количество ингредиента с учётом порций в списке покупок.
+
+    Используется в запросах по `RecipeIngredient`, отфильтрованных по
+    `recipe__cart__user`.
+    """
+    servings = Cast('recipe__servings', FloatField())
+    return Cast('amount', FloatField()) * Coalesce(
+        Cast('recipe__cart__servings', FloatField()), servings
+    ) / servings
+
+
+def round_amount(total):
+    """Округление суммы по единице измерения ингредиента.
+
+    Перед округлением вверх вычитается `EPSILON`, чтобы погрешность
+    деления (0.1 + 0.2) не превращала 3 шт. в 4.
+    """
+    total = total - Value(EPSILON)
+    return Case(
+        When(
+            ingredient__measurement_unit__in=PIECE_UNITS + WHOLE_UNITS,
+            then=Ceil(total)
+        ),
+        When(
+            ingredient__measurement_unit__in=HALF_UNITS,
+            then=Ceil(total * Value(2.0)) / Value(2.0)
+        ),
+        default=Round(total, 2),
+        output_field=FloatField()
+    )
+
+
+def shopping_list(user):
+    """Ингредиенты списка покупок пользователя одним запросом."""
+    return RecipeIngredient.objects.filter(
+        recipe__cart__user=user
+    ).values(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        total=Sum(scaled_amount(), output_field=FloatField())
+    ).annotate(
+        amount=round_amount(F('total'))
+    ).order_by('ingredient__name')
+
+
+def shopping_list_totals(user):
+    """Суммарные калории, БЖУ и стоимость списка покупок пользователя.
+
+    Ингредиенты без данных в сумму не входят.
+    """
+    return RecipeIngredient.objects.filter(
+        recipe__cart__user=user
+    ).aggregate(**{
+        field: Sum(
+            scaled_amount() * F(f'ingredient__{field}'),
+            output_field=FloatField()
+        )
+        for field in NUTRITION_FIELDS
+    })
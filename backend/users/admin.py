@@ -1,9 +1,10 @@
 from django.contrib import admin
 
+from foodgram.admin_utils import BigTableAdmin
 from .models import MyUser
 
 @admin.register(MyUser)
-class MyUserAdmin(admin.ModelAdmin):
+class MyUserAdmin(BigTableAdmin):
     list_display = (
         'username',
         'email',
@@ -12,9 +13,7 @@ class MyUserAdmin(admin.ModelAdmin):
         'is_subscribed'
         )       
     list_filter = (
-        'email', 
-        'first_name',
-        'is_subscribed'
+        'is_subscribed',
         )
     search_fields = (
          'username',